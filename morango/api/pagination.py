@@ -0,0 +1,58 @@
+from collections import OrderedDict
+
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+
+class BufferPagination(pagination.LimitOffsetPagination):
+    """
+    Limit/offset pagination that additionally supports paging by a primary key cursor. When the
+    `cursor` query param is given, only records with a greater primary key are returned, which
+    avoids the database scanning past all previously transferred records on each request. Every
+    response includes the `cursor` from which the next page should be requested. An `offset` given
+    along with the `cursor` is relative to it, so that several pages can be requested at once.
+    """
+
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor is None:
+            return None
+        try:
+            return pagination._positive_int(cursor)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor = self.get_cursor(request)
+
+        if self.cursor is None:
+            page = super(BufferPagination, self).paginate_queryset(
+                queryset, request, view=view
+            )
+        else:
+            self.request = request
+            self.limit = self.get_limit(request)
+            self.offset = self.get_offset(request)
+            page = queryset.filter(pk__gt=self.cursor)
+            if self.limit is not None:
+                page = page[self.offset : self.offset + self.limit]
+            else:
+                page = page[self.offset :]
+            page = list(page)
+
+        if page:
+            self.cursor = page[-1].pk
+        return page
+
+    def get_paginated_response(self, data):
+        if self.request.query_params.get(self.cursor_query_param) is None:
+            response = super(BufferPagination, self).get_paginated_response(data)
+            response.data[self.cursor_query_param] = self.cursor
+            return response
+        return Response(
+            OrderedDict([(self.cursor_query_param, self.cursor), ("results", data)])
+        )
@@ -1,22 +1,55 @@
-import io
 import json
 
 from rest_framework.parsers import BaseParser
 
+from morango.sync import columnar
+from morango.sync.compression import decompress_iter
+from morango.sync.compression import GZIP
+from morango.sync.compression import MEDIA_TYPES
+from morango.sync.compression import read_blocks
+from morango.sync.compression import ZSTD
+
 
 class GzipParser(BaseParser):
     """
     Parses Gzipped data.
     """
 
-    media_type = "application/gzip"
+    media_type = MEDIA_TYPES[GZIP]
+    encoding = GZIP
 
     def parse(self, stream, media_type=None, parser_context=None):
         """
         Parses the incoming bytestream by decompressing the gzipped data and returns the resulting data as a dictionary.
         """
-        import gzip
-
-        with gzip.GzipFile(fileobj=io.BytesIO(stream.read())) as f:
-            data = f.read()
+        data = b"".join(decompress_iter(read_blocks(stream), self.encoding))
         return json.loads(data.decode("utf-8"))
+
+
+class ZstdParser(GzipParser):
+    """
+    Parses Zstandard compressed data.
+    """
+
+    media_type = MEDIA_TYPES[ZSTD]
+    encoding = ZSTD
+
+
+class ColumnarParser(BaseParser):
+    """
+    Parses buffers packed in the columnar format, optionally compressed according to the
+    `Content-Encoding` header.
+    """
+
+    media_type = columnar.MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """
+        Parses the incoming bytestream by decompressing it if needed, and unpacking the buffers.
+        """
+        blocks = read_blocks(stream)
+        request = (parser_context or {}).get("request")
+        encoding = request.META.get("HTTP_CONTENT_ENCODING") if request else None
+        if encoding:
+            blocks = decompress_iter(blocks, encoding)
+        return columnar.unpack(b"".join(blocks))
@@ -0,0 +1,19 @@
+from rest_framework.renderers import BaseRenderer
+
+from morango.sync import columnar
+
+
+class ColumnarRenderer(BaseRenderer):
+    """
+    Renders buffers packed in the columnar format.
+    """
+
+    media_type = columnar.MEDIA_TYPE
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return columnar.pack(data)
@@ -4,23 +4,29 @@ import platform
 import uuid
 
 from django.core.exceptions import ValidationError
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from ipware import get_client_ip
 from rest_framework import mixins
-from rest_framework import pagination
 from rest_framework import response
 from rest_framework import status
 from rest_framework import viewsets
 from rest_framework.parsers import JSONParser
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
 
 import morango
 from morango import errors
 from morango.api import permissions
 from morango.api import serializers
+from morango.api.pagination import BufferPagination
 from morango.constants import transfer_stages
 from morango.constants import transfer_statuses
 from morango.constants.capabilities import ASYNC_OPERATIONS
+from morango.constants.capabilities import COLUMNAR_BUFFER_FORMAT
+from morango.constants.capabilities import COMPRESSED_BUFFER_PULL
 from morango.constants.capabilities import GZIP_BUFFER_POST
+from morango.constants.capabilities import ZSTD_BUFFER_COMPRESSION
 from morango.models import certificates
 from morango.models.core import Buffer
 from morango.models.core import Certificate
@@ -28,19 +34,36 @@ from morango.models.core import InstanceIDModel
 from morango.models.core import SyncSession
 from morango.models.core import TransferSession
 from morango.models.fields.crypto import SharedKey
+from morango.sync.compression import compress_iter
+from morango.sync.compression import get_encodings
 from morango.sync.context import LocalSessionContext
 from morango.sync.controller import SessionController
 from morango.utils import _assert
 from morango.utils import CAPABILITIES
 from morango.utils import parse_capabilities_from_server_request
+from morango.utils import SETTINGS
 
 
+parsers = (JSONParser,)
+
 if GZIP_BUFFER_POST in CAPABILITIES:
     from .parsers import GzipParser
 
-    parsers = (GzipParser, JSONParser)
-else:
-    parsers = (JSONParser,)
+    parsers = (GzipParser,) + parsers
+
+if ZSTD_BUFFER_COMPRESSION in CAPABILITIES:
+    from .parsers import ZstdParser
+
+    parsers = (ZstdParser,) + parsers
+
+buffer_renderers = tuple(api_settings.DEFAULT_RENDERER_CLASSES)
+
+if COLUMNAR_BUFFER_FORMAT in CAPABILITIES:
+    from .parsers import ColumnarParser
+    from .renderers import ColumnarRenderer
+
+    parsers = (ColumnarParser,) + parsers
+    buffer_renderers += (ColumnarRenderer,)
 
 
 def controller_signal_logger(context=None):
@@ -477,8 +500,9 @@ class TransferSessionViewSet(
 class BufferViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
     permission_classes = (permissions.BufferPermissions,)
     serializer_class = serializers.BufferSerializer
-    pagination_class = pagination.LimitOffsetPagination
+    pagination_class = BufferPagination
     parser_classes = parsers
+    renderer_classes = buffer_renderers
 
     def create(self, request):
         data = request.data if isinstance(request.data, list) else [request.data]
@@ -512,9 +536,56 @@ class BufferViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
 
         return response.Response(status=response_status)
 
+    def list(self, request, *args, **kwargs):
+        result = super(BufferViewSet, self).list(request, *args, **kwargs)
+        encoding = self.get_response_encoding()
+        if encoding is None or result.status_code != status.HTTP_200_OK:
+            return result
+
+        if COLUMNAR_BUFFER_FORMAT in CAPABILITIES and isinstance(
+            request.accepted_renderer, ColumnarRenderer
+        ):
+            pieces = [request.accepted_renderer.render(result.data)]
+            content_type = ColumnarRenderer.media_type
+        else:
+            # stream the JSON through the compressor, rather than rendering it whole
+            pieces = JSONEncoder(separators=(",", ":"), ensure_ascii=False).iterencode(
+                result.data
+            )
+            content_type = "application/json"
+
+        content = compress_iter(pieces, encoding, SETTINGS.MORANGO_COMPRESSION_LEVEL)
+        compressed_response = StreamingHttpResponse(
+            content, status=result.status_code, content_type=content_type
+        )
+        compressed_response["Content-Encoding"] = encoding
+        compressed_response["Vary"] = "Accept-Encoding"
+        return compressed_response
+
+    def get_response_encoding(self):
+        """
+        :return: The encoding with which to compress pulled buffers, preferred by the server and
+            accepted by the client, or None
+        """
+        client_capabilities = parse_capabilities_from_server_request(self.request)
+        if COMPRESSED_BUFFER_PULL not in client_capabilities:
+            return None
+        accepted = [
+            encoding.split(";")[0].strip()
+            for encoding in self.request.META.get("HTTP_ACCEPT_ENCODING", "").split(",")
+        ]
+        for encoding in get_encodings():
+            if encoding in accepted:
+                return encoding
+        return None
+
     def get_queryset(self):
         session_id = self.request.query_params["transfer_session_id"]
-        return Buffer.objects.filter(transfer_session_id=session_id).order_by("pk")
+        return (
+            Buffer.objects.filter(transfer_session_id=session_id)
+            .order_by("pk")
+            .prefetch_rmcb_list()
+        )
 
 
 class MorangoInfoViewSet(viewsets.ViewSet):
@@ -2,3 +2,8 @@ GZIP_BUFFER_POST = "GZIP_BUFFER_POST"
 ALLOW_CERTIFICATE_PUSHING = "ALLOW_CERTIFICATE_PUSHING"
 ASYNC_OPERATIONS = "ASYNC_OPERATIONS"
 FSIC_V2_FORMAT = "FSIC_V2_FORMAT"
+BUFFER_KEYSET_PAGINATION = "BUFFER_KEYSET_PAGINATION"
+BUFFER_PIPELINING = "BUFFER_PIPELINING"
+COMPRESSED_BUFFER_PULL = "COMPRESSED_BUFFER_PULL"
+ZSTD_BUFFER_COMPRESSION = "ZSTD_BUFFER_COMPRESSION"
+COLUMNAR_BUFFER_FORMAT = "COLUMNAR_BUFFER_FORMAT"
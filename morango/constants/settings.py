@@ -1,9 +1,21 @@
 ALLOW_CERTIFICATE_PUSHING = False
 MORANGO_SERIALIZE_BEFORE_QUEUING = True
 MORANGO_DESERIALIZE_AFTER_DEQUEUING = True
+MORANGO_SERIALIZATION_CHUNK_SIZE = 500
+MORANGO_SERIALIZATION_WORKERS = 0
+MORANGO_SERIALIZATION_EXECUTOR = "thread"
+MORANGO_JSON_CODEC = None
+MORANGO_DESERIALIZATION_CHUNK_SIZE = 500
+MORANGO_DEQUEUE_ENGINE = "stepwise"
+MORANGO_COMPRESSION_LEVEL = 6
 MORANGO_DISALLOW_ASYNC_OPERATIONS = False
 MORANGO_DISABLE_FSIC_V2_FORMAT = False
 MORANGO_DISABLE_FSIC_REDUCTION = False
+MORANGO_DISABLE_FSIC_CACHE = False
+MORANGO_FSIC_CACHE_SIZE = 100
+MORANGO_FK_CACHE_SIZE = 0
+MORANGO_FK_CACHE_TIMEOUT = 300
+MORANGO_FK_CACHE_ALIAS = None
 MORANGO_INSTANCE_INFO = {}
 MORANGO_INITIALIZE_OPERATIONS = (
     "morango.sync.operations:InitializeOperation",
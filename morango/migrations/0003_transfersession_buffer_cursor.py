@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-16 20:57
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("morango", "0002_store_idx_morango_deserialize"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transfersession",
+            name="buffer_cursor",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
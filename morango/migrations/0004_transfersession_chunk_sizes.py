@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-16 22:27
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("morango", "0003_transfersession_buffer_cursor"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transfersession",
+            name="chunk_sizes",
+            field=models.TextField(blank=True, default="[]"),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-16 23:40
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("morango", "0004_transfersession_chunk_sizes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transfersession",
+            name="stage_stats",
+            field=models.TextField(blank=True, default="{}"),
+        ),
+    ]
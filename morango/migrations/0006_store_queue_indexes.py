@@ -0,0 +1,61 @@
+from django.db import migrations
+from django.db import models
+
+
+class ConditionalConcurrentAddIndex(migrations.AddIndex):
+    """
+    Adds the index concurrently on PostgreSQL, so that writes to large tables aren't blocked while
+    it's built, unless the migration is run inside a transaction, where that isn't allowed
+    """
+
+    @staticmethod
+    def _concurrently(schema_editor):
+        connection = schema_editor.connection
+        return "postgresql" in connection.vendor and not connection.in_atomic_block
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self._concurrently(schema_editor):
+            if self.allow_migrate_model(schema_editor.connection.alias, model):
+                schema_editor.add_index(model, self.index, concurrently=True)
+        else:
+            super(ConditionalConcurrentAddIndex, self).database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self._concurrently(schema_editor):
+            if self.allow_migrate_model(schema_editor.connection.alias, model):
+                schema_editor.remove_index(model, self.index, concurrently=True)
+        else:
+            super(ConditionalConcurrentAddIndex, self).database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+
+
+class Migration(migrations.Migration):
+    # In order to generate an index concurrently, we cannot run it inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("morango", "0005_transfersession_stage_stats"),
+    ]
+
+    operations = [
+        ConditionalConcurrentAddIndex(
+            model_name="store",
+            index=models.Index(
+                fields=["profile", "last_saved_instance", "last_saved_counter"],
+                name="idx_morango_queue_profile",
+            ),
+        ),
+        ConditionalConcurrentAddIndex(
+            model_name="store",
+            index=models.Index(
+                fields=["partition", "last_saved_instance", "last_saved_counter"],
+                name="idx_morango_queue_partition",
+                opclasses=["text_pattern_ops", "", ""],
+            ),
+        ),
+    ]
@@ -1,3 +1,4 @@
+import copy
 import functools
 import json
 import logging
@@ -11,11 +12,13 @@ from django.db import connection
 from django.db import models
 from django.db import router
 from django.db import transaction
+from django.db.models import Count
 from django.db.models import F
 from django.db.models import Func
 from django.db.models import Max
 from django.db.models import Q
 from django.db.models import signals
+from django.db.models import Sum
 from django.db.models import TextField
 from django.db.models import Value
 from django.db.models.deletion import Collector
@@ -34,12 +37,14 @@ from morango.models.certificates import Filter
 from morango.models.fields.uuids import sha2_uuid
 from morango.models.fields.uuids import UUIDField
 from morango.models.fields.uuids import UUIDModelMixin
+from morango.models.fk_cache import get_foreign_key_cache_key
 from morango.models.fsic_utils import remove_redundant_instance_counters
 from morango.models.manager import SyncableModelManager
 from morango.models.utils import get_0_4_system_parameters
 from morango.models.utils import get_0_5_mac_address
 from morango.models.utils import get_0_5_system_id
 from morango.registry import syncable_models
+from morango.serialization import get_codec
 from morango.utils import _assert
 from morango.utils import SETTINGS
 
@@ -134,10 +139,12 @@ class InstanceIDModel(models.Model):
         return SETTINGS.MORANGO_INSTANCE_INFO
 
     @classmethod
-    @transaction.atomic
     def get_or_create_current_instance(cls, clear_cache=False):
         """Get the instance model corresponding to the current system, or create a new
-        one if the system is new or its properties have changed (e.g. new MAC address)."""
+        one if the system is new or its properties have changed (e.g. new MAC address).
+
+        The instance is cached, and refreshed on every call with a single query, outside of any
+        transaction."""
         if clear_cache:
             cls._cached_instance = None
 
@@ -148,7 +155,7 @@ class InstanceIDModel(models.Model):
                 instance.refresh_from_db(fields=["counter", "current"])
                 # only use cached instance if it's still marked as current, otherwise skip
                 if instance.current:
-                    return cls._cached_instance, False
+                    return instance, False
             except InstanceIDModel.DoesNotExist:
                 # instance does not exist, so skip here so we create a new one
                 pass
@@ -187,11 +194,23 @@ class InstanceIDModel(models.Model):
             return instance, created
 
     @classmethod
-    @transaction.atomic
     def get_current_instance_and_increment_counter(cls):
-        instance, _ = cls.get_or_create_current_instance()
-        cls.objects.filter(id=instance.id).update(counter=F("counter") + 1)
-        instance.refresh_from_db(fields=["counter"])
+        from morango.sync.backends.utils import load_backend
+
+        backend = load_backend(connection)
+        # the increment only applies to the current instance, which checks the cached one still is
+        instance = cls._cached_instance
+        if instance is None:
+            instance, _ = cls.get_or_create_current_instance()
+        # write and retrieve the counter in one go for consistency
+        with connection.cursor() as cursor:
+            counter = backend._increment_instance_counter(cursor, instance.id)
+            if counter is None:
+                # the cached instance no longer exists or is no longer current, so get or create
+                # the current one again
+                instance, _ = cls.get_or_create_current_instance(clear_cache=True)
+                counter = backend._increment_instance_counter(cursor, instance.id)
+        instance.counter = counter
         return instance
 
     def get_proquint(self):
@@ -277,8 +296,15 @@ class TransferSession(models.Model):
     records_total = models.IntegerField(
         blank=True, null=True
     )  # total number of records to be synced across in this transfer
+    buffer_cursor = models.BigIntegerField(
+        blank=True, null=True
+    )  # pk of the last buffer record transferred, for keyset pagination of buffers
     bytes_sent = models.BigIntegerField(default=0, null=True, blank=True)
     bytes_received = models.BigIntegerField(default=0, null=True, blank=True)
+    # JSON list of [records_transferred, chunk_size] pairs, for each change of the chunk size
+    chunk_sizes = models.TextField(blank=True, default="[]")
+    # JSON dict of the time, queries and bytes spent on each transfer stage, and its operations
+    stage_stats = models.TextField(blank=True, default="{}")
 
     sync_session = models.ForeignKey(SyncSession, on_delete=models.CASCADE)
 
@@ -309,9 +335,102 @@ class TransferSession(models.Model):
         """Getter for `not push` condition, which adds complexity in conditional statements"""
         return not self.push
 
+    def save(self, *args, **kwargs):
+        # the stage stats are only written by `save_stage_stats`, with the row locked, so saving
+        # the whole transfer session doesn't overwrite stats saved concurrently by other requests
+        if not self._state.adding and kwargs.get("update_fields") is None and not args:
+            kwargs["update_fields"] = [
+                f.name
+                for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != "stage_stats"
+            ]
+        super(TransferSession, self).save(*args, **kwargs)
+
     def get_filter(self):
         return Filter(self.filter)
 
+    def get_chunk_sizes(self):
+        """
+        :return: A list of [records_transferred, chunk_size] pairs, from when each chunk size was
+            first used to transfer records
+        """
+        return json.loads(self.chunk_sizes or "[]")
+
+    def record_chunk_size(self, chunk_size):
+        """
+        Records the chunk size used from the current progress, if it has changed
+
+        :param chunk_size: The number of records per chunk
+        """
+        chunk_sizes = self.get_chunk_sizes()
+        if chunk_sizes and chunk_sizes[-1][1] == chunk_size:
+            return
+        chunk_sizes.append([self.records_transferred, chunk_size])
+        self.chunk_sizes = json.dumps(chunk_sizes)
+        self.save(update_fields=["chunk_sizes"])
+
+    def get_stage_stats(self):
+        """
+        :return: A dict of the stats summed across invocations of each transfer stage, with the
+            stats of the operations that handled them under `operations`
+        """
+        return json.loads(self.stage_stats or "{}")
+
+    def record_stage_stats(self, stats):
+        """
+        Adds the stats of an invocation of a transfer stage to those pending on the transfer
+        session, which are only written by `save_stage_stats`
+
+        :param stats: The stats of the invocation
+        :type stats: morango.sync.stats.StageStats
+        """
+        self.__dict__.setdefault("_pending_stage_stats", []).append(stats)
+
+    @transaction.atomic
+    def save_stage_stats(self):
+        """
+        Adds the pending stats and counts of transfer stages to those of the transfer session, in
+        one write. The saved stats are read with the row locked, so stats saved concurrently by
+        other requests for the transfer session aren't overwritten
+        """
+        pending = self.__dict__.pop("_pending_stage_stats", [])
+        pending_counts = self.__dict__.pop("_pending_stage_counts", {})
+        if not pending and not pending_counts:
+            return
+
+        saved = (
+            TransferSession.objects.select_for_update()
+            .filter(pk=self.pk)
+            .values_list("stage_stats", flat=True)
+            .first()
+        )
+        if saved is None:
+            return
+        stage_stats = json.loads(saved or "{}")
+        for stats in pending:
+            aggregate = stats.merge_into(stage_stats.setdefault(stats.stage, {}))
+            if stats.operation:
+                operations = aggregate.setdefault("operations", {})
+                stats.merge_into(operations.setdefault(stats.operation, {}))
+        for stage, counts in pending_counts.items():
+            aggregate = stage_stats.setdefault(stage, {})
+            for name, count in counts.items():
+                aggregate[name] = aggregate.get(name, 0) + count
+        self.stage_stats = json.dumps(stage_stats)
+        self.save(update_fields=["stage_stats"])
+
+    def add_stage_counts(self, stage, counts):
+        """
+        Adds counts of the records handled by a transfer stage to those pending on the transfer
+        session, which are written along with its stats by `save_stage_stats`
+
+        :param stage: The transfer_stages.* the records were handled in
+        :param counts: A dict of counts by name, summed with any already recorded
+        """
+        pending = self.__dict__.setdefault("_pending_stage_counts", {}).setdefault(stage, {})
+        for name, count in counts.items():
+            pending[name] = pending.get(name, 0) + count
+
     def update_state(self, stage=None, stage_status=None):
         """
         :type stage: morango.constants.transfer_stages.*|None
@@ -331,9 +450,17 @@ class TransferSession(models.Model):
             self.transfer_stage_status = stage_status
         if stage is not None or stage_status is not None:
             self.last_activity_timestamp = timezone.now()
-            self.save()
+            # only save the state, so counts incremented concurrently by the database aren't
+            # overwritten with the values this transfer session was last refreshed with
+            self.save(
+                update_fields=[
+                    "transfer_stage",
+                    "transfer_stage_status",
+                    "last_activity_timestamp",
+                ]
+            )
             self.sync_session.last_activity_timestamp = timezone.now()
-            self.sync_session.save()
+            self.sync_session.save(update_fields=["last_activity_timestamp"])
 
     def delete_buffers(self):
         """
@@ -451,8 +578,19 @@ class Store(AbstractStore):
         indexes = [
             models.Index(fields=["partition"], name="idx_morango_store_partition"),
             models.Index(fields=["profile", "model_name", "partition", "dirty_bit"], condition=models.Q(dirty_bit=True), name="idx_morango_deserialize"),
+            # indexes for queuing records newer than the FSIC counters, for all partitions or by prefix
+            models.Index(fields=["profile", "last_saved_instance", "last_saved_counter"], name="idx_morango_queue_profile"),
+            models.Index(
+                fields=["partition", "last_saved_instance", "last_saved_counter"],
+                opclasses=["text_pattern_ops", "", ""],
+                name="idx_morango_queue_partition",
+            ),
         ]
 
+    @cached_property
+    def serialized_data(self):
+        return get_codec().loads(self.serialized)
+
     def _deserialize_store_model(self, fk_cache, defer_fks=False):  # noqa: C901
         """
         When deserializing a store model, we look at the deleted flags to know if we should delete the app model.
@@ -474,10 +612,11 @@ class Store(AbstractStore):
             from morango.sync.utils import mute_signals
             with mute_signals(signals.post_delete):
                 klass_model.objects.filter(id=self.id).delete()
+            fk_cache.pop((klass_model._meta.db_table, self.id), None)
             return None, deferred_fks
         else:
             # load model into memory
-            app_model = klass_model.deserialize(json.loads(self.serialized))
+            app_model = klass_model.deserialize(self.serialized_data)
             app_model._morango_source_id = self.source_id
             app_model._morango_partition = self.partition
             app_model._morango_dirty_bit = False
@@ -521,6 +660,60 @@ class Store(AbstractStore):
                 raise e
 
 
+class BufferQueryset(models.QuerySet):
+    _prefetch_rmcb_list = False
+
+    def prefetch_rmcb_list(self):
+        """
+        Loads the RMCBs of the buffers in one query when the queryset is evaluated, instead of one
+        query per buffer in `Buffer.rmcb_list`
+
+        :return: A clone of the queryset
+        """
+        clone = self._chain()
+        clone._prefetch_rmcb_list = True
+        return clone
+
+    def _clone(self):
+        clone = super(BufferQueryset, self)._clone()
+        clone._prefetch_rmcb_list = self._prefetch_rmcb_list
+        return clone
+
+    def _fetch_all(self):
+        prefetch = self._result_cache is None and self._prefetch_rmcb_list
+        super(BufferQueryset, self)._fetch_all()
+        if prefetch:
+            prefetch_rmcb_lists(self._result_cache)
+
+
+class BufferManager(models.Manager.from_queryset(BufferQueryset)):
+    pass
+
+
+def prefetch_rmcb_lists(buffers):
+    """
+    Loads the RMCBs of the buffers in one query per transfer session, and caches them on each
+    buffer for `Buffer.rmcb_list`
+
+    :param buffers: A list of Buffer instances
+    """
+    buffers_by_session = defaultdict(list)
+    for buffer in buffers:
+        if isinstance(buffer, Buffer):
+            buffers_by_session[buffer.transfer_session_id].append(buffer)
+
+    for transfer_session_id, session_buffers in buffers_by_session.items():
+        rmcbs_by_model_uuid = defaultdict(list)
+        rmcbs = RecordMaxCounterBuffer.objects.filter(
+            transfer_session_id=transfer_session_id,
+            model_uuid__in=[buffer.model_uuid for buffer in session_buffers],
+        )
+        for rmcb in rmcbs:
+            rmcbs_by_model_uuid[rmcb.model_uuid].append(rmcb)
+        for buffer in session_buffers:
+            buffer._rmcb_list = rmcbs_by_model_uuid[buffer.model_uuid]
+
+
 class Buffer(AbstractStore):
     """
     ``Buffer`` is where records from the internal store are queued up temporarily, before being
@@ -531,10 +724,15 @@ class Buffer(AbstractStore):
     transfer_session = models.ForeignKey(TransferSession, on_delete=models.CASCADE)
     model_uuid = UUIDField()
 
+    objects = BufferManager()
+
     class Meta:
         unique_together = ("transfer_session", "model_uuid")
 
     def rmcb_list(self):
+        # use the RMCBs loaded along with the other buffers of the chunk, when they have been
+        if hasattr(self, "_rmcb_list"):
+            return self._rmcb_list
         return RecordMaxCounterBuffer.objects.filter(
             model_uuid=self.model_uuid, transfer_session_id=self.transfer_session_id
         )
@@ -587,43 +785,68 @@ class DatabaseMaxCounter(AbstractCounter):
 
     partition = models.CharField(max_length=128, default="")
 
+    # FSICs keyed by the arguments they were calculated with, along with the version of the
+    # counters they were calculated from
+    _fsic_cache = {}
+    # bumped whenever this process writes the counters, or the data FSICs are reduced against
+    _fsic_cache_version = 0
+
     class Meta:
         unique_together = ("instance_id", "partition")
 
     @classmethod
     @transaction.atomic
     def update_fsics(cls, fsics, sync_filter, v2_format=False):
-        internal_fsic = DatabaseMaxCounter.calculate_filter_specific_instance_counters(
-            sync_filter, v2_format=v2_format
-        )
+        """
+        Raises the max counters of the partitions to the counters of an FSIC, after its data has
+        been received, in a single bulk upsert. Counters that are already higher are left as is.
+
+        :param fsics: The FSIC of the received data
+        :type fsics: dict
+        :param sync_filter: The filter of the sync, whose partitions a v1 FSIC applies to
+        :type sync_filter: Filter
+        :param v2_format: Whether the FSIC is in the v2 format, split out by partition
+        """
+        from morango.sync.backends.utils import load_backend
+
         if v2_format:
-            internal_fsic = internal_fsic["sub"]
-            fsics = fsics["sub"]
-            for part, insts in fsics.items():
-                for inst, counter in insts.items():
-                    if internal_fsic.get("part", {}).get(inst, 0) < counter:
-                        DatabaseMaxCounter.objects.update_or_create(
-                            instance_id=inst,
-                            partition=part,
-                            defaults={"counter": counter},
-                        )
+            counters = (
+                (inst, part, counter)
+                for part, insts in fsics["sub"].items()
+                for inst, counter in insts.items()
+            )
         else:
-            updated_fsic = {}
-            for key, value in fsics.items():
-                if key in internal_fsic:
-                    # if same instance id, update fsic with larger value
-                    if fsics[key] > internal_fsic[key]:
-                        updated_fsic[key] = fsics[key]
-                else:
-                    # if instance id is not present, add it to updated fsics
-                    updated_fsic[key] = fsics[key]
-
-            # load database max counters
-            for (key, value) in updated_fsic.items():
-                for f in sync_filter:
-                    DatabaseMaxCounter.objects.update_or_create(
-                        instance_id=key, partition=f, defaults={"counter": value}
-                    )
+            counters = (
+                (inst, part, counter)
+                for inst, counter in fsics.items()
+                for part in sync_filter
+            )
+
+        # a row can only be upserted once per statement, so keep the max counter of each
+        max_counters = {}
+        for inst, part, counter in counters:
+            if max_counters.get((inst, part), -1) < counter:
+                max_counters[(inst, part)] = counter
+
+        if not max_counters:
+            return
+
+        fields = [
+            cls._meta.get_field("instance_id"),
+            cls._meta.get_field("partition"),
+            cls._meta.get_field("counter"),
+        ]
+        db_values = []
+        for (inst, part), counter in max_counters.items():
+            db_values.extend(
+                field.get_db_prep_value(value, connection)
+                for field, value in zip(fields, (inst, part, counter))
+            )
+        with connection.cursor() as cursor:
+            load_backend(connection)._bulk_max_counter_upsert(
+                cursor, cls._meta.db_table, fields, db_values
+            )
+        cls.clear_fsic_cache()
 
     @classmethod
     def get_instance_counters_for_partitions(cls, partitions, is_producer=False):
@@ -663,6 +886,29 @@ class DatabaseMaxCounter(AbstractCounter):
             counters[partition].update({instance_id: counter})
         return counters
 
+    @classmethod
+    def get_counters_version(cls):
+        """
+        Counters are only ever raised, and rows are only added or removed, so the count, the max
+        primary key and the sum of the counters together change whenever the counters do, including
+        when they're written by another process.
+
+        Writes by this process, including those to the store records and record max counters that
+        FSIC reduction reads without raising any counter, bump the process's own version through
+        `clear_fsic_cache`.
+
+        :return: A tuple that identifies the current state of the counters
+        """
+        version = cls.objects.aggregate(
+            count=Count("id"), max_id=Max("id"), total=Sum("counter")
+        )
+        return (
+            cls._fsic_cache_version,
+            version["count"],
+            version["max_id"],
+            version["total"],
+        )
+
     @classmethod
     def calculate_filter_specific_instance_counters(
         cls,
@@ -670,6 +916,57 @@ class DatabaseMaxCounter(AbstractCounter):
         is_producer=False,
         v2_format=False,
     ):
+        """
+        Calculates the FSIC of the filter, reusing the FSIC calculated for the same arguments
+        by this process if the counters haven't changed since
+
+        :param filters: The filter, or list of partition prefixes, to calculate the FSIC for
+        :param is_producer: Whether the FSIC is for the producing side of a transfer
+        :param v2_format: Whether to calculate the FSIC in the v2 format
+        :return: A dict of the FSIC
+        """
+        if SETTINGS.MORANGO_DISABLE_FSIC_CACHE:
+            return cls._calculate_filter_specific_instance_counters(
+                filters, is_producer=is_producer, v2_format=v2_format
+            )
+
+        key = (
+            tuple(sorted(filters)),
+            is_producer,
+            v2_format,
+            SETTINGS.MORANGO_DISABLE_FSIC_REDUCTION,
+        )
+        version = cls.get_counters_version()
+        cached = cls._fsic_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return copy.deepcopy(cached[1])
+
+        fsic = cls._calculate_filter_specific_instance_counters(
+            filters, is_producer=is_producer, v2_format=v2_format
+        )
+        # evict the oldest FSIC once the cache is full
+        while cls._fsic_cache and len(cls._fsic_cache) >= SETTINGS.MORANGO_FSIC_CACHE_SIZE:
+            cls._fsic_cache.pop(next(iter(cls._fsic_cache)), None)
+        cls._fsic_cache[key] = (version, copy.deepcopy(fsic))
+        return fsic
+
+    @classmethod
+    def clear_fsic_cache(cls):
+        """
+        Discards the FSICs cached by this process, which is done whenever this process writes the
+        counters, or the store records or record max counters they're reduced against. The version
+        is bumped too, so that FSICs being calculated concurrently aren't cached as current
+        """
+        cls._fsic_cache_version += 1
+        cls._fsic_cache.clear()
+
+    @classmethod
+    def _calculate_filter_specific_instance_counters(
+        cls,
+        filters,
+        is_producer=False,
+        v2_format=False,
+    ):
 
         if v2_format:
 
@@ -777,6 +1074,13 @@ class RecordMaxCounterBuffer(AbstractCounter):
     transfer_session = models.ForeignKey(TransferSession, on_delete=models.CASCADE)
     model_uuid = UUIDField(db_index=True)
 
+    class Meta:
+        indexes = [
+            # index for looking up the counters of a session's buffers while dequeuing; buffers are
+            # already indexed by their unique (transfer_session, model_uuid) constraint
+            models.Index(fields=["transfer_session", "model_uuid", "instance_id"], name="idx_morango_rmcb_dequeue"),
+        ]
+
 
 ForeignKeyReference = namedtuple(
     "ForeignKeyReference", ["from_field", "from_pk", "to_pk"]
@@ -853,8 +1157,8 @@ class SyncableModel(UUIDModelMixin):
         Immediately validates all fields, but uses a cache for foreign key (FK) lookups to reduce
         repeated queries for many records with the same FK
 
-        :param fk_lookup_cache: A dictionary to use as a cache to prevent querying the database if a
-            FK exists in the cache, having already been validated
+        :param fk_lookup_cache: A dictionary, or a `ForeignKeyCache`, to use as a cache to prevent
+            querying the database if a FK exists in the cache, keyed by `(db_table, pk)` tuples
         """
         excluded_fields = []
         fk_fields = [
@@ -862,30 +1166,25 @@ class SyncableModel(UUIDModelMixin):
         ]
 
         for f in fk_fields:
-            raw_value = getattr(self, f.attname)
-            key = "{id}_{db_table}".format(
-                db_table=f.related_model._meta.db_table, id=raw_value
-            )
+            key = get_foreign_key_cache_key(f, getattr(self, f.attname))
+            if key is None:
+                # let the field validate FKs whose existence can't be cached
+                continue
+            if key in fk_lookup_cache:
+                excluded_fields.append(f.name)
+                continue
             try:
-                fk_lookup_cache[key]
+                f.validate(getattr(self, f.attname), self)
+            except exceptions.ValidationError:
+                pass
+            else:
+                fk_lookup_cache[key] = True
                 excluded_fields.append(f.name)
-            except KeyError:
-                try:
-                    f.validate(raw_value, self)
-                except exceptions.ValidationError:
-                    pass
-                else:
-                    fk_lookup_cache[key] = 1
-                    excluded_fields.append(f.name)
 
         self.clean_fields(exclude=excluded_fields)
 
         # after cleaning, we can confidently set ourselves in the fk_lookup_cache
-        self_key = "{id}_{db_table}".format(
-            db_table=self._meta.db_table,
-            id=self.id,
-        )
-        fk_lookup_cache[self_key] = 1
+        fk_lookup_cache[(self._meta.db_table, self.pk)] = True
 
     def deferred_clean_fields(self):
         """
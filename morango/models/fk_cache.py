@@ -0,0 +1,223 @@
+"""
+Caching of the app models known to exist, keyed by their ``(db_table, pk)``, for validating the
+foreign keys (FKs) of deserialized app models without querying the database for each of them.
+
+During a deserialization, a `ForeignKeyCache` is populated in bulk with the FK targets referenced by
+each chunk of store records. When the `MORANGO_FK_CACHE_SIZE` setting is greater than zero, the keys
+are also looked up in, and once the deserialization commits added to, the `fk_existence_cache`. Its
+in-process keys are cleared at the start and end of each deserialization, as they can go stale when
+app models are deleted by other processes, or with signals muted, such as by cascades. Keys are
+only kept across deserializations by the Django cache named by the `MORANGO_FK_CACHE_ALIAS` setting,
+which is shared between processes. Its keys are discarded when their app model is deleted with
+signals, and expire after `MORANGO_FK_CACHE_TIMEOUT` seconds, which bounds how long other deletions
+can go unnoticed.
+"""
+import time
+from collections import defaultdict
+from collections import OrderedDict
+
+from django.core import exceptions
+from django.core.cache import caches
+from django.db import router
+from django.db import transaction
+from django.db.models.fields.related import ForeignKey
+
+from morango.registry import syncable_models
+from morango.utils import SETTINGS
+
+
+def get_foreign_key_cache_key(field, value):
+    """
+    :param field: The FK field
+    :param value: The raw value of the FK field
+    :return: A tuple of the referenced model's table and PK, or None if the FK's existence can't be
+        cached, in which case it must be validated by the field
+    """
+    if (
+        value is None
+        or not field.target_field.primary_key
+        or field.remote_field.limit_choices_to
+    ):
+        return None
+    try:
+        return field.related_model._meta.db_table, field.target_field.to_python(value)
+    except (exceptions.ValidationError, TypeError, ValueError):
+        return None
+
+
+class ForeignKeyExistenceCache(object):
+    """
+    Least recently used cache of the keys of app models that exist, which outlives deserializations
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+
+    @property
+    def enabled(self):
+        return SETTINGS.MORANGO_FK_CACHE_SIZE > 0
+
+    def _shared(self):
+        alias = SETTINGS.MORANGO_FK_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def _shared_key(key):
+        return "morango:fk:{}:{}".format(*key)
+
+    def get_many(self, keys):
+        """
+        :param keys: An iterable of `(db_table, pk)` tuples
+        :return: A set of the keys that are cached
+        """
+        if not self.enabled:
+            return set()
+
+        now = time.monotonic()
+        found = set()
+        missing = []
+        for key in keys:
+            expires = self._entries.get(key)
+            if expires is not None and expires > now:
+                self._entries.move_to_end(key)
+                found.add(key)
+            else:
+                self._entries.pop(key, None)
+                missing.append(key)
+
+        shared = self._shared()
+        if shared is not None and missing:
+            shared_keys = {self._shared_key(key): key for key in missing}
+            shared_found = {shared_keys[k] for k in shared.get_many(list(shared_keys))}
+            self._add(shared_found)
+            found.update(shared_found)
+        return found
+
+    def _add(self, keys):
+        expires = time.monotonic() + SETTINGS.MORANGO_FK_CACHE_TIMEOUT
+        for key in keys:
+            self._entries[key] = expires
+            self._entries.move_to_end(key)
+        # evict the least recently used keys once the cache is full
+        while len(self._entries) > SETTINGS.MORANGO_FK_CACHE_SIZE:
+            self._entries.popitem(last=False)
+
+    def set_many(self, keys):
+        """
+        :param keys: An iterable of `(db_table, pk)` tuples of app models that exist
+        """
+        if not self.enabled:
+            return
+        keys = list(keys)
+        self._add(keys)
+        shared = self._shared()
+        if shared is not None and keys:
+            shared.set_many(
+                {self._shared_key(key): 1 for key in keys},
+                timeout=SETTINGS.MORANGO_FK_CACHE_TIMEOUT,
+            )
+
+    def delete(self, key):
+        """
+        :param key: A `(db_table, pk)` tuple of an app model that was deleted
+        """
+        self._entries.pop(key, None)
+        if not self.enabled:
+            return
+        shared = self._shared()
+        if shared is not None:
+            shared.delete(self._shared_key(key))
+
+    def clear(self):
+        """Discards the keys cached by this process"""
+        self._entries.clear()
+
+
+fk_existence_cache = ForeignKeyExistenceCache()
+
+
+class ForeignKeyCache(object):
+    """
+    Cache of the keys of the app models known to exist during a deserialization, which supports the
+    operations of the dict it replaces in `SyncableModel.cached_clean_fields`. Used as a context
+    manager around the deserialization, it clears the in-process keys of the existence cache on entry
+    and exit.
+    """
+
+    def __init__(self, existence_cache=fk_existence_cache):
+        self._keys = set()
+        self._new_keys = set()
+        self._existence_cache = existence_cache
+
+    def __enter__(self):
+        self._existence_cache.clear()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._existence_cache.clear()
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __setitem__(self, key, value):
+        self._keys.add(key)
+        self._new_keys.add(key)
+
+    def pop(self, key, default=None):
+        self._new_keys.discard(key)
+        self._existence_cache.delete(key)
+        if key in self._keys:
+            self._keys.discard(key)
+            return True
+        return default
+
+    def prefetch(self, store_models):
+        """
+        Caches the app models referenced by the FKs of the store records that exist, looking them up
+        in the cross-deserialization cache, and then querying the rest with one query per
+        referenced model
+
+        :param store_models: An iterable of `Store` records to be deserialized
+        """
+        # FK values to look up, by the field they're referenced by
+        values_by_target = defaultdict(set)
+        for store_model in store_models:
+            if store_model.deleted:
+                continue
+            klass = syncable_models.get_model(store_model.profile, store_model.model_name)
+            fk_fields = [f for f in klass._meta.fields if isinstance(f, ForeignKey)]
+            if not fk_fields:
+                continue
+            for f in fk_fields:
+                key = get_foreign_key_cache_key(f, store_model.serialized_data.get(f.attname))
+                if key is not None and key not in self._keys:
+                    values_by_target[(f.related_model, f.target_field)].add(key[1])
+
+        cached = self._existence_cache.get_many(
+            (model._meta.db_table, value)
+            for (model, _), values in values_by_target.items()
+            for value in values
+        )
+        self._keys.update(cached)
+
+        for (model, target_field), values in values_by_target.items():
+            db_table = model._meta.db_table
+            values = [value for value in values if (db_table, value) not in cached]
+            if not values:
+                continue
+            existing = model._base_manager.using(router.db_for_read(model)).filter(
+                **{"{}__in".format(target_field.attname): values}
+            ).values_list(target_field.attname, flat=True)
+            for value in existing:
+                self[(db_table, target_field.to_python(value))] = True
+
+    def publish(self):
+        """
+        Adds the keys learned during the deserialization to the cross-deserialization cache, once
+        the current transaction commits, so that app models whose writes are rolled back aren't
+        cached
+        """
+        new_keys = set(self._new_keys)
+        self._new_keys.clear()
+        if new_keys and self._existence_cache.enabled:
+            transaction.on_commit(lambda: self._existence_cache.set_many(new_keys))
@@ -1,15 +1,62 @@
 from collections import defaultdict
 
 
+# marks the nodes of a `PrefixTrie` at which a key ends, and can't clash with the characters of keys
+_KEY = None
+
+
+class PrefixTrie(object):
+    """
+    A trie of partitions, built in time proportional to their total length, which finds the
+    partitions that are prefixes of another in time proportional to that partition's length,
+    instead of comparing it to every other partition
+    """
+
+    __slots__ = ("_root",)
+
+    def __init__(self, keys=()):
+        """
+        :param keys: An iterable of str keys to add to the trie
+        """
+        self._root = {}
+        for key in keys:
+            self.add(key)
+
+    def add(self, key):
+        """
+        :param key: A str key to add to the trie
+        """
+        node = self._root
+        for char in key:
+            node = node.setdefault(char, {})
+        node[_KEY] = key
+
+    def prefixes(self, key, include_self=True):
+        """
+        Yields the keys in the trie that are prefixes of a key, shortest first
+
+        :param key: A str, which doesn't need to be in the trie
+        :param include_self: Whether to yield the key itself, if it's in the trie
+        """
+        node = self._root
+        for char in key:
+            if _KEY in node:
+                yield node[_KEY]
+            node = node.get(char)
+            if node is None:
+                return
+        if include_self and _KEY in node:
+            yield node[_KEY]
+
+
 def _build_prefix_mapper(keys, include_self=False):
     """
     Returns a dict mapping each key to a list of keys that are its prefixes.
     """
+    trie = PrefixTrie(keys)
     prefix_mapper = defaultdict(list)
-    for key in keys:
-        for otherkey in keys:
-            if key.startswith(otherkey) and (include_self or key != otherkey):
-                prefix_mapper[key].append(otherkey)
+    for key in set(keys):
+        prefix_mapper[key].extend(trie.prefixes(key, include_self=include_self))
     return prefix_mapper
 
 
@@ -17,12 +64,12 @@ def _get_sub_partitions(partitions):
     """
     Return a set of partitions that are sub-partitions of other partitions in the list.
     """
-    sub_partitions = set()
-    for partition in partitions:
-        for other_partition in partitions:
-            if partition.startswith(other_partition) and partition != other_partition:
-                sub_partitions.add(partition)
-    return set(sub_partitions)
+    trie = PrefixTrie(partitions)
+    return {
+        partition
+        for partition in partitions
+        if next(trie.prefixes(partition, include_self=False), None) is not None
+    }
 
 
 def _merge_fsic_dicts(*dicts):
@@ -91,18 +138,19 @@ def expand_fsic_for_use(raw_fsic, sync_filter):
     # get a list of any subpartitions that are subordinate to other subpartitions
     subordinates = _get_sub_partitions(raw_fsic["sub"].keys())
 
+    super_partitions = PrefixTrie(raw_fsic["super"].keys())
+
     # propagate the super partition counts down into sub-partitions
     for sub_part, sub_fsic in raw_fsic["sub"].items():
         # skip any partitions that are subordinate to another sub-partition
         if sub_part in subordinates:
             continue
         # look through the super partitions for any that are prefixes of this partition
-        for super_part, super_fsic in raw_fsic["super"].items():
-            if sub_part.startswith(super_part):
-                # update the sub-partition's counters with any higher counters from the super-partition
-                for instance, counter in super_fsic.items():
-                    if counter > sub_fsic.get(instance, 0):
-                        sub_fsic[instance] = counter
+        for super_part in super_partitions.prefixes(sub_part):
+            # update the sub-partition's counters with any higher counters from the super-partition
+            for instance, counter in raw_fsic["super"][super_part].items():
+                if counter > sub_fsic.get(instance, 0):
+                    sub_fsic[instance] = counter
 
     # remove any empty subpartitions
     _remove_empty_partitions(raw_fsic["sub"])
@@ -155,34 +203,3 @@ def calculate_directional_fsic_diff_v2(fsic1, fsic2):
                 result[part][inst] = receiving_counter
 
     return dict(result)
-
-
-def chunk_fsic_v2(fsics, chunk_size):
-    """
-    Split FSIC v2 dict into chunks with maximum partitions + instances of chunk_size.
-
-    :param fsic: dict containing FSIC v2's
-    :param chunk_size: size of chunks to split into
-    :return: list of dicts containing FSIC v2's
-    """
-
-    remaining_in_chunk = chunk_size
-
-    chunked_fsics = []
-    current_chunk = defaultdict(dict)
-
-    for part in sorted(fsics):
-        insts = fsics[part]
-        remaining_in_chunk -= 1
-        for inst in sorted(insts):
-            if remaining_in_chunk <= 0:
-                if current_chunk:
-                    chunked_fsics.append(dict(current_chunk))
-                current_chunk = defaultdict(dict)
-                remaining_in_chunk = chunk_size - 1
-            current_chunk[part][inst] = insts[inst]
-            remaining_in_chunk -= 1
-    if current_chunk:
-        chunked_fsics.append(dict(current_chunk))
-
-    return chunked_fsics
@@ -2,6 +2,7 @@ from django.db.models.signals import post_delete
 from django.dispatch import receiver
 
 from .core import SyncableModel
+from .fk_cache import fk_existence_cache
 
 
 @receiver(post_delete)
@@ -12,3 +13,12 @@ def add_to_deleted_models(sender, instance=None, *args, **kwargs):
     """
     if issubclass(sender, SyncableModel):
         instance._update_deleted_models()
+
+
+@receiver(post_delete)
+def remove_from_fk_existence_cache(sender, instance=None, *args, **kwargs):
+    """
+    Whenever a model is deleted, we discard it from the cache of models that foreign keys are known to
+    reference, so deserialized models referencing it are validated again.
+    """
+    fk_existence_cache.delete((sender._meta.db_table, instance.pk))
@@ -187,7 +187,12 @@ class SessionMiddlewareOperations(list):
             else:
                 self.append(middleware_callable)
 
-    def __call__(self, context):
+    def __call__(self, context, stats=None):
+        """
+        :type context: morango.sync.context.SessionContext
+        :param stats: The stats of the invocation, on which the handling operation is noted
+        :type stats: morango.sync.stats.StageStats|None
+        """
         # As middleware list, we expect that one of the operations should handle the request context
         # so executing the middleware loops through each of the operations and executes them until
         # a non-false value is returned. At least one of the operations must "handle" it by
@@ -197,6 +202,8 @@ class SessionMiddlewareOperations(list):
             result = operation(context)
             # operation tells us it has "handled" the context by returning result that is not False
             if result is not False:
+                if stats is not None:
+                    stats.operation = operation.__class__.__name__
                 return result
         else:
             raise NotImplementedError(
@@ -0,0 +1,165 @@
+"""
+The JSON codecs of the serialized data of store records. Decoding uses the optional ``orjson`` or
+``ujson`` packages when they are installed, in that order of preference. Encoding always produces
+exactly the output of Django's ``DjangoJSONEncoder``, since neither package can reproduce its
+separators and its encoding of decimals and floats, and serialized data must stay byte-compatible
+across peers.
+
+This module doesn't depend on the database or the app registry, so that its functions can run in
+worker processes.
+"""
+import datetime
+import decimal
+import json
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from morango.utils import SETTINGS
+
+try:
+    import orjson
+
+    ORJSON_EXISTS = True
+except ImportError:
+    ORJSON_EXISTS = False
+
+try:
+    import ujson
+
+    UJSON_EXISTS = True
+except ImportError:
+    UJSON_EXISTS = False
+
+
+def _encode_datetime(o):
+    # same as `DjangoJSONEncoder`, which truncates microseconds to milliseconds
+    r = o.isoformat()
+    if o.microsecond:
+        r = r[:23] + r[26:]
+    if r.endswith("+00:00"):
+        r = r[:-6] + "Z"
+    return r
+
+
+class SerializedDataEncoder(DjangoJSONEncoder):
+    """
+    JSON encoder that produces the same output as `DjangoJSONEncoder`, looking up the encoding of
+    the most common non-JSON types by their exact type before falling back to its checks
+    """
+
+    _fast_paths = {
+        datetime.datetime: _encode_datetime,
+        datetime.date: datetime.date.isoformat,
+        uuid.UUID: str,
+        decimal.Decimal: str,
+    }
+
+    def default(self, o):
+        encode = self._fast_paths.get(type(o))
+        if encode is not None:
+            return encode(o)
+        return super(SerializedDataEncoder, self).default(o)
+
+
+class JSONCodec(object):
+    """
+    Codec using the standard library's ``json``
+    """
+
+    name = "json"
+    available = True
+
+    def __init__(self):
+        # the encoder holds no state between calls, so one instance is shared
+        self._encoder = SerializedDataEncoder()
+
+    def dumps(self, data):
+        """
+        :param data: A dict of serialized data
+        :return: The data encoded as JSON
+        :rtype: str
+        """
+        return self._encoder.encode(data)
+
+    def loads(self, serialized):
+        """
+        :param serialized: The JSON of serialized data
+        :type serialized: str
+        :return: The decoded data
+        """
+        return json.loads(serialized)
+
+
+class ORJSONCodec(JSONCodec):
+    """
+    Codec decoding with ``orjson``
+    """
+
+    name = "orjson"
+    available = ORJSON_EXISTS
+
+    def loads(self, serialized):
+        try:
+            return orjson.loads(serialized)
+        except ValueError:
+            # orjson rejects some JSON that the standard library encodes, like NaN and integers
+            # beyond 64 bits, so let the standard library decode, or reject, it
+            return super(ORJSONCodec, self).loads(serialized)
+
+
+class UJSONCodec(JSONCodec):
+    """
+    Codec decoding with ``ujson``
+    """
+
+    name = "ujson"
+    available = UJSON_EXISTS
+
+    def loads(self, serialized):
+        try:
+            return ujson.loads(serialized)
+        except ValueError:
+            return super(UJSONCodec, self).loads(serialized)
+
+
+# the codecs, in order of preference
+CODECS = (ORJSONCodec(), UJSONCodec(), JSONCodec())
+
+
+def get_codec(name=None):
+    """
+    :param name: The name of the codec, defaults to the `MORANGO_JSON_CODEC` setting, or when that
+        isn't set, the most preferred codec that is available
+    :return: The codec
+    :rtype: JSONCodec
+    """
+    name = name or SETTINGS.MORANGO_JSON_CODEC
+    for codec in CODECS:
+        if name is None and codec.available:
+            return codec
+        if codec.name == name:
+            if not codec.available:
+                raise ValueError("JSON codec is not installed: {}".format(name))
+            return codec
+    raise ValueError("Unsupported JSON codec: {}".format(name))
+
+
+def encode_serialized_data(payloads, codec_name=None):
+    """
+    Encodes the serialized data of app models into the JSON stored on their store records.
+
+    :param payloads: A list of tuples of an app model's serialized data, and the serialized JSON of
+        its existing store record, or None if it has none, which the data is merged over
+    :param codec_name: The name of the codec to use, see `get_codec`
+    :return: A list of the encoded JSON, in the order of the payloads
+    """
+    codec = get_codec(codec_name)
+    encoded = []
+    for data, existing_serialized in payloads:
+        if existing_serialized is not None:
+            ser_dict = codec.loads(existing_serialized)
+            ser_dict.update(data)
+            data = ser_dict
+        encoded.append(codec.dumps(data))
+    return encoded
@@ -1,17 +1,58 @@
 from contextlib import contextmanager
 
+from django.db import transaction
+
 from morango.models.core import Buffer
+from morango.models.core import InstanceIDModel
 from morango.models.core import RecordMaxCounter
 from morango.models.core import RecordMaxCounterBuffer
 from morango.models.core import Store
 
 
+# the ways a buffered record is merged into the store, as classified by the merge dequeue engine
+DEQUEUE_FAST_FORWARD = 1
+DEQUEUE_REVERSE_FAST_FORWARD = 2
+DEQUEUE_MERGE_CONFLICT = 3
+
+# the columns of the store written when dequeuing, excluding its primary key
+DEQUEUE_STORE_COLUMNS = (
+    "serialized",
+    "deleted",
+    "last_saved_instance",
+    "last_saved_counter",
+    "hard_deleted",
+    "model_name",
+    "profile",
+    "partition",
+    "source_id",
+    "conflicting_serialized_data",
+    "dirty_bit",
+    "_self_ref_fk",
+    "deserialization_error",
+    "last_transfer_session_id",
+)
+
+
 class BaseSQLWrapper(object):
     create_temporary_table_template = "CREATE TEMP TABLE {name} ({fields})"
 
     def __init__(self, connection):
         self.connection = connection
 
+    @property
+    def supports_returning(self):
+        """
+        :return: Whether the database supports `RETURNING` clauses on `UPDATE` statements
+        """
+        return False
+
+    @property
+    def supports_upsert(self):
+        """
+        :return: Whether the database supports `INSERT ... ON CONFLICT DO UPDATE` statements
+        """
+        return True
+
     def _is_transaction_isolation_error(self, error):
         """
         Determine if an error is related to transaction isolation
@@ -52,6 +93,60 @@ class BaseSQLWrapper(object):
     def _bulk_update(self, cursor, table_name, fields, db_values):
         raise NotImplementedError("Subclass must implement this method.")
 
+    def _increment_instance_counter(self, cursor, instance_id):
+        """
+        Increments the counter of an instance, in a single statement if the database supports it
+
+        :param cursor: The database connection cursor
+        :param instance_id: The str ID of the `InstanceIDModel`
+        :return: The incremented counter, or None if the instance doesn't exist or is no longer
+            current
+        """
+        increment = """
+            UPDATE {table_name} SET counter = counter + 1 WHERE id = %s AND current = %s
+        """.format(table_name=InstanceIDModel._meta.db_table)
+
+        if self.supports_returning:
+            cursor.execute(increment + " RETURNING counter", [instance_id, True])
+        else:
+            with transaction.atomic(using=self.connection.alias):
+                cursor.execute(increment, [instance_id, True])
+                cursor.execute(
+                    "SELECT counter FROM {table_name} WHERE id = %s AND current = %s".format(
+                        table_name=InstanceIDModel._meta.db_table
+                    ),
+                    [instance_id, True],
+                )
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _bulk_max_counter_upsert(self, cursor, table_name, fields, db_values):
+        """
+        Inserts counters, or raises the counter of the existing rows that conflict on all but the last
+        field, which is the counter. Counters are never lowered.
+
+        Example query:
+        `INSERT INTO model (F1,F2,F3) VALUES (%s, %s, %s), (%s, %s, %s)
+         ON CONFLICT (F1,F2) DO UPDATE SET F3 = excluded.F3 WHERE model.F3 < excluded.F3`
+        """
+        placeholder_str = ", ".join(
+            self._create_placeholder_list(fields, db_values)
+        ).replace("'", "")
+        key_fields, counter_field = fields[:-1], fields[-1]
+        upsert = """
+            INSERT INTO {table_name} ({fields})
+            VALUES {placeholder_str}
+            ON CONFLICT ({key_fields}) DO UPDATE SET {counter} = excluded.{counter}
+            WHERE {table_name}.{counter} < excluded.{counter}
+        """.format(
+            table_name=table_name,
+            fields=", ".join(f.column for f in fields),
+            placeholder_str=placeholder_str,
+            key_fields=", ".join(f.column for f in key_fields),
+            counter=counter_field.column,
+        )
+        cursor.execute(upsert, db_values)
+
     def _dequeuing_delete_rmcb_records(self, cursor, transfersession_id):
         # delete all RMCBs which are a reverse FF (store version newer than buffer version)
         delete_rmcb_records = """DELETE FROM {rmcb}
@@ -64,17 +159,16 @@ class BaseSQLWrapper(object):
                                  /*Checks whether LSB of buffer or less is in RMC of store*/
                                  AND buffer.last_saved_instance = rmc.instance_id
                                  AND buffer.last_saved_counter <= rmc.counter
-                                 AND rmcb.transfer_session_id = '{transfer_session_id}'
-                                 AND buffer.transfer_session_id = '{transfer_session_id}')
+                                 AND rmcb.transfer_session_id = %s
+                                 AND buffer.transfer_session_id = %s)
                                   """.format(
             buffer=Buffer._meta.db_table,
             store=Store._meta.db_table,
             rmc=RecordMaxCounter._meta.db_table,
             rmcb=RecordMaxCounterBuffer._meta.db_table,
-            transfer_session_id=transfersession_id,
         )
 
-        cursor.execute(delete_rmcb_records)
+        cursor.execute(delete_rmcb_records, [transfersession_id] * 2)
 
     def _dequeuing_delete_buffered_records(self, cursor, transfersession_id):
         # delete all buffer records which are a reverse FF (store version newer than buffer version)
@@ -87,14 +181,13 @@ class BaseSQLWrapper(object):
                                      /*Checks whether LSB of buffer or less is in RMC of store*/
                                      AND buffer.last_saved_instance = rmc.instance_id
                                      AND buffer.last_saved_counter <= rmc.counter
-                                     AND buffer.transfer_session_id = '{transfer_session_id}')
+                                     AND buffer.transfer_session_id = %s)
                                   """.format(
             buffer=Buffer._meta.db_table,
             store=Store._meta.db_table,
             rmc=RecordMaxCounter._meta.db_table,
-            transfer_session_id=transfersession_id,
         )
-        cursor.execute(delete_buffered_records)
+        cursor.execute(delete_buffered_records, [transfersession_id])
 
     def _dequeuing_merge_conflict_rmcb(self, cursor, transfersession_id):
         raise NotImplementedError("Subclass must implement this method.")
@@ -114,19 +207,18 @@ class BaseSQLWrapper(object):
                                     (SELECT 1 FROM {store} AS store, {buffer} AS buffer
                                     /*Scope to a single record.*/
                                     WHERE store.id = {buffer}.model_uuid
-                                    AND {buffer}.transfer_session_id = '{transfer_session_id}'
+                                    AND {buffer}.transfer_session_id = %s
                                     /*Exclude fast-forwards*/
                                     AND NOT EXISTS (SELECT 1 FROM {rmcb} AS rmcb WHERE store.id = rmcb.model_uuid
                                                                                   AND store.last_saved_instance = rmcb.instance_id
                                                                                   AND store.last_saved_counter <= rmcb.counter
-                                                                                  AND rmcb.transfer_session_id = '{transfer_session_id}'))
+                                                                                  AND rmcb.transfer_session_id = %s))
                                """.format(
             buffer=Buffer._meta.db_table,
             store=Store._meta.db_table,
             rmcb=RecordMaxCounterBuffer._meta.db_table,
-            transfer_session_id=transfersession_id,
         )
-        cursor.execute(delete_mc_buffer)
+        cursor.execute(delete_mc_buffer, [transfersession_id] * 2)
 
     def _dequeuing_delete_mc_rmcb(self, cursor, transfersession_id):
         # delete rmcb records with merge conflicts
@@ -138,19 +230,18 @@ class BaseSQLWrapper(object):
                                     AND store.id = rmc.store_model_id
                                     /*Where buffer rmc is greater than store rmc*/
                                     AND {rmcb}.instance_id = rmc.instance_id
-                                    AND {rmcb}.transfer_session_id = '{transfer_session_id}'
+                                    AND {rmcb}.transfer_session_id = %s
                                     /*Exclude fast fast-forwards*/
                                     AND NOT EXISTS (SELECT 1 FROM {rmcb} AS rmcb2 WHERE store.id = rmcb2.model_uuid
                                                                                   AND store.last_saved_instance = rmcb2.instance_id
                                                                                   AND store.last_saved_counter <= rmcb2.counter
-                                                                                  AND rmcb2.transfer_session_id = '{transfer_session_id}'))
+                                                                                  AND rmcb2.transfer_session_id = %s))
                                """.format(
             store=Store._meta.db_table,
             rmc=RecordMaxCounter._meta.db_table,
             rmcb=RecordMaxCounterBuffer._meta.db_table,
-            transfer_session_id=transfersession_id,
         )
-        cursor.execute(delete_mc_rmc)
+        cursor.execute(delete_mc_rmc, [transfersession_id] * 2)
 
     def _dequeuing_insert_remaining_buffer(self, cursor, transfersession_id):
         raise NotImplementedError("Subclass must implement this method.")
@@ -162,23 +253,235 @@ class BaseSQLWrapper(object):
         # delete the remaining rmcb for this transfer session
         delete_remaining_rmcb = """
                                 DELETE FROM {rmcb}
-                                WHERE {rmcb}.transfer_session_id = '{transfer_session_id}'
+                                WHERE {rmcb}.transfer_session_id = %s
                                 """.format(
             rmcb=RecordMaxCounterBuffer._meta.db_table,
-            transfer_session_id=transfersession_id,
         )
 
-        cursor.execute(delete_remaining_rmcb)
+        cursor.execute(delete_remaining_rmcb, [transfersession_id])
 
     def _dequeuing_delete_remaining_buffer(self, cursor, transfersession_id):
         # delete the remaining buffer for this transfer session
         delete_remaining_buffer = """
                                   DELETE FROM {buffer}
-                                  WHERE {buffer}.transfer_session_id = '{transfer_session_id}'
+                                  WHERE {buffer}.transfer_session_id = %s
                                   """.format(
-            buffer=Buffer._meta.db_table, transfer_session_id=transfersession_id
+            buffer=Buffer._meta.db_table,
+        )
+        cursor.execute(delete_remaining_buffer, [transfersession_id])
+
+    def _cast_uuid(self):
+        """
+        :return: SQL casting a parameter to the type of UUID columns, which untyped parameters in a
+            `SELECT` of an `INSERT` aren't implicitly converted to on all databases
+        """
+        return "CAST(%s AS {})".format(
+            Store._meta.get_field("last_saved_instance").db_type(self.connection)
+        )
+
+    def _dequeuing_classify_buffer(self, cursor, classes_table, transfersession_id):
+        """
+        Classifies each buffered record of the transfer session, once, by how it merges into the
+        store, inserting the DEQUEUE_* classification of each into the temporary table
+
+        :param cursor: The database connection cursor
+        :param classes_table: The SQL name of a temporary table with `model_uuid` and
+            `classification` columns
+        :param transfersession_id: The str ID of the transfer session
+        """
+        classify = """
+            INSERT INTO {classes} (model_uuid, classification)
+            SELECT buffer.model_uuid,
+                CASE
+                    /*Records not yet in the store are inserted as they are*/
+                    WHEN store.id IS NULL THEN {fast_forward}
+                    /*Checks whether LSB of buffer or less is in RMC of store*/
+                    WHEN EXISTS (SELECT 1 FROM {rmc} AS rmc
+                                 WHERE rmc.store_model_id = store.id
+                                 AND rmc.instance_id = buffer.last_saved_instance
+                                 AND rmc.counter >= buffer.last_saved_counter) THEN {reverse_fast_forward}
+                    /*Checks whether LSB of store or less is in RMCB of buffer*/
+                    WHEN EXISTS (SELECT 1 FROM {rmcb} AS rmcb
+                                 WHERE rmcb.model_uuid = store.id
+                                 AND rmcb.transfer_session_id = buffer.transfer_session_id
+                                 AND rmcb.instance_id = store.last_saved_instance
+                                 AND rmcb.counter >= store.last_saved_counter) THEN {fast_forward}
+                    ELSE {merge_conflict}
+                END
+            FROM {buffer} AS buffer
+            LEFT JOIN {store} AS store ON store.id = buffer.model_uuid
+            WHERE buffer.transfer_session_id = %s
+        """.format(
+            classes=classes_table,
+            buffer=Buffer._meta.db_table,
+            store=Store._meta.db_table,
+            rmc=RecordMaxCounter._meta.db_table,
+            rmcb=RecordMaxCounterBuffer._meta.db_table,
+            fast_forward=DEQUEUE_FAST_FORWARD,
+            reverse_fast_forward=DEQUEUE_REVERSE_FAST_FORWARD,
+            merge_conflict=DEQUEUE_MERGE_CONFLICT,
+        )
+        cursor.execute(classify, [transfersession_id])
+
+    def _upsert_store_sql(self, select_sql):
+        """
+        :param select_sql: SQL selecting the store's primary key and `DEQUEUE_STORE_COLUMNS`
+        :return: SQL inserting the selected records into the store, or updating those that exist
+        """
+        return """
+            INSERT INTO {store} (id, {columns})
+            {select_sql}
+            ON CONFLICT (id) DO UPDATE SET {set_columns}
+        """.format(
+            store=Store._meta.db_table,
+            columns=", ".join(DEQUEUE_STORE_COLUMNS),
+            select_sql=select_sql,
+            set_columns=", ".join(
+                "{column} = excluded.{column}".format(column=column)
+                for column in DEQUEUE_STORE_COLUMNS
+            ),
+        )
+
+    def _upsert_rmcs_sql(self, select_sql, raise_only=False):
+        """
+        :param select_sql: SQL selecting the `instance_id`, `counter` and `store_model_id` of RMCs
+        :param raise_only: Whether existing counters are only updated when they're raised
+        :return: SQL inserting the selected RMCs, or updating the counters of those that exist
+        """
+        return """
+            INSERT INTO {rmc} (instance_id, counter, store_model_id)
+            {select_sql}
+            ON CONFLICT (store_model_id, instance_id) DO UPDATE SET counter = excluded.counter
+            {where}
+        """.format(
+            rmc=RecordMaxCounter._meta.db_table,
+            select_sql=select_sql,
+            where="WHERE {}.counter < excluded.counter".format(
+                RecordMaxCounter._meta.db_table
+            )
+            if raise_only
+            else "",
+        )
+
+    def _dequeuing_apply_merge_conflicts(
+        self, cursor, classes_table, current_id, transfersession_id
+    ):
+        """
+        Merges the buffered records classified as merge conflicts into the store, as new versions
+        saved by the current instance, and merges their RMCBs into their RMCs
+
+        :param cursor: The database connection cursor
+        :param classes_table: The SQL name of the temporary table of classifications
+        :param current_id: The current instance ID model, with its incremented counter
+        :param transfersession_id: The str ID of the transfer session
+        """
+        # transfer buffer serialized into conflicting store
+        select_store = """
+            SELECT store.id,
+                CASE WHEN buffer.hard_deleted THEN '' ELSE store.serialized END,
+                store.deleted OR buffer.deleted, {uuid}, %s,
+                store.hard_deleted OR buffer.hard_deleted,
+                store.model_name, store.profile, store.partition, store.source_id,
+                CASE WHEN buffer.hard_deleted THEN ''
+                    ELSE buffer.serialized || %s || store.conflicting_serialized_data END,
+                %s, store._self_ref_fk, '', {uuid}
+            FROM {classes} AS classes
+            INNER JOIN {buffer} AS buffer ON buffer.model_uuid = classes.model_uuid
+            INNER JOIN {store} AS store ON store.id = classes.model_uuid
+            WHERE classes.classification = {merge_conflict}
+            AND buffer.transfer_session_id = %s
+        """.format(
+            uuid=self._cast_uuid(),
+            classes=classes_table,
+            buffer=Buffer._meta.db_table,
+            store=Store._meta.db_table,
+            merge_conflict=DEQUEUE_MERGE_CONFLICT,
+        )
+        cursor.execute(
+            self._upsert_store_sql(select_store),
+            [
+                current_id.id,
+                current_id.counter,
+                "\n",
+                True,
+                transfersession_id,
+                transfersession_id,
+            ],
+        )
+
+        # raise the RMCs to the greater counters of the RMCBs, and add those of other instances
+        select_rmcbs = """
+            SELECT rmcb.instance_id, MAX(rmcb.counter), rmcb.model_uuid
+            FROM {classes} AS classes
+            INNER JOIN {rmcb} AS rmcb ON rmcb.model_uuid = classes.model_uuid
+            WHERE classes.classification = {merge_conflict}
+            AND rmcb.transfer_session_id = %s
+            GROUP BY rmcb.model_uuid, rmcb.instance_id
+        """.format(
+            classes=classes_table,
+            rmcb=RecordMaxCounterBuffer._meta.db_table,
+            merge_conflict=DEQUEUE_MERGE_CONFLICT,
+        )
+        cursor.execute(
+            self._upsert_rmcs_sql(select_rmcbs, raise_only=True), [transfersession_id]
+        )
+
+        # update or create rmc for merge conflicts with local instance id
+        select_current = """
+            SELECT {uuid}, %s, classes.model_uuid
+            FROM {classes} AS classes
+            WHERE classes.classification = {merge_conflict}
+        """.format(
+            uuid=self._cast_uuid(),
+            classes=classes_table,
+            merge_conflict=DEQUEUE_MERGE_CONFLICT,
+        )
+        cursor.execute(
+            self._upsert_rmcs_sql(select_current), [current_id.id, current_id.counter]
+        )
+
+    def _dequeuing_apply_fast_forwards(self, cursor, classes_table, transfersession_id):
+        """
+        Writes the buffered records classified as fast-forwards over, or into, the store, along
+        with their RMCBs
+
+        :param cursor: The database connection cursor
+        :param classes_table: The SQL name of the temporary table of classifications
+        :param transfersession_id: The str ID of the transfer session
+        """
+        select_buffer = """
+            SELECT buffer.model_uuid, buffer.serialized, buffer.deleted,
+                buffer.last_saved_instance, buffer.last_saved_counter, buffer.hard_deleted,
+                buffer.model_name, buffer.profile, buffer.partition, buffer.source_id,
+                buffer.conflicting_serialized_data, %s, buffer._self_ref_fk, '', {uuid}
+            FROM {classes} AS classes
+            INNER JOIN {buffer} AS buffer ON buffer.model_uuid = classes.model_uuid
+            WHERE classes.classification = {fast_forward}
+            AND buffer.transfer_session_id = %s
+        """.format(
+            uuid=self._cast_uuid(),
+            classes=classes_table,
+            buffer=Buffer._meta.db_table,
+            fast_forward=DEQUEUE_FAST_FORWARD,
+        )
+        cursor.execute(
+            self._upsert_store_sql(select_buffer),
+            [True, transfersession_id, transfersession_id],
+        )
+
+        select_rmcbs = """
+            SELECT rmcb.instance_id, MAX(rmcb.counter), rmcb.model_uuid
+            FROM {classes} AS classes
+            INNER JOIN {rmcb} AS rmcb ON rmcb.model_uuid = classes.model_uuid
+            WHERE classes.classification = {fast_forward}
+            AND rmcb.transfer_session_id = %s
+            GROUP BY rmcb.model_uuid, rmcb.instance_id
+        """.format(
+            classes=classes_table,
+            rmcb=RecordMaxCounterBuffer._meta.db_table,
+            fast_forward=DEQUEUE_FAST_FORWARD,
         )
-        cursor.execute(delete_remaining_buffer)
+        cursor.execute(self._upsert_rmcs_sql(select_rmcbs), [transfersession_id])
 
     def _create_temporary_table(self, cursor, name, field_sqls, fields_params):
         """
@@ -26,6 +26,7 @@ class SQLWrapper(BaseSQLWrapper):
     create_temporary_table_template = (
         "CREATE TEMP TABLE {name} ({fields}) ON COMMIT DROP"
     )
+    supports_returning = True
 
     def _is_transaction_isolation_error(self, error):
         """
@@ -185,50 +186,55 @@ class SQLWrapper(BaseSQLWrapper):
                                     /*Where buffer rmc is greater than store rmc*/
                                     AND rmcb.instance_id = rmc.instance_id
                                     AND rmcb.counter > rmc.counter
-                                    AND rmcb.transfer_session_id = '{transfer_session_id}'
+                                    AND rmcb.transfer_session_id = %s
                                     /*Exclude fast-forwards*/
                                     AND NOT EXISTS (SELECT 1 FROM {rmcb} AS rmcb2 WHERE store.id = rmcb2.model_uuid
                                                                                   AND store.last_saved_instance = rmcb2.instance_id
                                                                                   AND store.last_saved_counter <= rmcb2.counter
-                                                                                  AND rmcb2.transfer_session_id = '{transfer_session_id}')
+                                                                                  AND rmcb2.transfer_session_id = %s)
                                """.format(
             buffer=Buffer._meta.db_table,
             store=Store._meta.db_table,
             rmc=RecordMaxCounter._meta.db_table,
             rmcb=RecordMaxCounterBuffer._meta.db_table,
-            transfer_session_id=transfersession_id,
         )
 
-        cursor.execute(merge_conflict_rmc)
+        cursor.execute(merge_conflict_rmc, [transfersession_id] * 2)
 
     def _dequeuing_merge_conflict_buffer(self, cursor, current_id, transfersession_id):
         # transfer buffer serialized into conflicting store
         merge_conflict_store = """UPDATE {store} as store SET (serialized, deleted, last_saved_instance, last_saved_counter, hard_deleted, model_name,
                                                         profile, partition, source_id, conflicting_serialized_data, dirty_bit, _self_ref_fk, deserialization_error, last_transfer_session_id)
-                                            = (CASE buffer.hard_deleted WHEN TRUE THEN '' ELSE store.serialized END, store.deleted OR buffer.deleted, '{current_instance_id}',
-                                                   {current_instance_counter}, store.hard_deleted, store.model_name, store.profile, store.partition, store.source_id,
+                                            = (CASE buffer.hard_deleted WHEN TRUE THEN '' ELSE store.serialized END, store.deleted OR buffer.deleted, %s,
+                                                   %s, store.hard_deleted OR buffer.hard_deleted, store.model_name, store.profile, store.partition, store.source_id,
                                                    CASE buffer.hard_deleted WHEN TRUE THEN '' ELSE buffer.serialized || '\n' || store.conflicting_serialized_data END, TRUE, store._self_ref_fk,
-                                                   '', '{transfer_session_id}')
+                                                   '', %s)
                                             /*Scope to a single record.*/
                                             FROM {buffer} AS buffer
                                             WHERE store.id = buffer.model_uuid
-                                            AND buffer.transfer_session_id = '{transfer_session_id}'
+                                            AND buffer.transfer_session_id = %s
                                             /*Exclude fast-forwards*/
                                             AND NOT EXISTS (SELECT 1 FROM {rmcb} AS rmcb2 WHERE store.id = rmcb2.model_uuid
                                                                                           AND store.last_saved_instance = rmcb2.instance_id
                                                                                           AND store.last_saved_counter <= rmcb2.counter
-                                                                                          AND rmcb2.transfer_session_id = '{transfer_session_id}')
+                                                                                          AND rmcb2.transfer_session_id = %s)
                                       """.format(
             buffer=Buffer._meta.db_table,
             rmcb=RecordMaxCounterBuffer._meta.db_table,
             store=Store._meta.db_table,
             rmc=RecordMaxCounter._meta.db_table,
-            transfer_session_id=transfersession_id,
-            current_instance_id=current_id.id,
-            current_instance_counter=current_id.counter,
         )
 
-        cursor.execute(merge_conflict_store)
+        cursor.execute(
+            merge_conflict_store,
+            [
+                current_id.id,
+                current_id.counter,
+                transfersession_id,
+                transfersession_id,
+                transfersession_id,
+            ],
+        )
 
     def _dequeuing_update_rmcs_last_saved_by(
         self, cursor, current_id, transfersession_id
@@ -237,16 +243,16 @@ class SQLWrapper(BaseSQLWrapper):
         merge_conflict_store = """
                 WITH new_values as
             (
-                SELECT '{current_instance_id}'::uuid curr_id, {current_instance_counter} curr_counter, store.id
+                SELECT %s::uuid curr_id, %s::integer curr_counter, store.id
                 FROM {store} as store, {buffer} as buffer
                 /*Scope to a single record.*/
                 WHERE store.id = buffer.model_uuid
-                AND buffer.transfer_session_id = '{transfer_session_id}'
+                AND buffer.transfer_session_id = %s
                 /*Exclude fast-forwards*/
                 AND NOT EXISTS (SELECT 1 FROM {rmcb} AS rmcb2 WHERE store.id = rmcb2.model_uuid
                                                               AND store.last_saved_instance = rmcb2.instance_id
                                                               AND store.last_saved_counter <= rmcb2.counter
-                                                              AND rmcb2.transfer_session_id = '{transfer_session_id}')
+                                                              AND rmcb2.transfer_session_id = %s)
             ),
             updated as
             (
@@ -257,7 +263,7 @@ class SQLWrapper(BaseSQLWrapper):
                 returning rmc.*
             )
             INSERT INTO {rmc}(instance_id, counter, store_model_id)
-            SELECT '{current_instance_id}'::uuid, {current_instance_counter}, ut.id
+            SELECT %s::uuid, %s::integer, ut.id
             FROM new_values ut
             WHERE ut.id not in (SELECT store_model_id FROM updated)
         """.format(
@@ -265,12 +271,19 @@ class SQLWrapper(BaseSQLWrapper):
             rmcb=RecordMaxCounterBuffer._meta.db_table,
             store=Store._meta.db_table,
             rmc=RecordMaxCounter._meta.db_table,
-            transfer_session_id=transfersession_id,
-            current_instance_id=current_id.id,
-            current_instance_counter=current_id.counter,
         )
 
-        cursor.execute(merge_conflict_store)
+        cursor.execute(
+            merge_conflict_store,
+            [
+                current_id.id,
+                current_id.counter,
+                transfersession_id,
+                transfersession_id,
+                current_id.id,
+                current_id.counter,
+            ],
+        )
 
     def _dequeuing_insert_remaining_buffer(self, cursor, transfersession_id):
         # insert remaining records into store
@@ -280,7 +293,7 @@ class SQLWrapper(BaseSQLWrapper):
                 SELECT buffer.model_uuid, buffer.serialized, buffer.deleted, buffer.last_saved_instance, buffer.last_saved_counter, buffer.hard_deleted,
                        buffer.model_name, buffer.profile, buffer.partition, buffer.source_id, buffer.conflicting_serialized_data, buffer._self_ref_fk
                 FROM {buffer} as buffer
-                WHERE buffer.transfer_session_id = '{transfer_session_id}'
+                WHERE buffer.transfer_session_id = %s
             ),
             updated as
             (
@@ -288,7 +301,7 @@ class SQLWrapper(BaseSQLWrapper):
                                      partition, source_id, conflicting_serialized_data, dirty_bit, _self_ref_fk, deserialization_error, last_transfer_session_id)
                                     = (nv.serialized, nv.deleted, nv.last_saved_instance, nv.last_saved_counter, nv.hard_deleted,
                                        nv.model_name, nv.profile, nv.partition, nv.source_id, nv.conflicting_serialized_data, TRUE,
-                                       nv._self_ref_fk, '', '{transfer_session_id}')
+                                       nv._self_ref_fk, '', %s)
                 FROM new_values nv
                 WHERE nv.model_uuid = store.id
                 returning store.*
@@ -297,16 +310,15 @@ class SQLWrapper(BaseSQLWrapper):
                                 partition, source_id, conflicting_serialized_data, dirty_bit, _self_ref_fk, deserialization_error, last_transfer_session_id)
             SELECT ut.model_uuid, ut.serialized, ut.deleted, ut.last_saved_instance, ut.last_saved_counter, ut.hard_deleted,
                        ut.model_name, ut.profile, ut.partition, ut.source_id, ut.conflicting_serialized_data, TRUE,
-                       ut._self_ref_fk, '', '{transfer_session_id}'
+                       ut._self_ref_fk, '', %s::uuid
             FROM new_values ut
             WHERE ut.model_uuid not in (SELECT id FROM updated)
         """.format(
             buffer=Buffer._meta.db_table,
             store=Store._meta.db_table,
-            transfer_session_id=transfersession_id,
         )
 
-        cursor.execute(insert_remaining_buffer)
+        cursor.execute(insert_remaining_buffer, [transfersession_id] * 3)
 
     def _dequeuing_insert_remaining_rmcb(self, cursor, transfersession_id):
         # insert remaining records into rmc
@@ -315,7 +327,7 @@ class SQLWrapper(BaseSQLWrapper):
             (
                 SELECT rmcb.instance_id rmcb_instance_id, rmcb.counter, rmcb.model_uuid
                 FROM {rmcb} as rmcb
-                WHERE rmcb.transfer_session_id = '{transfer_session_id}'
+                WHERE rmcb.transfer_session_id = %s
             ),
             updated as
             (
@@ -333,10 +345,9 @@ class SQLWrapper(BaseSQLWrapper):
             """.format(
             rmc=RecordMaxCounter._meta.db_table,
             rmcb=RecordMaxCounterBuffer._meta.db_table,
-            transfer_session_id=transfersession_id,
         )
 
-        cursor.execute(insert_remaining_rmcb)
+        cursor.execute(insert_remaining_rmcb, [transfersession_id])
 
     def _execute_lock(self, key1, key2=None, unlock=False, session=False, shared=False, wait=True):
         """
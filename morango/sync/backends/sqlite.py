@@ -10,6 +10,14 @@ from morango.models.core import Store
 class SQLWrapper(BaseSQLWrapper):
     backend = "sqlite"
 
+    @property
+    def supports_returning(self):
+        return self.connection.Database.sqlite_version_info >= (3, 35, 0)
+
+    @property
+    def supports_upsert(self):
+        return self.connection.Database.sqlite_version_info >= (3, 24, 0)
+
     def _bulk_full_record_upsert(self, cursor, table_name, fields, db_values):
         """
         Example query:
@@ -55,6 +63,54 @@ class SQLWrapper(BaseSQLWrapper):
                 cursor, table_name, fields, value_chunk
             )
 
+    def _bulk_max_counter_upsert(self, cursor, table_name, fields, db_values):
+        num_of_rows_able_to_insert = calculate_max_sqlite_variables() // len(fields)
+        num_of_values_able_to_insert = num_of_rows_able_to_insert * len(fields)
+        value_chunks = [
+            db_values[x : x + num_of_values_able_to_insert]
+            for x in range(0, len(db_values), num_of_values_able_to_insert)
+        ]
+
+        # upserts are only supported since SQLite 3.24, so older versions insert the missing rows
+        # and then raise the counters of the existing ones
+        if self.supports_upsert:
+            for value_chunk in value_chunks:
+                super(SQLWrapper, self)._bulk_max_counter_upsert(
+                    cursor, table_name, fields, value_chunk
+                )
+            return
+
+        key_fields, counter_field = fields[:-1], fields[-1]
+        for value_chunk in value_chunks:
+            placeholder_str = ", ".join(
+                self._create_placeholder_list(fields, value_chunk)
+            ).replace("'", "")
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO {table_name} ({fields})
+                VALUES {placeholder_str}
+                """.format(
+                    table_name=table_name,
+                    fields=", ".join(f.column for f in fields),
+                    placeholder_str=placeholder_str,
+                ),
+                value_chunk,
+            )
+        update = """
+            UPDATE {table_name} SET {counter} = %s
+            WHERE {key_conditions} AND {counter} < %s
+        """.format(
+            table_name=table_name,
+            counter=counter_field.column,
+            key_conditions=" AND ".join("{} = %s".format(f.column) for f in key_fields),
+        )
+        rows = [
+            db_values[x : x + len(fields)] for x in range(0, len(db_values), len(fields))
+        ]
+        cursor.executemany(
+            update, [[row[-1]] + row[:-1] + [row[-1]] for row in rows]
+        )
+
     def _bulk_update(self, cursor, table_name, fields, db_values):
         """
         Example query:
@@ -119,74 +175,84 @@ class SQLWrapper(BaseSQLWrapper):
                                     /*Where buffer rmc is greater than store rmc*/
                                     AND rmcb.instance_id = rmc.instance_id
                                     AND rmcb.counter > rmc.counter
-                                    AND rmcb.transfer_session_id = '{transfer_session_id}'
+                                    AND rmcb.transfer_session_id = %s
                                     /*Exclude fast-forwards*/
                                     AND NOT EXISTS (SELECT 1 FROM {rmcb} AS rmcb2 WHERE store.id = rmcb2.model_uuid
                                                                                   AND store.last_saved_instance = rmcb2.instance_id
                                                                                   AND store.last_saved_counter <= rmcb2.counter
-                                                                                  AND rmcb2.transfer_session_id = '{transfer_session_id}')
+                                                                                  AND rmcb2.transfer_session_id = %s)
                                """.format(
             buffer=Buffer._meta.db_table,
             store=Store._meta.db_table,
             rmc=RecordMaxCounter._meta.db_table,
             rmcb=RecordMaxCounterBuffer._meta.db_table,
-            transfer_session_id=transfersession_id,
         )
-        cursor.execute(merge_conflict_rmc)
+        cursor.execute(merge_conflict_rmc, [transfersession_id] * 2)
 
     def _dequeuing_merge_conflict_buffer(self, cursor, current_id, transfersession_id):
         # transfer buffer serialized into conflicting store
         merge_conflict_store = """REPLACE INTO {store} (id, serialized, deleted, last_saved_instance, last_saved_counter, hard_deleted, model_name, profile, partition,
                                                         source_id, conflicting_serialized_data, dirty_bit, _self_ref_fk, deserialization_error, last_transfer_session_id)
-                                            SELECT store.id, CASE buffer.hard_deleted WHEN 1 THEN '' ELSE store.serialized END, store.deleted OR buffer.deleted, '{current_instance_id}',
-                                                   {current_instance_counter}, store.hard_deleted OR buffer.hard_deleted, store.model_name, store.profile, store.partition, store.source_id,
+                                            SELECT store.id, CASE buffer.hard_deleted WHEN 1 THEN '' ELSE store.serialized END, store.deleted OR buffer.deleted, %s,
+                                                   %s, store.hard_deleted OR buffer.hard_deleted, store.model_name, store.profile, store.partition, store.source_id,
                                                    CASE buffer.hard_deleted WHEN 1 THEN '' ELSE buffer.serialized || '\n' || store.conflicting_serialized_data END, 1, store._self_ref_fk,
-                                                   '', '{transfer_session_id}'
+                                                   '', %s
                                             FROM {buffer} AS buffer, {store} AS store
                                             /*Scope to a single record.*/
                                             WHERE store.id = buffer.model_uuid
-                                            AND buffer.transfer_session_id = '{transfer_session_id}'
+                                            AND buffer.transfer_session_id = %s
                                             /*Exclude fast-forwards*/
                                             AND NOT EXISTS (SELECT 1 FROM {rmcb} AS rmcb2 WHERE store.id = rmcb2.model_uuid
                                                                                           AND store.last_saved_instance = rmcb2.instance_id
                                                                                           AND store.last_saved_counter <= rmcb2.counter
-                                                                                          AND rmcb2.transfer_session_id = '{transfer_session_id}')
+                                                                                          AND rmcb2.transfer_session_id = %s)
                                       """.format(
             buffer=Buffer._meta.db_table,
             rmcb=RecordMaxCounterBuffer._meta.db_table,
             store=Store._meta.db_table,
             rmc=RecordMaxCounter._meta.db_table,
-            transfer_session_id=transfersession_id,
-            current_instance_id=current_id.id,
-            current_instance_counter=current_id.counter,
         )
-        cursor.execute(merge_conflict_store)
+        cursor.execute(
+            merge_conflict_store,
+            [
+                current_id.id,
+                current_id.counter,
+                transfersession_id,
+                transfersession_id,
+                transfersession_id,
+            ],
+        )
 
     def _dequeuing_update_rmcs_last_saved_by(
         self, cursor, current_id, transfersession_id
     ):
         # update or create rmc for merge conflicts with local instance id
         merge_conflict_store = """REPLACE INTO {rmc} (instance_id, counter, store_model_id)
-                                SELECT '{current_instance_id}', {current_instance_counter}, store.id
+                                SELECT %s, %s, store.id
                                 FROM {store} as store, {buffer} as buffer
                                 /*Scope to a single record.*/
                                 WHERE store.id = buffer.model_uuid
-                                AND buffer.transfer_session_id = '{transfer_session_id}'
+                                AND buffer.transfer_session_id = %s
                                 /*Exclude fast-forwards*/
                                 AND NOT EXISTS (SELECT 1 FROM {rmcb} AS rmcb2 WHERE store.id = rmcb2.model_uuid
                                                                               AND store.last_saved_instance = rmcb2.instance_id
                                                                               AND store.last_saved_counter <= rmcb2.counter
-                                                                              AND rmcb2.transfer_session_id = '{transfer_session_id}')
+                                                                              AND rmcb2.transfer_session_id = %s)
                                       """.format(
             buffer=Buffer._meta.db_table,
             rmcb=RecordMaxCounterBuffer._meta.db_table,
             store=Store._meta.db_table,
             rmc=RecordMaxCounter._meta.db_table,
-            transfer_session_id=transfersession_id,
-            current_instance_id=current_id.id,
-            current_instance_counter=current_id.counter,
         )
-        cursor.execute(merge_conflict_store)
+        cursor.execute(
+            merge_conflict_store,
+            [
+                current_id.id,
+                current_id.counter,
+                transfersession_id,
+                transfersession_id,
+            ],
+        )
 
     def _dequeuing_insert_remaining_buffer(self, cursor, transfersession_id):
         # insert remaining records into store
@@ -194,27 +260,25 @@ class SQLWrapper(BaseSQLWrapper):
                                                            source_id, conflicting_serialized_data, dirty_bit, _self_ref_fk, deserialization_error, last_transfer_session_id)
                                     SELECT buffer.model_uuid, buffer.serialized, buffer.deleted, buffer.last_saved_instance, buffer.last_saved_counter, buffer.hard_deleted,
                                            buffer.model_name, buffer.profile, buffer.partition, buffer.source_id, buffer.conflicting_serialized_data, 1,
-                                           buffer._self_ref_fk, '', '{transfer_session_id}'
+                                           buffer._self_ref_fk, '', %s
                                     FROM {buffer} AS buffer
-                                    WHERE buffer.transfer_session_id = '{transfer_session_id}'
+                                    WHERE buffer.transfer_session_id = %s
                            """.format(
             buffer=Buffer._meta.db_table,
             store=Store._meta.db_table,
-            transfer_session_id=transfersession_id,
         )
 
-        cursor.execute(insert_remaining_buffer)
+        cursor.execute(insert_remaining_buffer, [transfersession_id] * 2)
 
     def _dequeuing_insert_remaining_rmcb(self, cursor, transfersession_id):
         # insert remaining records into rmc
         insert_remaining_rmcb = """REPLACE INTO {rmc} (instance_id, counter, store_model_id)
                                     SELECT rmcb.instance_id, rmcb.counter, rmcb.model_uuid
                                     FROM {rmcb} AS rmcb
-                                    WHERE rmcb.transfer_session_id = '{transfer_session_id}'
+                                    WHERE rmcb.transfer_session_id = %s
                            """.format(
             rmc=RecordMaxCounter._meta.db_table,
             rmcb=RecordMaxCounterBuffer._meta.db_table,
-            transfer_session_id=transfersession_id,
         )
 
-        cursor.execute(insert_remaining_rmcb)
+        cursor.execute(insert_remaining_rmcb, [transfersession_id])
@@ -128,6 +128,14 @@ class TemporaryTable(object):
         with self.connection.cursor() as c:
             c.execute("DROP TABLE IF EXISTS {name}".format(name=self.sql_name))
 
+    def analyze(self):
+        """
+        Collects statistics about the contents of the temporary table, so the query planner can
+        choose how to join it. Temporary tables are never analyzed automatically
+        """
+        with self.connection.cursor() as c:
+            c.execute("ANALYZE {name}".format(name=self.sql_name))
+
     def bulk_insert(self, values):
         """
         Bulk inserts a list of records into the temporary table
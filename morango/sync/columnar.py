@@ -0,0 +1,193 @@
+"""
+A compact, columnar wire format for chunks of buffers, packed with the optional ``msgpack``
+package. Serialized buffers are transposed into one column per field, so that:
+
+- fields with the same value for every record in the chunk, such as ``transfer_session`` and
+  ``profile``, are sent once
+- fields with few distinct values, such as ``model_name`` and ``partition``, are sent as indices
+  into a table of their values
+- UUIDs are sent as 16 raw bytes instead of 32 hex characters
+
+The format decodes back to the same list of dicts as the JSON format produced by the
+``BufferSerializer``.
+"""
+try:
+    import msgpack
+
+    MSGPACK_EXISTS = True
+except ImportError:
+    MSGPACK_EXISTS = False
+
+
+MEDIA_TYPE = "application/vnd.morango.buffers+msgpack"
+
+VERSION = 1
+
+BUFFER_FIELDS = (
+    "serialized",
+    "deleted",
+    "last_saved_instance",
+    "last_saved_counter",
+    "hard_deleted",
+    "partition",
+    "source_id",
+    "model_name",
+    "conflicting_serialized_data",
+    "model_uuid",
+    "transfer_session",
+    "profile",
+    "_self_ref_fk",
+)
+
+# fields of the RMCBs nested within each buffer, besides those that always match the buffer's
+RMCB_FIELDS = ("instance_id", "counter")
+
+UUID_FIELDS = {"last_saved_instance", "model_uuid", "transfer_session", "instance_id"}
+
+# fields that are likely to repeat across records in a chunk, so are sent as indices into a table
+DICTIONARY_FIELDS = {"last_saved_instance", "partition", "model_name", "instance_id"}
+
+
+def _encode_uuid(value):
+    try:
+        if len(value) == 32:
+            return bytes.fromhex(value)
+    except (TypeError, ValueError):
+        pass
+    return value
+
+
+def _decode_uuid(value):
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+def _encode_column(field, values):
+    """
+    :param field: The name of the field
+    :param values: The list of the field's values, one for each record
+    :return: A dict with the `constant` value, a `table` of values and their `indices`, or the
+        plain `values`
+    """
+    if field in UUID_FIELDS:
+        values = [_encode_uuid(value) for value in values]
+
+    if values and all(value == values[0] for value in values):
+        return {"constant": values[0]}
+
+    if field in DICTIONARY_FIELDS:
+        table = []
+        indices = {}
+        column = []
+        for value in values:
+            if value not in indices:
+                indices[value] = len(table)
+                table.append(value)
+            column.append(indices[value])
+        return {"table": table, "indices": column}
+
+    return {"values": values}
+
+
+def _decode_column(field, encoded, count):
+    if "constant" in encoded:
+        values = [encoded["constant"]] * count
+    elif "table" in encoded:
+        table = encoded["table"]
+        values = [table[index] for index in encoded["indices"]]
+    else:
+        values = encoded["values"]
+
+    if field in UUID_FIELDS:
+        values = [_decode_uuid(value) for value in values]
+    return values
+
+
+def encode_buffers(records):
+    """
+    :param records: A list of serialized Buffer dicts, with their nested `rmcb_list`
+    :return: A dict of the columns of the records
+    """
+    rmcbs = [rmcb for record in records for rmcb in record["rmcb_list"]]
+    return {
+        "version": VERSION,
+        "count": len(records),
+        "columns": {
+            field: _encode_column(field, [record[field] for record in records])
+            for field in BUFFER_FIELDS
+        },
+        "rmcb_count": len(rmcbs),
+        "rmcb_lengths": [len(record["rmcb_list"]) for record in records],
+        "rmcb_columns": {
+            field: _encode_column(field, [rmcb[field] for rmcb in rmcbs])
+            for field in RMCB_FIELDS
+        },
+    }
+
+
+def decode_buffers(encoded):
+    """
+    :param encoded: A dict of the columns of the records, from `encode_buffers`
+    :return: A list of serialized Buffer dicts, with their nested `rmcb_list`
+    """
+    if encoded.get("version") != VERSION:
+        raise ValueError(
+            "Unsupported buffer format version: {}".format(encoded.get("version"))
+        )
+
+    count = encoded["count"]
+    columns = {
+        field: _decode_column(field, encoded["columns"][field], count)
+        for field in BUFFER_FIELDS
+    }
+    rmcb_count = encoded["rmcb_count"]
+    rmcb_columns = {
+        field: _decode_column(field, encoded["rmcb_columns"][field], rmcb_count)
+        for field in RMCB_FIELDS
+    }
+
+    records = []
+    rmcb_index = 0
+    for i, rmcb_length in enumerate(encoded["rmcb_lengths"]):
+        record = {field: columns[field][i] for field in BUFFER_FIELDS}
+        record["rmcb_list"] = [
+            {
+                "transfer_session": record["transfer_session"],
+                "model_uuid": record["model_uuid"],
+                "instance_id": rmcb_columns["instance_id"][j],
+                "counter": rmcb_columns["counter"][j],
+            }
+            for j in range(rmcb_index, rmcb_index + rmcb_length)
+        ]
+        rmcb_index += rmcb_length
+        records.append(record)
+    return records
+
+
+def pack(data):
+    """
+    :param data: A list of serialized Buffer dicts, or a paginated response dict with them as
+        its `results`
+    :return: The packed bytes
+    """
+    if isinstance(data, list):
+        data = encode_buffers(data)
+    elif isinstance(data, dict) and "results" in data:
+        data = dict(data, results=encode_buffers(data["results"]))
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def unpack(content):
+    """
+    :param content: The packed bytes, from `pack`
+    :return: A list of serialized Buffer dicts, or a paginated response dict with them as its
+        `results`
+    """
+    data = msgpack.unpackb(content, raw=False)
+    if isinstance(data, dict):
+        if "columns" in data:
+            return decode_buffers(data)
+        if isinstance(data.get("results"), dict):
+            data["results"] = decode_buffers(data["results"])
+    return data
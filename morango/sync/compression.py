@@ -0,0 +1,134 @@
+"""
+Incremental compression and decompression of buffer payloads. Gzip is always available through
+``zlib``, and zstd is available when the optional ``zstandard`` package is installed.
+"""
+import zlib
+
+try:
+    import zstandard
+
+    ZSTD_EXISTS = True
+except ImportError:
+    ZSTD_EXISTS = False
+
+
+GZIP = "gzip"
+ZSTD = "zstd"
+
+MEDIA_TYPES = {
+    GZIP: "application/gzip",
+    ZSTD: "application/zstd",
+}
+
+# the size of the blocks in which payloads are compressed and read
+BLOCK_SIZE = 64 * 1024
+
+# window bits for zlib that produce and expect a gzip header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def get_encodings():
+    """
+    :return: A list of the available encodings, in order of preference
+    """
+    encodings = [GZIP]
+    if ZSTD_EXISTS:
+        encodings.insert(0, ZSTD)
+    return encodings
+
+
+def get_decodable_response_encodings():
+    """
+    :return: A list of the encodings, in order of preference, that responses received through
+        `requests` are transparently decoded from
+    """
+    try:
+        from urllib3.util.request import ACCEPT_ENCODING
+    except ImportError:
+        ACCEPT_ENCODING = GZIP
+    accepted = ACCEPT_ENCODING.split(",")
+    return [encoding for encoding in get_encodings() if encoding in accepted]
+
+
+def _compressobj(encoding, level):
+    if encoding == GZIP:
+        return zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    if encoding == ZSTD and ZSTD_EXISTS:
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    raise ValueError("Unsupported encoding: {}".format(encoding))
+
+
+def _decompressobj(encoding):
+    if encoding == GZIP:
+        return zlib.decompressobj(GZIP_WBITS)
+    if encoding == ZSTD and ZSTD_EXISTS:
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError("Unsupported encoding: {}".format(encoding))
+
+
+def iter_blocks(pieces, block_size=BLOCK_SIZE):
+    """
+    Joins small pieces of text or bytes, such as those from `JSONEncoder.iterencode`, into blocks
+    of bytes of at least `block_size`, so they are compressed efficiently
+
+    :param pieces: An iterable of str or bytes
+    :param block_size: The minimum size of the blocks, apart from the last
+    :return: A generator of bytes
+    """
+    block = []
+    size = 0
+    for piece in pieces:
+        if not isinstance(piece, bytes):
+            piece = piece.encode("utf-8")
+        block.append(piece)
+        size += len(piece)
+        if size >= block_size:
+            yield b"".join(block)
+            block = []
+            size = 0
+    if block:
+        yield b"".join(block)
+
+
+def compress_iter(pieces, encoding, level):
+    """
+    :param pieces: An iterable of str or bytes to compress
+    :param encoding: The encoding to compress with, GZIP or ZSTD
+    :param level: The compression level
+    :return: A generator of compressed bytes
+    """
+    compressor = _compressobj(encoding, level)
+    for block in iter_blocks(pieces):
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def decompress_iter(blocks, encoding):
+    """
+    :param blocks: An iterable of compressed bytes
+    :param encoding: The encoding the bytes are compressed with, GZIP or ZSTD
+    :return: A generator of decompressed bytes
+    """
+    decompressor = _decompressobj(encoding)
+    for block in blocks:
+        decompressed = decompressor.decompress(block)
+        if decompressed:
+            yield decompressed
+    remaining = decompressor.flush()
+    if remaining:
+        yield remaining
+
+
+def read_blocks(stream, block_size=BLOCK_SIZE):
+    """
+    :param stream: A file-like object
+    :param block_size: The size of the blocks to read
+    :return: A generator of the bytes read from the stream
+    """
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        yield block
@@ -2,12 +2,18 @@ import logging
 import math
 from time import sleep
 
+from django.db import DatabaseError
+
 from morango.constants import transfer_stages
 from morango.constants import transfer_statuses
 from morango.registry import session_middleware
+from morango.registry import SessionMiddlewareOperations
 from morango.sync.operations import _deserialize_from_store
 from morango.sync.operations import _serialize_into_store
 from morango.sync.operations import OperationLogger
+from morango.sync.stats import StageStats
+from morango.sync.stats import StatsRecorder
+from morango.sync.utils import SyncSignal
 from morango.sync.utils import SyncSignalGroup
 from morango.utils import _assert
 
@@ -34,9 +40,12 @@ class MorangoProfileController(object):
     def serialize_into_store(self, filter=None):
         """
         Takes data from app layer and serializes the models into the store.
+
+        :return: A counter of the app models whose store records were `created`, `updated`, or
+            left `unchanged`
         """
         with OperationLogger("Serializing records", "Serialization complete"):
-            _serialize_into_store(self.profile, filter=filter)
+            return _serialize_into_store(self.profile, filter=filter)
 
     def deserialize_from_store(self, skip_erroring=False, filter=None):
         """
@@ -60,14 +69,16 @@ class MorangoProfileController(object):
 
 
 class SessionControllerSignals(object):
-    __slots__ = transfer_stages.ALL
+    __slots__ = tuple(transfer_stages.ALL) + ("measured",)
 
     def __init__(self):
         """
-        Initializes signal group for each transfer stage
+        Initializes signal group for each transfer stage, and the signal fired with the stats of
+        each invocation of a stage's middleware
         """
         for stage in transfer_stages.ALL:
             setattr(self, stage, SyncSignalGroup(context=None))
+        self.measured = SyncSignal(context=None, stats=None)
 
     def connect(self, handler):
         """
@@ -238,6 +249,7 @@ class SessionController(object):
         signal = getattr(self.signals, stage)
         at_stage = context.stage == stage
         prepared_context = None
+        stats = StageStats(stage)
 
         try:
             context.update(stage=stage, stage_status=transfer_statuses.PENDING)
@@ -250,8 +262,22 @@ class SessionController(object):
             if not at_stage:
                 signal.started.fire(context=prepared_context)
 
-            # invoke the middleware with the prepared context
-            result = middleware(prepared_context)
+            # invoke the middleware with the prepared context, measuring it whether or not it fails
+            result = transfer_statuses.ERRORED
+            try:
+                with StatsRecorder(
+                    stats, sync_connection=getattr(prepared_context, "connection", None)
+                ):
+                    if isinstance(middleware, SessionMiddlewareOperations):
+                        result = middleware(prepared_context, stats=stats)
+                    else:
+                        result = middleware(prepared_context)
+            finally:
+                self._record_stats(
+                    prepared_context,
+                    stats,
+                    finished=result in transfer_statuses.FINISHED_STATES,
+                )
 
             # don't update stage result if context's stage was updated during operation
             if context.stage == stage:
@@ -272,3 +298,24 @@ class SessionController(object):
             # fire completed signal, after context update. handlers can use context to detect error
             signal.completed.fire(context=prepared_context or context)
             return transfer_statuses.ERRORED
+
+    def _record_stats(self, context, stats, finished=False):
+        """
+        Adds the stats of invoking middleware to the context's transfer session, if any, and fires
+        the `measured` signal with them. The stats of a stage are only written once it finishes,
+        rather than on every invocation, except on the server, where each request invokes the
+        middleware once with its own transfer session.
+
+        :type context: morango.sync.context.SessionContext
+        :type stats: morango.sync.stats.StageStats
+        :param finished: Whether the invocation finished the stage, either completing or erroring
+        """
+        if context.transfer_session is not None:
+            context.transfer_session.record_stage_stats(stats)
+            if finished or getattr(context, "is_server", False):
+                try:
+                    context.transfer_session.save_stage_stats()
+                except DatabaseError as e:
+                    # the stats shouldn't interrupt the transfer
+                    logger.warning("Failed to record transfer stage stats: {}".format(e))
+        self.signals.measured.fire(context=context, stats=stats)
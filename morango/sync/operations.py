@@ -2,17 +2,24 @@ import functools
 import itertools
 import json
 import logging
+import math
+import multiprocessing
 import uuid
+from collections import Counter
 from collections import defaultdict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
 from django.core import exceptions
-from django.core.serializers.json import DjangoJSONEncoder
 from django.db import connection
 from django.db import transaction
 from django.db.models import CharField
+from django.db.models import IntegerField
 from django.db.models import Q
 from django.db.models import signals
+from django.db.models import TextField
 from django.db.utils import OperationalError
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
@@ -21,10 +28,10 @@ from morango.api.serializers import BufferSerializer
 from morango.constants import transfer_stages
 from morango.constants import transfer_statuses
 from morango.constants.capabilities import ASYNC_OPERATIONS
+from morango.constants.capabilities import BUFFER_PIPELINING
 from morango.constants.capabilities import FSIC_V2_FORMAT
 from morango.errors import MorangoDatabaseError
 from morango.errors import MorangoInvalidFSICPartition
-from morango.errors import MorangoLimitExceeded
 from morango.errors import MorangoResumeSyncError
 from morango.errors import MorangoSkipOperation
 from morango.models.certificates import Filter
@@ -36,13 +43,16 @@ from morango.models.core import InstanceIDModel
 from morango.models.core import RecordMaxCounter
 from morango.models.core import RecordMaxCounterBuffer
 from morango.models.core import Store
+from morango.models.core import SyncableModel
 from morango.models.core import TransferSession
 from morango.models.core import UUIDField
+from morango.models.fk_cache import ForeignKeyCache
 from morango.models.fsic_utils import calculate_directional_fsic_diff
 from morango.models.fsic_utils import calculate_directional_fsic_diff_v2
-from morango.models.fsic_utils import chunk_fsic_v2
 from morango.models.fsic_utils import expand_fsic_for_use
 from morango.registry import syncable_models
+from morango.serialization import encode_serialized_data
+from morango.serialization import get_codec
 from morango.sync.backends.utils import load_backend
 from morango.sync.backends.utils import TemporaryTable
 from morango.sync.context import LocalSessionContext
@@ -58,8 +68,6 @@ logger = logging.getLogger(__name__)
 
 DBBackend = load_backend(connection)
 
-SQL_UNION_MAX = 500
-
 
 class OperationLogger(object):
     def __init__(self, start_msg, end_msg):
@@ -76,11 +84,6 @@ class OperationLogger(object):
             logger.info("Error: {}".format(self.start_msg))
 
 
-def _join_with_logical_operator(lst, operator):
-    op = ") {operator} (".format(operator=operator)
-    return "(({items}))".format(items=op.join(lst))
-
-
 def _self_referential_fk(model):
     """
     Return whether this model has a self ref FK, and the name for the field
@@ -92,6 +95,41 @@ def _self_referential_fk(model):
     return None
 
 
+def _chunked_iterable(iterable, chunk_size):
+    """
+    Splits an iterable into lists of at most `chunk_size` items, consuming it lazily so that only one
+    chunk is held in memory at a time
+
+    :param iterable: The iterable to split, e.g. a ``QuerySet.iterator()``
+    :param chunk_size: The max number of items in each chunk
+    :type chunk_size: int
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _chunked_queryset(queryset, chunk_size):
+    """
+    Splits a queryset into lists of at most `chunk_size` records, paging by primary key so that no
+    database cursor is held open between chunks. On SQLite, an open cursor prevents the temporary
+    tables used while processing a chunk from being dropped
+
+    :param queryset: The queryset to split
+    :type queryset: django.db.models.QuerySet
+    :param chunk_size: The max number of records in each chunk
+    :type chunk_size: int
+    """
+    queryset = queryset.order_by("pk")
+    chunk = list(queryset[:chunk_size])
+    while chunk:
+        yield chunk
+        chunk = list(queryset.filter(pk__gt=chunk[-1].pk)[:chunk_size])
+
+
 @contextmanager
 def _begin_transaction(sync_filter, isolated=False, shared_lock=False):
     """
@@ -118,7 +156,142 @@ def _begin_transaction(sync_filter, isolated=False, shared_lock=False):
             yield
 
 
-def _serialize_into_store(profile, filter=None):
+def _bulk_update_serialized_store_records(store_records, current_id):
+    """
+    Writes a set of already existing, re-serialized store records back to the database, and creates or
+    updates their record max counters for the current instance, using a constant number of queries
+    regardless of the number of records.
+
+    :param store_records: A list of ``Store`` instances which have been updated in memory
+    :type store_records: list[Store]
+    :param current_id: The current instance ID model, with its counter
+    :type current_id: InstanceIDModel
+    """
+    if not store_records:
+        return
+
+    store_ids = [store_model.id for store_model in store_records]
+
+    # write all the updated store records in one go
+    fields = Store._meta.fields
+    db_values = []
+    for store_model in store_records:
+        for f in fields:
+            db_values.append(
+                f.get_db_prep_value(getattr(store_model, f.attname), connection)
+            )
+    with connection.cursor() as cursor:
+        DBBackend._bulk_full_record_upsert(
+            cursor, Store._meta.db_table, fields, db_values
+        )
+
+    # update rmcs counters for store records that have our instance id
+    existing_rmcs = RecordMaxCounter.objects.filter(
+        instance_id=current_id.id, store_model_id__in=store_ids
+    )
+    existing_rmc_ids = set(existing_rmcs.values_list("store_model_id", flat=True))
+    existing_rmcs.update(counter=current_id.counter)
+    # bulk create rmcs for store records that don't have one for our instance id
+    RecordMaxCounter.objects.bulk_create(
+        [
+            RecordMaxCounter(
+                store_model_id=store_id,
+                instance_id=current_id.id,
+                counter=current_id.counter,
+            )
+            for store_id in store_ids
+            if store_id not in existing_rmc_ids
+        ]
+    )
+
+
+_SERIALIZATION_EXECUTORS = {
+    # worker processes are spawned rather than forked, because the pool is used within the
+    # serialization transaction, and forked processes would share its database connection
+    "process": functools.partial(
+        ProcessPoolExecutor, mp_context=multiprocessing.get_context("spawn")
+    ),
+    "thread": ThreadPoolExecutor,
+}
+
+
+@contextmanager
+def _serialization_executor():
+    """
+    Context manager of the pool that encodes serialized data in parallel, configured by the
+    `MORANGO_SERIALIZATION_WORKERS` and `MORANGO_SERIALIZATION_EXECUTOR` settings. A "thread" pool
+    is the default. A "process" pool spawns fresh interpreters, which only import
+    `morango.serialization`, so the main module of the program must be safe to import, as with any
+    use of the "spawn" start method.
+
+    :return: The pool, or None when parallel serialization is disabled
+    :rtype: concurrent.futures.Executor|None
+    """
+    workers = SETTINGS.MORANGO_SERIALIZATION_WORKERS
+    if not workers:
+        yield None
+        return
+
+    executor_name = SETTINGS.MORANGO_SERIALIZATION_EXECUTOR
+    _assert(
+        executor_name in _SERIALIZATION_EXECUTORS,
+        "Invalid MORANGO_SERIALIZATION_EXECUTOR: {}".format(executor_name),
+        error_type=ValueError,
+    )
+    with _SERIALIZATION_EXECUTORS[executor_name](max_workers=workers) as executor:
+        yield executor
+
+
+def _encode_serialized_chunks(chunks, executor=None):
+    """
+    Reads the existing store records of chunks of app models, and encodes the app models' serialized
+    data. With an executor, the encoding of up to two chunks per worker runs ahead of the chunk that
+    is yielded, so the caller's writes overlap with it.
+
+    :param chunks: An iterable of lists of app models
+    :param executor: The pool to encode on, or None to encode in the calling thread
+    :type executor: concurrent.futures.Executor|None
+    :return: A generator of tuples of a chunk's app models, a dict of their existing store records
+        by ID, and a list of their encoded serialized data, in the order of the chunks
+    """
+    max_pending = 2 * SETTINGS.MORANGO_SERIALIZATION_WORKERS
+    # resolve the codec here, so workers don't depend on the settings
+    codec_name = get_codec().name
+    pending = deque()
+    for app_models in chunks:
+        store_records_dict = Store.objects.in_bulk(
+            id_list=[app_model.id for app_model in app_models]
+        )
+        payloads = [
+            (
+                app_model.serialize(),
+                getattr(store_records_dict.get(app_model.id), "serialized", None),
+            )
+            for app_model in app_models
+        ]
+        if executor is None:
+            yield app_models, store_records_dict, encode_serialized_data(
+                payloads, codec_name
+            )
+            continue
+
+        pending.append(
+            (
+                app_models,
+                store_records_dict,
+                executor.submit(encode_serialized_data, payloads, codec_name),
+            )
+        )
+        if len(pending) >= max_pending:
+            app_models, store_records_dict, future = pending.popleft()
+            yield app_models, store_records_dict, future.result()
+
+    while pending:
+        app_models, store_records_dict, future = pending.popleft()
+        yield app_models, store_records_dict, future.result()
+
+
+def _serialize_into_store(profile, filter=None, chunk_size=None):
     """
     Takes data from app layer and serializes the models into the store.
 
@@ -126,13 +299,38 @@ def _serialize_into_store(profile, filter=None):
 
     1. If there is a store record pertaining to that app model, we update the serialized store record with
     the latest changes from the model's fields. We also update the counter's based on this device's current Instance ID.
+    The updated store records and their record max counters are then written in bulk on a per class model basis.
+    If the latest changes leave the serialized store record as it was, the store record is left untouched, so no new
+    version of it is synced.
     2. If there is no store record for this app model, we proceed to create an in memory store model and append to a list to be
     bulk created on a per class model basis.
+
+    App models are streamed from the database and processed in chunks of `chunk_size`, so memory usage is
+    bounded by the chunk size rather than by the number of dirty app models.
+
+    When `MORANGO_SERIALIZATION_WORKERS` is set, the JSON encoding of the chunks is fanned out to a pool of
+    that many workers, while the writes are still applied here, in the one transaction holding the partition
+    locks, with the one counter of the current instance.
+
+    :param profile: The profile of the syncable models to serialize
+    :param filter: The filter for limiting the partitions to serialize
+    :type filter: morango.models.certificates.Filter|None
+    :param chunk_size: The number of app models to process at a time, defaults to the
+        `MORANGO_SERIALIZATION_CHUNK_SIZE` setting
+    :type chunk_size: int|None
+    :return: A counter of the app models whose store records were `created`, `updated`, or left
+        `unchanged`
+    :rtype: collections.Counter
     """
+    chunk_size = chunk_size or SETTINGS.MORANGO_SERIALIZATION_CHUNK_SIZE
+
     # ensure that we write and retrieve the counter in one go for consistency
     current_id = InstanceIDModel.get_current_instance_and_increment_counter()
+    counts = Counter()
 
-    with _begin_transaction(filter, isolated=True):
+    with _serialization_executor() as executor, _begin_transaction(
+        filter, isolated=True
+    ):
         # create Q objects for filtering by prefixes
         prefix_condition = None
         if filter:
@@ -143,80 +341,92 @@ def _serialize_into_store(profile, filter=None):
 
         # filter through all models with the dirty bit turned on
         for model in syncable_models.get_models(profile):
-            new_store_records = []
-            new_rmc_records = []
             klass_queryset = model.objects.filter(_morango_dirty_bit=True)
             if prefix_condition:
                 klass_queryset = klass_queryset.filter(prefix_condition)
-            store_records_dict = Store.objects.in_bulk(
-                id_list=klass_queryset.values_list("id", flat=True)
-            )
-            for app_model in klass_queryset:
-                try:
-                    store_model = store_records_dict[app_model.id]
-
-                    # if store record dirty and app record dirty, append store serialized to conflicting data
-                    if store_model.dirty_bit:
-                        store_model.conflicting_serialized_data = (
-                            store_model.serialized
-                            + "\n"
-                            + store_model.conflicting_serialized_data
-                        )
-                        store_model.dirty_bit = False
-
-                    # set new serialized data on this store model
-                    ser_dict = json.loads(store_model.serialized)
-                    ser_dict.update(app_model.serialize())
-                    store_model.serialized = DjangoJSONEncoder().encode(ser_dict)
-
-                    # create or update instance and counter on the record max counter for this store model
-                    RecordMaxCounter.objects.update_or_create(
-                        defaults={"counter": current_id.counter},
-                        instance_id=current_id.id,
-                        store_model_id=store_model.id,
-                    )
+            self_ref_fk = _self_referential_fk(model)
+
+            for app_models, store_records_dict, encoded in _encode_serialized_chunks(
+                _chunked_iterable(
+                    klass_queryset.iterator(chunk_size=chunk_size), chunk_size
+                ),
+                executor=executor,
+            ):
+                new_store_records = []
+                new_rmc_records = []
+                updated_store_records = []
+                for app_model, serialized in zip(app_models, encoded):
+                    try:
+                        store_model = store_records_dict[app_model.id]
+
+                        # if the app model was saved without changes, there's no new version of it to
+                        # record, so only its dirty bit gets cleared below
+                        if (
+                            serialized == store_model.serialized
+                            and not store_model.dirty_bit
+                            and not store_model.deleted
+                            and not store_model.hard_deleted
+                        ):
+                            counts["unchanged"] += 1
+                            continue
+
+                        # if store record dirty and app record dirty, append store serialized to conflicting data
+                        if store_model.dirty_bit:
+                            store_model.conflicting_serialized_data = (
+                                store_model.serialized
+                                + "\n"
+                                + store_model.conflicting_serialized_data
+                            )
+                            store_model.dirty_bit = False
 
-                    # update last saved bys for this store model
-                    store_model.last_saved_instance = current_id.id
-                    store_model.last_saved_counter = current_id.counter
-                    # update deleted flags in case it was previously deleted
-                    store_model.deleted = False
-                    store_model.hard_deleted = False
-                    # clear last_transfer_session_id
-                    store_model.last_transfer_session_id = None
-
-                    # update this model
-                    store_model.save()
-
-                except KeyError:
-                    kwargs = {
-                        "id": app_model.id,
-                        "serialized": DjangoJSONEncoder().encode(app_model.serialize()),
-                        "last_saved_instance": current_id.id,
-                        "last_saved_counter": current_id.counter,
-                        "model_name": app_model.morango_model_name,
-                        "profile": app_model.morango_profile,
-                        "partition": app_model._morango_partition,
-                        "source_id": app_model._morango_source_id,
-                    }
-                    # check if model has FK pointing to it and add the value to a field on the store
-                    self_ref_fk = _self_referential_fk(model)
-                    if self_ref_fk:
-                        self_ref_fk_value = getattr(app_model, self_ref_fk)
-                        kwargs.update({"_self_ref_fk": self_ref_fk_value or ""})
-                    # create store model and record max counter for the app model
-                    new_store_records.append(Store(**kwargs))
-                    new_rmc_records.append(
-                        RecordMaxCounter(
-                            store_model_id=app_model.id,
-                            instance_id=current_id.id,
-                            counter=current_id.counter,
+                        # set new serialized data on this store model
+                        store_model.serialized = serialized
+
+                        # update last saved bys for this store model
+                        store_model.last_saved_instance = current_id.id
+                        store_model.last_saved_counter = current_id.counter
+                        # update deleted flags in case it was previously deleted
+                        store_model.deleted = False
+                        store_model.hard_deleted = False
+                        # clear last_transfer_session_id
+                        store_model.last_transfer_session_id = None
+
+                        # defer the write so all updated records are saved in bulk
+                        updated_store_records.append(store_model)
+                        counts["updated"] += 1
+
+                    except KeyError:
+                        kwargs = {
+                            "id": app_model.id,
+                            "serialized": serialized,
+                            "last_saved_instance": current_id.id,
+                            "last_saved_counter": current_id.counter,
+                            "model_name": app_model.morango_model_name,
+                            "profile": app_model.morango_profile,
+                            "partition": app_model._morango_partition,
+                            "source_id": app_model._morango_source_id,
+                        }
+                        # check if model has FK pointing to it and add the value to a field on the store
+                        if self_ref_fk:
+                            self_ref_fk_value = getattr(app_model, self_ref_fk)
+                            kwargs.update({"_self_ref_fk": self_ref_fk_value or ""})
+                        # create store model and record max counter for the app model
+                        new_store_records.append(Store(**kwargs))
+                        counts["created"] += 1
+                        new_rmc_records.append(
+                            RecordMaxCounter(
+                                store_model_id=app_model.id,
+                                instance_id=current_id.id,
+                                counter=current_id.counter,
+                            )
                         )
-                    )
 
-            # bulk create store and rmc records for this class
-            Store.objects.bulk_create(new_store_records)
-            RecordMaxCounter.objects.bulk_create(new_rmc_records)
+                # bulk update existing store records and their rmcs for this chunk
+                _bulk_update_serialized_store_records(updated_store_records, current_id)
+
+                # bulk create store and rmc records for this chunk
+                Store.objects.bulk_create(new_store_records)
+                RecordMaxCounter.objects.bulk_create(new_rmc_records)
 
             # set dirty bit to false for all instances of this model
             klass_queryset.update(update_dirty_bit_to=False)
@@ -279,22 +489,30 @@ def _serialize_into_store(profile, filter=None):
                     partition=f,
                     defaults={"counter": current_id.counter},
                 )
+        DatabaseMaxCounter.clear_fsic_cache()
+
+    logger.debug(
+        "[morango] Serialized {} new and {} updated records, skipped {} unchanged".format(
+            counts["created"], counts["updated"], counts["unchanged"]
+        )
+    )
+    return counts
 
 
-def _validate_missing_store_foreign_keys(from_model_name, to_model_name, temp_table):
+def _validate_missing_store_foreign_keys(from_model_name, to_model_name, temp_table, errors):
     """
     Performs validation on a bulk set of foreign keys (FKs), given a temp table with two columns,
     `from_pk` and `to_pk`, the primary key (PK) pair to validate. Any store record matching
-    `from_pk`, while missing a store record matching `to_pk`, will be updated with a deserialization
-    error and its PK returned within a list.
+    `from_pk`, while missing a store record matching `to_pk`, has an error added for the FK's field.
 
     :param from_model_name: A str name of the model which has the FK, for logging purposes
     :param to_model_name: A str name of the model referenced by the FK, for logging purposes
     :param temp_table: A temp table object for querying against in the DB
     :type temp_table: morango.sync.backends.utils.TemporaryTable
-    :return: A list of store PKs that have broken FKs
+    :param errors: A dict of dicts of error messages keyed by FK field, keyed by the store PKs that
+        have broken FKs, which is updated in place
+    :type errors: dict
     """
-    invalid_pks = []
     select_sql = """
         SELECT t.from_field, t.from_pk, t.to_pk
         FROM {temp_table} t
@@ -309,25 +527,17 @@ def _validate_missing_store_foreign_keys(from_model_name, to_model_name, temp_ta
         pk_field=Store._meta.pk.column,
     )
 
-    store_deserialization_error = next(
-        f for f in Store._meta.fields if f.name == "deserialization_error"
-    )
-    store_update_fields = [Store._meta.pk, store_deserialization_error]
-
     from_pk_field = temp_table.get_field("from_pk")
     to_pk_field = temp_table.get_field("to_pk")
-    update_values = []
     with connection.cursor() as c:
         c.execute(select_sql)
         for from_field, from_pk, to_pk in c.fetchall():
-            err = dict(
-                {
-                    from_field: "{to_model_name} instance with id '{to_pk}' does not exist".format(
-                        to_model_name=to_model_name,
-                        to_pk=to_pk_field.to_python(to_pk),
-                    )
-                }
-            )
+            err = {
+                from_field: "{to_model_name} instance with id '{to_pk}' does not exist".format(
+                    to_model_name=to_model_name,
+                    to_pk=to_pk_field.to_python(to_pk),
+                )
+            }
             logger.warning(
                 "Error deserializing instance of {from_model} with id {from_pk}: {err}".format(
                     from_model=from_model_name,
@@ -335,14 +545,7 @@ def _validate_missing_store_foreign_keys(from_model_name, to_model_name, temp_ta
                     err=str(err),
                 )
             )
-            update_values.extend([from_pk, str(err)])
-            invalid_pks.append(from_pk_field.to_python(from_pk))
-        if update_values:
-            # update Store with errors
-            DBBackend._bulk_update(
-                c, Store._meta.db_table, store_update_fields, update_values
-            )
-    return invalid_pks
+            errors.setdefault(from_pk_field.to_python(from_pk), {}).update(err)
 
 
 def _handle_deleted_store_foreign_keys(temp_table):
@@ -404,9 +607,10 @@ def _validate_store_foreign_keys(from_model_name, fk_references):
     :param from_model_name: A str name of the model which has the FKs, for logging purposes
     :param fk_references: A dictionary of lists containing `morango.models.core.ForeignKeyReference`
         keyed by the
-    :return: A tuple of two lists containing store PKs with broken FKs and FKs to deleted records
+    :return: A tuple of a dict of the error messages of store PKs with broken FKs, and a list of
+        store PKs with FKs to deleted records
     """
-    exclude_pks = []
+    fk_errors = {}
     deleted_pks = []
 
     for to_model_name, to_fk_references in fk_references.items():
@@ -420,37 +624,219 @@ def _validate_store_foreign_keys(from_model_name, fk_references):
             # insert all the FK references into a temp table in the database
             temp_table.bulk_insert([fks._asdict() for fks in to_fk_references])
             # now pass the temp table to validate against broken FKs
-            exclude_pks.extend(
-                _validate_missing_store_foreign_keys(
-                    from_model_name, to_model_name, temp_table
-                )
+            _validate_missing_store_foreign_keys(
+                from_model_name, to_model_name, temp_table, fk_errors
             )
             # find any FKs referencing deleted records
             deleted_pks.extend(_handle_deleted_store_foreign_keys(temp_table))
 
-    return exclude_pks, deleted_pks
+    errors = {store_pk: str(err) for store_pk, err in fk_errors.items()}
+    return errors, deleted_pks
+
+
+def _update_store_deserialization_errors(errors):
+    """
+    Bulk updates the deserialization errors of store records
+
+    :param errors: A dict of error messages keyed by store PK
+    :type errors: dict
+    """
+    if not errors:
+        return
+
+    store_deserialization_error = next(
+        f for f in Store._meta.fields if f.name == "deserialization_error"
+    )
+    store_update_fields = [Store._meta.pk, store_deserialization_error]
+    update_values = []
+    for store_pk, error in errors.items():
+        update_values.extend(
+            [Store._meta.pk.get_db_prep_value(store_pk, connection), error]
+        )
+    with connection.cursor() as c:
+        DBBackend._bulk_update(
+            c, Store._meta.db_table, store_update_fields, update_values
+        )
+
+
+def _overrides_save(model):
+    """
+    :param model: A syncable model class
+    :return: Whether the model customizes `save`, so its app models must be saved one by one
+        rather than written in bulk
+    """
+    return model.save is not SyncableModel.save
+
+
+def _deserialize_self_referential_store_models(
+    model, store_models, fk_cache, excluded_list, chunk_size
+):
+    """
+    Deserializes the dirty store records of a model with a foreign key (FK) reference to itself. The
+    tree of records is walked level by level, such that parents are always written to the app layer
+    before their children are validated. The levels are worked out once, as lists of the primary
+    keys of their records, starting from the dirty records whose parents are clean. Each level is
+    then deserialized in chunks of `chunk_size`, so memory usage is bounded by the chunk size and the
+    primary keys rather than by the store records. App models are written in bulk, unless their
+    model overrides `save`, in which case they're saved one by one, with signals muted.
+
+    :param model: The syncable model class with the self referential FK
+    :param store_models: A ``Store`` queryset of the records for the model
+    :type store_models: django.db.models.QuerySet
+    :param fk_cache: A cache for FK lookups, which is prefetched for each chunk
+    :type fk_cache: morango.models.fk_cache.ForeignKeyCache
+    :param excluded_list: A set of store PKs that failed to deserialize, which is updated in place
+    :type excluded_list: set
+    :param chunk_size: The max number of store records to process at a time
+    :type chunk_size: int
+    """
+    # the first level is the dirty records that have no parent, or that have a clean parent
+    level_ids = list(
+        store_models.filter(dirty_bit=True)
+        .filter(
+            Q(_self_ref_fk="")
+            | Q(_self_ref_fk__in=store_models.filter(dirty_bit=False).char_ids_list())
+        )
+        .values_list("id", flat=True)
+    )
+    # and the next levels are the dirty children of the records deserialized in the previous one
+    dirty_children_ids = defaultdict(list)
+    for store_model_id, parent_id in (
+        store_models.filter(dirty_bit=True)
+        .exclude(_self_ref_fk="")
+        .values_list("id", "_self_ref_fk")
+    ):
+        dirty_children_ids[parent_id].append(store_model_id)
+
+    while level_ids:
+        deserialized_level_ids = []
+        for ids_chunk in _chunked_iterable(level_ids, chunk_size):
+            # records that failed to deserialize are only retried by a later deserialization
+            store_models_chunk = [
+                store_model
+                for store_model in store_models.filter(id__in=ids_chunk)
+                if store_model.id not in excluded_list
+            ]
+            if not store_models_chunk:
+                continue
+
+            db_values = defaultdict(list)
+            deserialized_ids = []
+            errors = {}
+            # look up the existence of all the FK targets of the chunk at once
+            fk_cache.prefetch(store_models_chunk)
+            for store_model in store_models_chunk:
+                try:
+                    app_model, _ = store_model._deserialize_store_model(fk_cache)
+                    if app_model and _overrides_save(type(app_model)):
+                        with mute_signals(signals.pre_save, signals.post_save):
+                            app_model.save(update_dirty_bit_to=False)
+                    elif app_model:
+                        # handle any errors that might come from `get_db_prep_value`
+                        new_db_values = [
+                            f.get_db_prep_value(getattr(app_model, f.attname), connection)
+                            for f in app_model._meta.fields
+                        ]
+                        db_values[type(app_model)].extend(new_db_values)
+                    deserialized_ids.append(store_model.id)
+                except (
+                    exceptions.ValidationError,
+                    exceptions.ObjectDoesNotExist,
+                    ValueError,
+                ) as e:
+                    # if the app model did not validate, we leave the store dirty bit set, but mark the error
+                    errors[store_model.id] = str(e)
+                    # it may have been cached as existing once its fields were cleaned
+                    klass = syncable_models.get_model(store_model.profile, store_model.model_name)
+                    fk_cache.pop((klass._meta.db_table, store_model.id), None)
+
+            for klass, klass_db_values in db_values.items():
+                with connection.cursor() as cursor:
+                    DBBackend._bulk_full_record_upsert(
+                        cursor, klass._meta.db_table, klass._meta.fields, klass_db_values
+                    )
+
+            # we update store models after we have deserialized them to be able to mark them as clean parents
+            if deserialized_ids:
+                deserialized_level_ids.extend(deserialized_ids)
+                store_models.filter(id__in=deserialized_ids).update(
+                    dirty_bit=False, deserialization_error=""
+                )
+            _update_store_deserialization_errors(errors)
+            excluded_list.update(errors)
+
+        level_ids = [
+            child_id
+            for parent_id in deserialized_level_ids
+            for child_id in dirty_children_ids.pop(parent_id, [])
+        ]
+
+    # A. Mark records that were skipped due to missing parents with error info
+    for store_models_chunk in _chunked_queryset(
+        store_models.filter(dirty_bit=True).only("id", "_self_ref_fk"), chunk_size
+    ):
+        skipped = [
+            store_model
+            for store_model in store_models_chunk
+            if store_model.id not in excluded_list
+        ]
+        existing_parent_ids = set(
+            store_models.filter(
+                id__in={store_model._self_ref_fk for store_model in skipped} - {""}
+            ).char_ids_list()
+        )
+        parent_is_dirty_ids = []
+        parent_does_not_exist_ids = []
+        for store_model in skipped:
+            # A(i). The ones that have a parent Store entry but it's dirty
+            if store_model._self_ref_fk in existing_parent_ids:
+                parent_is_dirty_ids.append(store_model.id)
+            # A(ii). The ones that don't even have Store entries for parent at all
+            else:
+                parent_does_not_exist_ids.append(store_model.id)
+
+        for child_ids, error in (
+            (parent_is_dirty_ids, "Parent is dirty; could not deserialize."),
+            (
+                parent_does_not_exist_ids,
+                "Parent does not exist in Store; could not deserialize.",
+            ),
+        ):
+            if child_ids:
+                store_models.filter(id__in=child_ids).update(
+                    deserialization_error=error
+                )
 
 
-def _deserialize_from_store(profile, skip_erroring=False, filter=None):
+def _deserialize_from_store(profile, skip_erroring=False, filter=None, chunk_size=None):
     """
     Takes data from the store and integrates into the application.
 
     ALGORITHM: On a per syncable model basis, we iterate through each class model and we go through 2 possible cases:
 
-    1. For class models that have a self referential foreign key, we iterate down the dependency tree deserializing model by model.
-    2. On a per app model basis, we append the field values to a single list, and do a single bulk insert/replace query.
+    1. For class models that have a self referential foreign key, we iterate down the dependency tree deserializing level by level.
+    2. On a per app model basis, we append the field values to a list, and do a bulk insert/replace query for every chunk of
+    `chunk_size` store records, so memory usage is bounded by the chunk size rather than by the number of dirty store records.
 
     If a model fails to deserialize/validate, we exclude it from being marked as clean in the store.
+
+    :param profile: The profile of the syncable models to deserialize
+    :param skip_erroring: Whether to skip store records that previously failed to deserialize
+    :type skip_erroring: bool
+    :param filter: The filter for limiting the partitions to deserialize
+    :type filter: morango.models.certificates.Filter|None
+    :param chunk_size: The number of store records to process at a time, defaults to the
+        `MORANGO_DESERIALIZATION_CHUNK_SIZE` setting
+    :type chunk_size: int|None
     """
+    chunk_size = chunk_size or SETTINGS.MORANGO_DESERIALIZATION_CHUNK_SIZE
 
-    fk_cache = {}
-    excluded_list = []
-    deleted_list = []
+    excluded_list = set()
+    deleted_list = set()
 
-    with _begin_transaction(filter, isolated=True):
+    with ForeignKeyCache() as fk_cache, _begin_transaction(filter, isolated=True):
         # iterate through classes which are in foreign key dependency order
         for model in syncable_models.get_models(profile):
-            deferred_fks = defaultdict(list)
             store_models = Store.objects.filter(profile=profile)
 
             model_condition = Q(model_name=model.morango_model_name)
@@ -473,141 +859,198 @@ def _deserialize_from_store(profile, skip_erroring=False, filter=None):
 
             # handle cases where a class has a single FK reference to itself
             if _self_referential_fk(model):
-                clean_parents = store_models.filter(dirty_bit=False).char_ids_list()
-                dirty_children = (
-                    store_models.filter(dirty_bit=True)
-                    # handle parents or if the model has no parent
-                    .filter(Q(_self_ref_fk__in=clean_parents) | Q(_self_ref_fk=""))
+                _deserialize_self_referential_store_models(
+                    model, store_models, fk_cache, excluded_list, chunk_size
                 )
 
-                # keep iterating until size of dirty_children is 0
-                while len(dirty_children) > 0:
-                    for store_model in dirty_children:
+            else:
+                fields = model._meta.fields
+                for store_models_chunk in _chunked_queryset(
+                    store_models.filter(dirty_bit=True), chunk_size
+                ):
+                    # collect all initially valid app models, and the errors of the others, which
+                    # are written with a single update per chunk
+                    app_models = []
+                    deferred_fks = defaultdict(list)
+                    errors = {}
+                    for store_model in store_models_chunk:
                         try:
-                            app_model, _ = store_model._deserialize_store_model(
-                                fk_cache
+                            (
+                                app_model,
+                                model_deferred_fks,
+                            ) = store_model._deserialize_store_model(
+                                fk_cache, defer_fks=True
                             )
                             if app_model:
-                                with mute_signals(signals.pre_save, signals.post_save):
-                                    app_model.save(update_dirty_bit_to=False)
-                            # we update a store model after we have deserialized it to be able to mark it as a clean parent
-                            store_model.dirty_bit = False
-                            store_model.deserialization_error = ""
-                            store_model.save(
-                                update_fields=["dirty_bit", "deserialization_error"]
-                            )
+                                app_models.append(app_model)
+                            for fk_model, fk_refs in model_deferred_fks.items():
+                                # validate that the FK references aren't to anything already in the
+                                # excluded list, which should only contain models which failed to
+                                # deserialize for reasons other than broken FKs at this point
+                                for fk_ref in fk_refs:
+                                    if fk_ref.to_pk in excluded_list:
+                                        raise exceptions.ValidationError(
+                                            "{} with id {} failed to deserialize".format(
+                                                fk_model, fk_ref.to_pk
+                                            )
+                                        )
+                                deferred_fks[fk_model].extend(fk_refs)
                         except (
                             exceptions.ValidationError,
                             exceptions.ObjectDoesNotExist,
                             ValueError,
                         ) as e:
-                            excluded_list.append(store_model.id)
-                            # if the app model did not validate, we leave the store dirty bit set, but mark the error
-                            store_model.deserialization_error = str(e)
-                            store_model.save(update_fields=["deserialization_error"])
-
-                    # update lists with new clean parents and dirty children
-                    clean_parents = store_models.filter(dirty_bit=False).char_ids_list()
-                    dirty_children = store_models.filter(
-                        dirty_bit=True, _self_ref_fk__in=clean_parents
-                    ).exclude(id__in=excluded_list)
-
-                # A. Mark records that were skipped due to missing parents with error info
-                # A(i). The ones that have a parent Store entry but it's dirty
-                dirty_parents = store_models.filter(dirty_bit=True).char_ids_list()
-                store_models.filter(
-                    dirty_bit=True, _self_ref_fk__in=dirty_parents
-                ).exclude(id__in=excluded_list).update(
-                    deserialization_error="Parent is dirty; could not deserialize."
-                )
-                # A(ii). The ones that don't even have Store entries for parent at all
-                all_parents = store_models.char_ids_list()
-                store_models.filter(dirty_bit=True).exclude(
-                    _self_ref_fk__in=all_parents
-                ).exclude(id__in=excluded_list).update(
-                    deserialization_error="Parent does not exist in Store; could not deserialize."
-                )
+                            # if the app model did not validate, we leave the store dirty bit set
+                            excluded_list.add(store_model.id)
+                            errors[store_model.id] = str(e)
 
-            else:
-                # collect all initially valid app models
-                app_models = []
-                fields = model._meta.fields
-                for store_model in store_models.filter(dirty_bit=True):
-                    try:
-                        (
-                            app_model,
-                            model_deferred_fks,
-                        ) = store_model._deserialize_store_model(
-                            fk_cache, defer_fks=True
-                        )
-                        if app_model:
-                            app_models.append(app_model)
-                        for fk_model, fk_refs in model_deferred_fks.items():
-                            # validate that the FK references aren't to anything already in the
-                            # excluded list, which should only contain models which failed to
-                            # deserialize for reasons other than broken FKs at this point
-                            for fk_ref in fk_refs:
-                                if fk_ref.to_pk in excluded_list:
-                                    raise exceptions.ValidationError(
-                                        "{} with id {} failed to deserialize".format(
-                                            fk_model, fk_ref.to_pk
-                                        )
-                                    )
-                            deferred_fks[fk_model].extend(fk_refs)
-                    except (
-                        exceptions.ValidationError,
-                        exceptions.ObjectDoesNotExist,
-                        ValueError,
-                    ) as e:
-                        # if the app model did not validate, we leave the store dirty bit set
-                        excluded_list.append(store_model.id)
-                        store_model.deserialization_error = str(e)
-                        store_model.save(update_fields=["deserialization_error"])
-
-                # validate app model FKs
-                model_excluded_pks, model_deleted_pks = _validate_store_foreign_keys(
-                    model.__name__, deferred_fks
-                )
-                excluded_list.extend(model_excluded_pks)
-                deleted_list.extend(model_deleted_pks)
-
-                # array for holding db values from the fields of each model for this class
-                db_values = []
-                for app_model in app_models:
-                    if (
-                        app_model.pk not in excluded_list
-                        and app_model.pk not in deleted_list
-                    ):
-                        # handle any errors that might come from `get_db_prep_value`
-                        try:
-                            new_db_values = []
-                            for f in fields:
-                                value = getattr(app_model, f.attname)
-                                db_value = f.get_db_prep_value(value, connection)
-                                new_db_values.append(db_value)
-                            db_values += new_db_values
-                        except ValueError as e:
-                            excluded_list.append(app_model.pk)
-                            store_model = store_models.get(pk=app_model.pk)
-                            store_model.deserialization_error = str(e)
-                            store_model.save(update_fields=["deserialization_error"])
-
-                if db_values:
-                    with connection.cursor() as cursor:
-                        DBBackend._bulk_full_record_upsert(
-                            cursor,
-                            model._meta.db_table,
-                            fields,
-                            db_values,
-                        )
+                    # validate app model FKs
+                    fk_errors, model_deleted_pks = _validate_store_foreign_keys(
+                        model.__name__, deferred_fks
+                    )
+                    errors.update(fk_errors)
+                    excluded_list.update(fk_errors)
+                    deleted_list.update(model_deleted_pks)
+
+                    # array for holding db values from the fields of each model for this chunk
+                    db_values = []
+                    for app_model in app_models:
+                        if (
+                            app_model.pk not in excluded_list
+                            and app_model.pk not in deleted_list
+                        ):
+                            # handle any errors that might come from `get_db_prep_value`
+                            try:
+                                new_db_values = []
+                                for f in fields:
+                                    value = getattr(app_model, f.attname)
+                                    db_value = f.get_db_prep_value(value, connection)
+                                    new_db_values.append(db_value)
+                                db_values += new_db_values
+                            except ValueError as e:
+                                excluded_list.add(app_model.pk)
+                                errors[app_model.pk] = str(e)
+
+                    if db_values:
+                        with connection.cursor() as cursor:
+                            DBBackend._bulk_full_record_upsert(
+                                cursor,
+                                model._meta.db_table,
+                                fields,
+                                db_values,
+                            )
+                    _update_store_deserialization_errors(errors)
 
                 # clear dirty bit for all store records for this model/profile except for rows that did not validate
                 store_models.exclude(id__in=excluded_list).filter(
                     dirty_bit=True
                 ).update(dirty_bit=False)
 
+        # keep the FK targets known to exist for later deserializations, once they're committed
+        fk_cache.publish()
+
+
+def _queue_fsics_into_buffer(transfersession, fsics, chunk_size=200):
+    """
+    Queues into the buffer the store records of the transfer session's profile which were saved by
+    an instance past the counter of a FSIC entry for a partition prefix. The FSIC entries are loaded
+    into a temporary table, so that the records under each partition prefix are selected by a single
+    join, regardless of the number of instances. Each partition prefix is queued with its own query,
+    matching it as a constant, so that the records can be looked up through the partition indexes.
+
+    :param transfersession: The TransferSession to queue records into the buffer for
+    :param fsics: An iterable of (partition prefix, instance ID, counter) tuples, with at most one
+        counter per partition prefix and instance
+    :param chunk_size: The number of FSIC entries inserted into the temporary table per query
+    """
+    with TemporaryTable(
+        connection,
+        "fsics",
+        partition=TextField(),
+        instance_id=UUIDField(),
+        counter=IntegerField(),
+    ) as temp_table:
+        partitions = set()
+        for chunk in _chunked_iterable(fsics, chunk_size):
+            temp_table.bulk_insert(
+                [
+                    dict(partition=partition, instance_id=instance_id, counter=counter)
+                    for partition, instance_id, counter in chunk
+                ]
+            )
+            partitions.update(partition for partition, _, _ in chunk)
+        temp_table.analyze()
+
+        transfer_session_id_type = TransferSession._meta.pk.rel_db_type(connection)
+
+        # take all records under the partition prefix that match its FSIC entry for their instance, to
+        # be put into the buffer for transfer, skipping those already queued for an overlapping prefix
+        select_buffer_query = """SELECT
+                store.id, store.serialized, store.deleted, store.last_saved_instance, store.last_saved_counter,
+                store.hard_deleted, store.model_name, store.profile, store.partition, store.source_id,
+                store.conflicting_serialized_data, CAST (%s AS {transfer_session_id_type}), store._self_ref_fk
+            FROM {fsics} AS f
+            INNER JOIN {store} AS store
+                ON store.last_saved_instance = f.instance_id
+                AND store.last_saved_counter > f.counter
+            WHERE f.partition = %s
+                AND store.profile = %s
+                AND store.partition LIKE %s ESCAPE '\\'
+                AND NOT EXISTS (
+                    SELECT 1 FROM {outgoing_buffer} AS buffer
+                    WHERE buffer.transfer_session_id = %s AND buffer.model_uuid = store.id
+                )
+        """.format(
+            transfer_session_id_type=transfer_session_id_type,
+            store=Store._meta.db_table,
+            fsics=temp_table.sql_name,
+            outgoing_buffer=Buffer._meta.db_table,
+        )
+
+        # take all record max counters that are foreign keyed onto store models, which were queued into the buffer
+        select_rmc_buffer_query = """SELECT instance_id, counter, CAST (%s AS {transfer_session_id_type}), store_model_id
+                FROM {record_max_counter} AS rmc
+                INNER JOIN {outgoing_buffer} AS buffer ON rmc.store_model_id = buffer.model_uuid
+                WHERE buffer.transfer_session_id = %s
+            """.format(
+            transfer_session_id_type=transfer_session_id_type,
+            record_max_counter=RecordMaxCounter._meta.db_table,
+            outgoing_buffer=Buffer._meta.db_table,
+        )
+
+        with connection.cursor() as cursor:
+            for partition in sorted(partitions):
+                cursor.execute(
+                    """INSERT INTO {outgoing_buffer}
+                       (model_uuid, serialized, deleted, last_saved_instance, last_saved_counter,
+                       hard_deleted, model_name, profile, partition, source_id, conflicting_serialized_data,
+                       transfer_session_id, _self_ref_fk)
+                       {select}
+                    """.format(
+                        outgoing_buffer=Buffer._meta.db_table,
+                        select=select_buffer_query,
+                    ),
+                    [
+                        transfersession.id,
+                        partition,
+                        transfersession.sync_session.profile,
+                        connection.ops.prep_for_like_query(partition) + "%",
+                        transfersession.id,
+                    ],
+                )
+            cursor.execute(
+                """INSERT INTO {outgoing_rmcb}
+                   (instance_id, counter, transfer_session_id, model_uuid)
+                   {select}
+                """.format(
+                    outgoing_rmcb=RecordMaxCounterBuffer._meta.db_table,
+                    select=select_rmc_buffer_query,
+                ),
+                [transfersession.id, transfersession.id],
+            )
+
 
-def _queue_into_buffer_v1(transfersession):
+def _queue_into_buffer_v1(transfersession, chunk_size=200):
     """
     Takes a chunk of data from the store to be put into the buffer to be sent to another morango instance. This is the legacy
     code to handle backwards compatibility with older versions of Morango, with the v1 version of the FSIC data structure.
@@ -630,108 +1073,18 @@ def _queue_into_buffer_v1(transfersession):
         if not fsics:
             return
 
-        profile_condition = [
-            "profile = '{}'".format(transfersession.sync_session.profile)
-        ]
-        partition_conditions = []
-        # create condition for filtering by partitions
-        for prefix in filter_prefixes:
-            partition_conditions += ["partition LIKE '{}%'".format(prefix)]
-        if filter_prefixes:
-            partition_conditions = [
-                _join_with_logical_operator(partition_conditions, "OR")
-            ]
-
-        chunk_size = 200
-        fsics = list(fsics.items())
-        fsics_len = len(fsics)
-        fsics_limit = chunk_size * SQL_UNION_MAX
-
-        if fsics_len >= fsics_limit:
-            raise MorangoLimitExceeded(
-                "Limit of {limit} instance counters exceeded with {actual}".format(
-                    limit=fsics_limit, actual=fsics_len
-                )
-            )
-
-        # chunk fsics creating multiple SQL selects which will be unioned before insert
-        i = 0
-        chunk = fsics[:chunk_size]
-        select_buffers = []
-
-        while chunk:
-            # create condition for all push FSICs where instance_ids are equal, but internal counters are higher than
-            # FSICs counters
-            last_saved_by_conditions = [
-                "(last_saved_instance = '{0}' AND last_saved_counter > {1})".format(
-                    instance, counter
-                )
-                for instance, counter in chunk
-            ]
-            if last_saved_by_conditions:
-                last_saved_by_conditions = [
-                    _join_with_logical_operator(last_saved_by_conditions, "OR")
-                ]
-
-            # combine conditions and filter by profile
-            where_condition = _join_with_logical_operator(
-                profile_condition + last_saved_by_conditions + partition_conditions,
-                "AND",
-            )
-
-            # execute raw sql to take all records that match condition, to be put into buffer for transfer
-            select_buffers.append(
-                """SELECT
-                       id, serialized, deleted, last_saved_instance, last_saved_counter, hard_deleted, model_name, profile,
-                       partition, source_id, conflicting_serialized_data,
-                       CAST ('{transfer_session_id}' AS {transfer_session_id_type}), _self_ref_fk
-                   FROM {store} WHERE {condition}
-                """.format(
-                    transfer_session_id=transfersession.id,
-                    transfer_session_id_type=TransferSession._meta.pk.rel_db_type(
-                        connection
-                    ),
-                    condition=where_condition,
-                    store=Store._meta.db_table,
-                )
-            )
-            i += chunk_size
-            chunk = fsics[i : i + chunk_size]
-
-        # take all record max counters that are foreign keyed onto store models, which were queued into the buffer
-        select_rmc_buffer_query = """SELECT instance_id, counter, CAST ('{transfer_session_id}' AS {transfer_session_id_type}), store_model_id
-                FROM {record_max_counter} AS rmc
-                INNER JOIN {outgoing_buffer} AS buffer ON rmc.store_model_id = buffer.model_uuid
-                WHERE buffer.transfer_session_id = '{transfer_session_id}'
-            """.format(
-            transfer_session_id=transfersession.id,
-            transfer_session_id_type=TransferSession._meta.pk.rel_db_type(connection),
-            record_max_counter=RecordMaxCounter._meta.db_table,
-            outgoing_buffer=Buffer._meta.db_table,
+        # the v1 FSIC applies its counters to every partition under the filter, so each instance
+        # counter is paired with each of the filter's prefixes
+        _queue_fsics_into_buffer(
+            transfersession,
+            (
+                (prefix, instance, counter)
+                for prefix in (set(filter_prefixes) or [""])
+                for instance, counter in fsics.items()
+            ),
+            chunk_size=chunk_size,
         )
 
-        with connection.cursor() as cursor:
-            cursor.execute(
-                """INSERT INTO {outgoing_buffer}
-                   (model_uuid, serialized, deleted, last_saved_instance, last_saved_counter,
-                   hard_deleted, model_name, profile, partition, source_id, conflicting_serialized_data,
-                   transfer_session_id, _self_ref_fk)
-                   {select}
-                """.format(
-                    outgoing_buffer=Buffer._meta.db_table,
-                    select=" UNION ".join(select_buffers),
-                )
-            )
-            cursor.execute(
-                """INSERT INTO {outgoing_rmcb}
-                   (instance_id, counter, transfer_session_id, model_uuid)
-                   {select}
-                """.format(
-                    outgoing_rmcb=RecordMaxCounterBuffer._meta.db_table,
-                    select=select_rmc_buffer_query,
-                )
-            )
-
 
 def _queue_into_buffer_v2(transfersession, chunk_size=200):
     """
@@ -774,144 +1127,109 @@ def _queue_into_buffer_v2(transfersession, chunk_size=200):
         if not fsics:
             return
 
-        profile_condition = [
-            "profile = '{}'".format(transfersession.sync_session.profile)
-        ]
-
-        fsics_len = sum(len(fsics[part]) for part in fsics) + len(fsics)
-        # subtract one because when partitions overflow chunks they add up to an extra item per chunk
-        fsics_limit = chunk_size * (SQL_UNION_MAX - 1)
-
-        if fsics_len >= fsics_limit:
-            raise MorangoLimitExceeded(
-                "Limit of {limit} instances + partitions exceeded with {actual}".format(
-                    limit=fsics_limit, actual=fsics_len
-                )
-            )
-
-        # if needed, split the fsics into chunks
-        if fsics_len > chunk_size:
-            chunked_fsics = chunk_fsic_v2(fsics, chunk_size)
-        else:
-            chunked_fsics = [fsics]
-
-        select_buffers = []
-
-        for fsic_chunk in chunked_fsics:
-
-            # create condition for filtering by partitions
-            partition_conditions = []
-            for part, insts in fsic_chunk.items():
-                if not insts:
-                    continue
-
-                partition_conditions.append(
-                    "partition LIKE '{}%' AND (".format(part)
-                    + _join_with_logical_operator(
-                        [
-                            "(last_saved_instance = '{}' AND last_saved_counter > {})".format(
-                                inst, counter
-                            )
-                            for inst, counter in insts.items()
-                        ],
-                        "OR",
-                    )
-                    + ")"
-                )
-
-            partition_conditions = [
-                _join_with_logical_operator(partition_conditions, "OR")
-            ]
-
-            # combine conditions and filter by profile
-            where_condition = _join_with_logical_operator(
-                profile_condition + partition_conditions, "AND"
-            )
-
-            # execute raw sql to take all records that match condition, to be put into buffer for transfer
-            select_buffers.append(
-                """SELECT
-                        id, serialized, deleted, last_saved_instance, last_saved_counter, hard_deleted, model_name, profile,
-                        partition, source_id, conflicting_serialized_data,
-                        CAST ('{transfer_session_id}' AS {transfer_session_id_type}), _self_ref_fk
-                    FROM {store} WHERE {condition}
-                """.format(
-                    transfer_session_id=transfersession.id,
-                    transfer_session_id_type=TransferSession._meta.pk.rel_db_type(
-                        connection
-                    ),
-                    condition=where_condition,
-                    store=Store._meta.db_table,
-                )
-            )
-
-        # take all record max counters that are foreign keyed onto store models, which were queued into the buffer
-        select_rmc_buffer_query = """SELECT instance_id, counter, CAST ('{transfer_session_id}' AS {transfer_session_id_type}), store_model_id
-                FROM {record_max_counter} AS rmc
-                INNER JOIN {outgoing_buffer} AS buffer ON rmc.store_model_id = buffer.model_uuid
-                WHERE buffer.transfer_session_id = '{transfer_session_id}'
-            """.format(
-            transfer_session_id=transfersession.id,
-            transfer_session_id_type=TransferSession._meta.pk.rel_db_type(connection),
-            record_max_counter=RecordMaxCounter._meta.db_table,
-            outgoing_buffer=Buffer._meta.db_table,
+        _queue_fsics_into_buffer(
+            transfersession,
+            (
+                (part, inst, counter)
+                for part, insts in fsics.items()
+                for inst, counter in insts.items()
+            ),
+            chunk_size=chunk_size,
         )
 
-        with connection.cursor() as cursor:
-            cursor.execute(
-                """INSERT INTO {outgoing_buffer}
-                   (model_uuid, serialized, deleted, last_saved_instance, last_saved_counter,
-                   hard_deleted, model_name, profile, partition, source_id, conflicting_serialized_data,
-                   transfer_session_id, _self_ref_fk)
-                   {select}
-                """.format(
-                    outgoing_buffer=Buffer._meta.db_table,
-                    select=" UNION ".join(select_buffers),
-                )
-            )
-            cursor.execute(
-                """INSERT INTO {outgoing_rmcb}
-                   (instance_id, counter, transfer_session_id, model_uuid)
-                   {select}
-                """.format(
-                    outgoing_rmcb=RecordMaxCounterBuffer._meta.db_table,
-                    select=select_rmc_buffer_query,
-                )
-            )
-
 
 def _dequeue_into_store(transfer_session, fsic, v2_format=False):
     """
     Takes data from the buffers and merges into the store and record max counters.
 
-    ALGORITHM: Incrementally insert and delete on a case by case basis to ensure subsequent cases
-    are not affected by previous cases.
+    ALGORITHM: With the default `stepwise` engine, incrementally insert and delete on a case by case basis
+    to ensure subsequent cases are not affected by previous cases. With the `merge` engine, selected by the
+    `MORANGO_DEQUEUE_ENGINE` setting, classify each buffered record once and then apply each class in bulk.
     """
 
     with _begin_transaction(Filter(transfer_session.filter)):
         with connection.cursor() as cursor:
-            DBBackend._dequeuing_delete_rmcb_records(cursor, transfer_session.id)
-            DBBackend._dequeuing_delete_buffered_records(cursor, transfer_session.id)
-            current_id = InstanceIDModel.get_current_instance_and_increment_counter()
-            DBBackend._dequeuing_merge_conflict_buffer(
-                cursor, current_id, transfer_session.id
-            )
-            DBBackend._dequeuing_merge_conflict_rmcb(cursor, transfer_session.id)
-            DBBackend._dequeuing_update_rmcs_last_saved_by(
-                cursor, current_id, transfer_session.id
-            )
-            DBBackend._dequeuing_delete_mc_rmcb(cursor, transfer_session.id)
-            DBBackend._dequeuing_delete_mc_buffer(cursor, transfer_session.id)
-            DBBackend._dequeuing_insert_remaining_buffer(cursor, transfer_session.id)
-            DBBackend._dequeuing_insert_remaining_rmcb(cursor, transfer_session.id)
-            DBBackend._dequeuing_delete_remaining_rmcb(cursor, transfer_session.id)
-            DBBackend._dequeuing_delete_remaining_buffer(cursor, transfer_session.id)
+            if (
+                SETTINGS.MORANGO_DEQUEUE_ENGINE == "merge"
+                and DBBackend.supports_upsert
+            ):
+                _merge_buffer_into_store(cursor, transfer_session.id)
+            else:
+                _dequeue_buffer_stepwise(cursor, transfer_session.id)
 
         DatabaseMaxCounter.update_fsics(
             json.loads(fsic),
             transfer_session.get_filter(),
             v2_format=v2_format,
         )
+        # the store records FSICs are reduced against have changed
+        DatabaseMaxCounter.clear_fsic_cache()
+
+
+def _dequeue_buffer_stepwise(cursor, transfersession_id):
+    """
+    Merges the buffers of a transfer session into the store through a sequence of statements, each of
+    which handles one case of one table
+
+    :param cursor: The database connection cursor
+    :param transfersession_id: The str ID of the transfer session
+    """
+    DBBackend._dequeuing_delete_rmcb_records(cursor, transfersession_id)
+    DBBackend._dequeuing_delete_buffered_records(cursor, transfersession_id)
+    current_id = InstanceIDModel.get_current_instance_and_increment_counter()
+    DBBackend._dequeuing_merge_conflict_buffer(cursor, current_id, transfersession_id)
+    DBBackend._dequeuing_merge_conflict_rmcb(cursor, transfersession_id)
+    DBBackend._dequeuing_update_rmcs_last_saved_by(
+        cursor, current_id, transfersession_id
+    )
+    DBBackend._dequeuing_delete_mc_rmcb(cursor, transfersession_id)
+    DBBackend._dequeuing_delete_mc_buffer(cursor, transfersession_id)
+    DBBackend._dequeuing_insert_remaining_buffer(cursor, transfersession_id)
+    DBBackend._dequeuing_insert_remaining_rmcb(cursor, transfersession_id)
+    DBBackend._dequeuing_delete_remaining_rmcb(cursor, transfersession_id)
+    DBBackend._dequeuing_delete_remaining_buffer(cursor, transfersession_id)
+
+
+def _merge_buffer_into_store(cursor, transfersession_id):
+    """
+    Merges the buffers of a transfer session into the store in a single pass: each buffered record is
+    classified once, into a temporary table, as a fast-forward (including records new to the store), a
+    reverse fast-forward or a merge conflict, and then the fast-forwards and merge conflicts are each
+    applied with bulk upserts, while reverse fast-forwards are dropped with the rest of the buffers
+
+    :param cursor: The database connection cursor
+    :param transfersession_id: The str ID of the transfer session
+    """
+    current_id = InstanceIDModel.get_current_instance_and_increment_counter()
+    with TemporaryTable(
+        connection,
+        "dequeue_classes",
+        model_uuid=UUIDField(primary_key=True),
+        classification=IntegerField(),
+    ) as classes_table:
+        DBBackend._dequeuing_classify_buffer(
+            cursor, classes_table.sql_name, transfersession_id
+        )
+        classes_table.analyze()
+        DBBackend._dequeuing_apply_merge_conflicts(
+            cursor, classes_table.sql_name, current_id, transfersession_id
+        )
+        DBBackend._dequeuing_apply_fast_forwards(
+            cursor, classes_table.sql_name, transfersession_id
+        )
+    DBBackend._dequeuing_delete_remaining_rmcb(cursor, transfersession_id)
+    DBBackend._dequeuing_delete_remaining_buffer(cursor, transfersession_id)
+
+
+def _get_transfer_chunk_count(transfer_session, connection):
+    """
+    :type transfer_session: TransferSession
+    :type connection: morango.sync.syncsession.NetworkSyncConnection
+    :return: The number of chunks to transfer at once, up to the connection's pipeline depth
+    """
+    remaining = transfer_session.records_total - transfer_session.records_transferred
+    remaining_chunks = int(math.ceil(remaining / float(connection.chunk_size)))
+    return max(1, min(connection.pipeline_depth, remaining_chunks))
 
 
 class BaseOperation(object):
@@ -1047,13 +1365,23 @@ class SerializeOperation(LocalOperation):
 
         if context.is_producer and SETTINGS.MORANGO_SERIALIZE_BEFORE_QUEUING:
             try:
-                _serialize_into_store(context.sync_session.profile, filter=context.filter)
+                counts = _serialize_into_store(
+                    context.sync_session.profile, filter=context.filter
+                )
             except OperationalError as e:
                 # if we run into a transaction isolation error, we return a pending status to force
                 # retrying through the controller flow
                 if DBBackend._is_transaction_isolation_error(e):
                     return transfer_statuses.PENDING
                 raise e
+            # note how many app models were saved without changes, so weren't synced again
+            context.transfer_session.add_stage_counts(
+                transfer_stages.SERIALIZING,
+                {
+                    "records_serialized": counts["created"] + counts["updated"],
+                    "records_unchanged": counts["unchanged"],
+                },
+            )
 
         fsic = json.dumps(
             DatabaseMaxCounter.calculate_filter_specific_instance_counters(
@@ -1369,17 +1697,53 @@ class NetworkOperation(BaseOperation):
         :type context: NetworkSessionContext
         :return: A list of dicts, serialized Buffers
         """
+        data, _ = self.get_buffers_with_cursor(context)
+        return data
+
+    def get_buffers_with_cursor(self, context):
+        """
+        Pulls a single chunk of buffers from the remote server and does some validation, returning
+        the cursor from which the next chunk should be pulled, when the remote provides one
+
+        :type context: NetworkSessionContext
+        :return: A tuple of the list of dicts, serialized Buffers, and the cursor or None
+        """
         response = context.connection._pull_record_chunk(context.transfer_session)
+        return self._validate_buffers_response(context, response)
+
+    def get_buffer_chunks(self, context, count):
+        """
+        Pulls several chunks of buffers from the remote server, with up to the connection's
+        pipeline depth of requests in flight at once, and does some validation of each
 
-        data = response.json()
+        :type context: NetworkSessionContext
+        :param count: The number of chunks to pull
+        :return: A generator of tuples of the list of dicts, serialized Buffers, and the cursor
+            or None, in the order of the chunks
+        """
+        responses = context.connection._pull_record_chunks(
+            context.transfer_session, count
+        )
+        for response in responses:
+            yield self._validate_buffers_response(context, response)
+
+    def _validate_buffers_response(self, context, response):
+        """
+        :type context: NetworkSessionContext
+        :param response: The response to a request for a chunk of buffers
+        :return: A tuple of the list of dicts, serialized Buffers, and the cursor or None
+        """
+        data = context.connection._get_record_chunk_data(response)
+        cursor = None
 
         # parse out the results from a paginated set, if needed
         if isinstance(data, dict) and "results" in data:
+            cursor = data.get("cursor")
             data = data["results"]
 
         # no buffers?
         if len(data) == 0:
-            return data
+            return data, cursor
 
         # ensure the transfer session allows pulls, and is same across records
         transfer_session = TransferSession.objects.get(id=data[0]["transfer_session"])
@@ -1395,7 +1759,7 @@ class NetworkOperation(BaseOperation):
             raise ValidationError(
                 "Specified TransferSession does not match this SyncClient's current TransferSession."
             )
-        return data
+        return data, cursor
 
     def remote_proceed_to(self, context, stage, **kwargs):
         """
@@ -1596,37 +1960,93 @@ class NetworkPushTransferOperation(NetworkOperation):
             # since we won't be transferring anything, we can say we're done
             return transfer_statuses.COMPLETED
 
-        offset = context.transfer_session.records_transferred
+        transfer_session = context.transfer_session
+        offset = transfer_session.records_transferred
+        cursor = transfer_session.buffer_cursor
+        # the connection may adjust its chunk size as chunks complete, so this window uses the
+        # size from when it started
         chunk_size = context.connection.chunk_size
+        transfer_session.record_chunk_size(chunk_size)
 
-        buffered_records = Buffer.objects.filter(
-            transfer_session=context.transfer_session
-        ).order_by("pk")
+        # only push several chunks at once when the server can receive them concurrently
+        chunk_count = 1
+        if BUFFER_PIPELINING in context.connection.capabilities:
+            chunk_count = _get_transfer_chunk_count(transfer_session, context.connection)
 
-        data = BufferSerializer(
-            buffered_records[offset : offset + chunk_size], many=True
-        ).data
+        buffered_records = (
+            Buffer.objects.filter(transfer_session=transfer_session)
+            .order_by("pk")
+            .prefetch_rmcb_list()
+        )
 
-        # push buffers chunk to server
-        self.put_buffers(context, data)
+        # page by the last pushed pk when we have one, since slicing by offset requires the
+        # database to scan past every record already pushed. Transfer sessions resumed from
+        # before the cursor was tracked fall back to the offset
+        if cursor is not None:
+            buffered_records = buffered_records.filter(pk__gt=cursor)[
+                : chunk_size * chunk_count
+            ]
+        else:
+            buffered_records = buffered_records[
+                offset : offset + chunk_size * chunk_count
+            ]
+        buffered_records = list(buffered_records)
 
-        context.transfer_session.records_transferred = min(
-            offset + chunk_size, context.transfer_session.records_total
-        )
-        context.transfer_session.bytes_sent = context.connection.bytes_sent
-        context.transfer_session.bytes_received = context.connection.bytes_received
-        context.transfer_session.save()
+        chunks = [
+            buffered_records[i : i + chunk_size]
+            for i in range(0, max(len(buffered_records), 1), chunk_size)
+        ]
+        # the server completes the transfer on receiving the last of the records, so when this
+        # window holds the last chunk, it is pushed only after all the others have been received
+        last_chunk = None
+        if len(chunks) > 1 and (
+            offset + len(buffered_records) >= transfer_session.records_total
+        ):
+            last_chunk = chunks.pop()
+
+        # serializing queries the database, so it happens here rather than alongside the requests
+        serialized_chunks = [
+            (records, BufferSerializer(records, many=True).data) for records in chunks
+        ]
+
+        def push_chunk(chunk):
+            records, data = chunk
+            self.put_buffers(context, data)
+            return records
+
+        # push buffers chunks to server, recording progress after each, in order, so that the
+        # transfer can be resumed from the first chunk that failed
+        for records in context.connection._map_in_flight(push_chunk, serialized_chunks):
+            self._update_push_progress(context, records, chunk_size)
+
+        if last_chunk is not None:
+            self.put_buffers(context, BufferSerializer(last_chunk, many=True).data)
+            self._update_push_progress(context, last_chunk, chunk_size)
 
         # if we've transferred all records, return a completed status
         op_status = transfer_statuses.PENDING
-        if (
-            context.transfer_session.records_transferred
-            >= context.transfer_session.records_total
-        ):
+        if transfer_session.records_transferred >= transfer_session.records_total:
             op_status = transfer_statuses.COMPLETED
 
         return op_status
 
+    def _update_push_progress(self, context, records, chunk_size):
+        """
+        :type context: NetworkSessionContext
+        :param records: The list of Buffers that were pushed
+        :param chunk_size: The chunk size the records were pushed with
+        """
+        transfer_session = context.transfer_session
+        if records:
+            transfer_session.buffer_cursor = records[-1].pk
+        transfer_session.records_transferred = min(
+            transfer_session.records_transferred + chunk_size,
+            transfer_session.records_total,
+        )
+        transfer_session.bytes_sent = context.connection.bytes_sent
+        transfer_session.bytes_received = context.connection.bytes_received
+        transfer_session.save()
+
 
 class NetworkPullTransferOperation(NetworkOperation):
     def handle(self, context):
@@ -1639,19 +2059,29 @@ class NetworkPullTransferOperation(NetworkOperation):
         transfer_session = context.transfer_session
 
         if transfer_session.records_total > 0:
-            # grab buffers, just one chunk
-            data = self.get_buffers(context)
-
-            validate_and_create_buffer_data(
-                data, transfer_session, connection=context.connection
+            # grab buffers, as many chunks as the connection keeps in flight at once, saving
+            # each in order so that the transfer can be resumed from the first that failed
+            chunk_count = _get_transfer_chunk_count(
+                transfer_session, context.connection
             )
+            transfer_session.record_chunk_size(context.connection.chunk_size)
+            for data, cursor in self.get_buffer_chunks(context, chunk_count):
+                validate_and_create_buffer_data(
+                    data,
+                    transfer_session,
+                    connection=context.connection,
+                    buffer_cursor=cursor,
+                )
+                if not data:
+                    break
 
         # if we've transferred all records, return a completed status
         op_status = transfer_statuses.PENDING
         if transfer_session.records_transferred >= transfer_session.records_total:
             op_status = transfer_statuses.COMPLETED
 
-        # update the records transferred so client and server are in agreement
+        # update the records transferred so client and server are in agreement, once for all
+        # the chunks pulled
         self.update_transfer_session(
             context,
             transfer_stage=transfer_stages.TRANSFERRING,
@@ -1,4 +1,5 @@
 import logging
+import threading
 
 from requests import exceptions
 from morango import __version__
@@ -23,6 +24,18 @@ def _headers_content_length(headers):
     return 0
 
 
+def _raw_content_length(response):
+    # the number of body bytes read over the wire, which differs from the length of the content
+    # when the response was compressed and transparently decompressed
+    try:
+        content_length = response.raw.tell()
+        if isinstance(content_length, int) and content_length > 0:
+            return content_length
+    except AttributeError:
+        pass
+    return 0
+
+
 def _length_of_headers(headers):
     return super_len(
         "\n".join(["{}: {}".format(key, value) for key, value in headers.items()])
@@ -45,6 +58,8 @@ class SessionWrapper(Session):
             if instances:
                 user_agent_header += " " + "{}/{}".format(instances[0], SETTINGS.CUSTOM_INSTANCE_INFO.get(instances[0]))
         self.headers["User-Agent"] = "{} {}".format(user_agent_header, self.headers["User-Agent"])
+        # requests may be made from several threads when transferring in a pipeline
+        self._bytes_lock = threading.Lock()
 
     def request(self, method, url, **kwargs):
         response = None
@@ -55,13 +70,16 @@ class SessionWrapper(Session):
             # a chunked response though
             content_length = _headers_content_length(response.headers)
             if not content_length:
-                content_length = super_len(response.content)
+                content_length = _raw_content_length(response) or super_len(
+                    response.content
+                )
 
-            self.bytes_received += len(
-                "HTTP/1.1 {} {}".format(response.status_code, response.reason)
-            )
-            self.bytes_received += _length_of_headers(response.headers)
-            self.bytes_received += content_length
+            with self._bytes_lock:
+                self.bytes_received += len(
+                    "HTTP/1.1 {} {}".format(response.status_code, response.reason)
+                )
+                self.bytes_received += _length_of_headers(response.headers)
+                self.bytes_received += content_length
 
             response.raise_for_status()
             return response
@@ -92,9 +110,10 @@ class SessionWrapper(Session):
         # we don't bother checking if the content length header exists here because we've probably
         # been given the request body as Morango sends bodies that aren't streamed, so the
         # underlying requests code will set it appropriately
-        self.bytes_sent += len("{} {} HTTP/1.1".format(request.method, parsed_url.path))
-        self.bytes_sent += _length_of_headers(prepped.headers)
-        self.bytes_sent += _headers_content_length(prepped.headers)
+        with self._bytes_lock:
+            self.bytes_sent += len("{} {} HTTP/1.1".format(request.method, parsed_url.path))
+            self.bytes_sent += _length_of_headers(prepped.headers)
+            self.bytes_sent += _headers_content_length(prepped.headers)
 
         return prepped
 
@@ -0,0 +1,116 @@
+"""
+Instrumentation of the transfer stages invoked through the `SessionController`, recording for each
+invocation its wall time, the number and time of the database queries it ran, the rows those
+queries changed, and the bytes it moved over the network.
+"""
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+
+# the fields that are summed when stats are aggregated
+STATS_FIELDS = (
+    "wall_time",
+    "query_count",
+    "query_time",
+    "rows_affected",
+    "bytes_sent",
+    "bytes_received",
+)
+
+
+class StageStats(object):
+    """
+    The measurements of one invocation of a transfer stage's middleware
+    """
+
+    __slots__ = ("stage", "operation") + STATS_FIELDS
+
+    def __init__(self, stage, operation=None):
+        """
+        :param stage: The transfer_stages.* the middleware is related to
+        :param operation: The name of the operation that handled the invocation, if known
+        """
+        self.stage = stage
+        self.operation = operation
+        for field in STATS_FIELDS:
+            setattr(self, field, 0)
+
+    def as_dict(self):
+        """
+        :return: A dict of the stage, the operation, and the measurements
+        """
+        stats = {field: getattr(self, field) for field in STATS_FIELDS}
+        stats.update(stage=self.stage, operation=self.operation)
+        return stats
+
+    def merge_into(self, aggregate):
+        """
+        Adds the measurements into a dict that aggregates several invocations, in the format
+        persisted on the `TransferSession`
+
+        :param aggregate: A dict of summed measurements, possibly empty
+        :return: The updated dict
+        """
+        aggregate["invocations"] = aggregate.get("invocations", 0) + 1
+        for field in STATS_FIELDS:
+            aggregate[field] = aggregate.get(field, 0) + getattr(self, field)
+        return aggregate
+
+
+class StatsRecorder(object):
+    """
+    Context manager that measures the code it wraps into a `StageStats`
+    """
+
+    __slots__ = ("stats", "sync_connection", "_stack", "_start", "_bytes")
+
+    def __init__(self, stats, sync_connection=None):
+        """
+        :param stats: The stats to record the measurements into
+        :type stats: StageStats
+        :param sync_connection: The network connection of the transfer, whose bytes sent and
+            received are measured, if any
+        :type sync_connection: morango.sync.syncsession.NetworkSyncConnection|None
+        """
+        self.stats = stats
+        self.sync_connection = sync_connection
+        self._stack = None
+        self._start = None
+        self._bytes = None
+
+    def _get_bytes(self):
+        counts = (
+            getattr(self.sync_connection, "bytes_sent", None),
+            getattr(self.sync_connection, "bytes_received", None),
+        )
+        # connections that don't track the bytes they move count as moving none
+        return tuple(count if isinstance(count, int) else 0 for count in counts)
+
+    def _execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.stats.query_time += time.perf_counter() - start
+            self.stats.query_count += 1
+            # the row count of a select is the number of rows returned, if the backend reports it
+            rowcount = getattr(context.get("cursor"), "rowcount", None) or 0
+            if rowcount > 0 and not sql.lstrip()[:6].upper() == "SELECT":
+                self.stats.rows_affected += rowcount
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for db_connection in connections.all():
+            self._stack.enter_context(db_connection.execute_wrapper(self._execute))
+        self._bytes = self._get_bytes()
+        self._start = time.perf_counter()
+        return self.stats
+
+    def __exit__(self, *args):
+        self.stats.wall_time += time.perf_counter() - self._start
+        bytes_sent, bytes_received = self._get_bytes()
+        self.stats.bytes_sent += bytes_sent - self._bytes[0]
+        self.stats.bytes_received += bytes_received - self._bytes[1]
+        self._stack.close()
@@ -5,15 +5,21 @@ import json
 import logging
 import os
 import socket
+import threading
+import time
 import uuid
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
 from urllib.parse import urlparse
 
 from django.utils import timezone
+from requests import adapters as requests_adapters
 from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
 from requests.exceptions import HTTPError
+from requests.exceptions import Timeout
 from requests.packages.urllib3.util.retry import Retry
+from requests.utils import super_len
 
 from .session import SessionWrapper
 from morango.api.serializers import CertificateSerializer
@@ -22,7 +28,11 @@ from morango.constants import api_urls
 from morango.constants import transfer_stages
 from morango.constants import transfer_statuses
 from morango.constants.capabilities import ALLOW_CERTIFICATE_PUSHING
+from morango.constants.capabilities import BUFFER_KEYSET_PAGINATION
+from morango.constants.capabilities import COLUMNAR_BUFFER_FORMAT
+from morango.constants.capabilities import COMPRESSED_BUFFER_PULL
 from morango.constants.capabilities import GZIP_BUFFER_POST
+from morango.constants.capabilities import ZSTD_BUFFER_COMPRESSION
 from morango.errors import CertificateSignatureInvalid
 from morango.errors import MorangoError
 from morango.errors import MorangoResumeSyncError
@@ -31,17 +41,22 @@ from morango.models.certificates import Certificate
 from morango.models.certificates import Key
 from morango.models.core import InstanceIDModel
 from morango.models.core import SyncSession
+from morango.sync import columnar
+from morango.sync.compression import compress_iter
+from morango.sync.compression import get_decodable_response_encodings
+from morango.sync.compression import GZIP
+from morango.sync.compression import MEDIA_TYPES
+from morango.sync.compression import ZSTD
 from morango.sync.context import CompositeSessionContext
 from morango.sync.context import LocalSessionContext
 from morango.sync.context import NetworkSessionContext
 from morango.sync.controller import SessionController
+from morango.sync.utils import ChunkSizeController
 from morango.sync.utils import SyncSignal
 from morango.sync.utils import SyncSignalGroup
 from morango.utils import CAPABILITIES
 from morango.utils import pid_exists
-
-if GZIP_BUFFER_POST in CAPABILITIES:
-    from gzip import GzipFile
+from morango.utils import SETTINGS
 
 
 logger = logging.getLogger(__name__)
@@ -71,14 +86,8 @@ def _get_client_ip_for_server(server_host, server_port):
     return IP
 
 
-# borrowed from https://github.com/django/django/blob/1.11.20/django/utils/text.py#L295
-def compress_string(s, compresslevel=9):
-    zbuf = BytesIO()
-    with GzipFile(
-        mode="wb", compresslevel=compresslevel, fileobj=zbuf, mtime=0
-    ) as zfile:
-        zfile.write(s)
-    return zbuf.getvalue()
+def compress_string(s, compresslevel=9, encoding=GZIP):
+    return b"".join(compress_iter([s], encoding, compresslevel))
 
 
 class Connection(object):
@@ -103,33 +112,61 @@ class NetworkSyncConnection(Connection):
         "server_info",
         "capabilities",
         "chunk_size",
+        "chunk_size_controller",
+        "pipeline_depth",
+        "_chunk_size_lock",
     )
 
     default_chunk_size = 500
+    default_min_chunk_size = 50
+    default_max_chunk_size = 5000
+    default_pipeline_depth = 1
 
     def __init__(
         self,
         base_url="",
-        compresslevel=9,
+        compresslevel=None,
         retries=7,
         backoff_factor=0.3,
         chunk_size=default_chunk_size,
+        pipeline_depth=default_pipeline_depth,
+        adaptive_chunk_size=False,
+        min_chunk_size=default_min_chunk_size,
+        max_chunk_size=default_max_chunk_size,
     ):
         """
         The underlying network connection with a syncing peer. Any network requests
         (such as certificate querying or syncing related) will be done through this class.
+
+        :param compresslevel: The level at which pushed records are compressed, which defaults to
+            the `MORANGO_COMPRESSION_LEVEL` setting
+        :type compresslevel: int
+        :param pipeline_depth: The number of buffer chunk requests to keep in flight at once while
+            transferring, which avoids a round trip per chunk on high latency connections
+        :type pipeline_depth: int
+        :param adaptive_chunk_size: Whether to adjust the chunk size while transferring, from the
+            measured throughput and latency of chunk requests
+        :type adaptive_chunk_size: bool
+        :param min_chunk_size: The smallest chunk size to adjust to
+        :type min_chunk_size: int
+        :param max_chunk_size: The largest chunk size to adjust to
+        :type max_chunk_size: int
         """
         if base_url == "":
             raise AssertionError("Network connection `base_url` cannot be empty")
 
         self.base_url = base_url
-        self.compresslevel = compresslevel
+        self.compresslevel = compresslevel or SETTINGS.MORANGO_COMPRESSION_LEVEL
         # set up requests session with retry logic
         self.session = SessionWrapper()
         # sleep for {backoff factor} * (2 ^ ({number of total retries} - 1)) between requests
         # with 7 retry attempts, sleep escalation becomes (0.6s, 1.2s, ..., 38.4s)
         retry = Retry(total=retries, backoff_factor=backoff_factor)
-        adapter = HTTPAdapter(max_retries=retry)
+        # ensure the connection pool can hold a connection for each in-flight request
+        adapter = HTTPAdapter(
+            max_retries=retry,
+            pool_maxsize=max(requests_adapters.DEFAULT_POOLSIZE, pipeline_depth),
+        )
         self.session.mount("http://", adapter)
         self.session.mount("https://", adapter)
         # get morango information about server
@@ -138,6 +175,14 @@ class NetworkSyncConnection(Connection):
         ).json()
         self.capabilities = self.server_info.get("capabilities", [])
         self.chunk_size = chunk_size
+        self.pipeline_depth = max(1, pipeline_depth)
+        self.chunk_size_controller = None
+        if adaptive_chunk_size:
+            self.chunk_size_controller = ChunkSizeController(
+                min_chunk_size, max_chunk_size
+            )
+        # chunk requests may complete from several threads when transferring in a pipeline
+        self._chunk_size_lock = threading.Lock()
 
     @property
     def bytes_sent(self):
@@ -480,28 +525,198 @@ class NetworkSyncConnection(Connection):
         )
 
     def _push_record_chunk(self, data):
-        # gzip the data if both client and server have gzipping capabilities
-        if GZIP_BUFFER_POST in self.capabilities and GZIP_BUFFER_POST in CAPABILITIES:
-            json_data = json.dumps([dict(el) for el in data])
-            gzipped_data = compress_string(
-                bytes(json_data.encode("utf-8")), compresslevel=self.compresslevel
+        encoding = self._get_push_record_chunk_encoding()
+
+        # pack the data in the columnar format if both client and server support it
+        if self._uses_columnar_format():
+            headers = {"content-type": columnar.MEDIA_TYPE}
+            packed_data = columnar.pack([dict(el) for el in data])
+            if encoding is not None:
+                packed_data = b"".join(
+                    compress_iter([packed_data], encoding, self.compresslevel)
+                )
+                headers["content-encoding"] = encoding
+            return self._request_record_chunk(
+                "post", len(data), data=packed_data, headers=headers
             )
-            return self.session.post(
-                self.urlresolve(api_urls.BUFFER),
-                data=gzipped_data,
-                headers={"content-type": "application/gzip"},
+
+        if encoding is not None:
+            # the JSON is compressed as it's encoded, rather than building the whole string first
+            compressed_data = b"".join(
+                compress_iter(
+                    json.JSONEncoder().iterencode([dict(el) for el in data]),
+                    encoding,
+                    self.compresslevel,
+                )
+            )
+            return self._request_record_chunk(
+                "post",
+                len(data),
+                data=compressed_data,
+                headers={"content-type": MEDIA_TYPES[encoding]},
             )
         else:
-            return self.session.post(self.urlresolve(api_urls.BUFFER), json=data)
+            return self._request_record_chunk("post", len(data), json=data)
+
+    def _get_push_record_chunk_encoding(self):
+        # compress the data if both client and server have compression capabilities, preferring
+        # zstd over gzip
+        if (
+            ZSTD_BUFFER_COMPRESSION in self.capabilities
+            and ZSTD_BUFFER_COMPRESSION in CAPABILITIES
+        ):
+            return ZSTD
+        if GZIP_BUFFER_POST in self.capabilities and GZIP_BUFFER_POST in CAPABILITIES:
+            return GZIP
+        return None
+
+    def _uses_columnar_format(self):
+        return (
+            COLUMNAR_BUFFER_FORMAT in self.capabilities
+            and COLUMNAR_BUFFER_FORMAT in CAPABILITIES
+        )
+
+    def _get_record_chunk_data(self, response):
+        """
+        :param response: The response to a request to pull a chunk of records
+        :return: The list of serialized Buffer dicts, or a paginated response dict with them as its
+            `results`
+        """
+        if response.headers.get("content-type", "").startswith(columnar.MEDIA_TYPE):
+            return columnar.unpack(response.content)
+        return response.json()
 
     def _pull_record_chunk(self, transfer_session):
         # pull records from server for given transfer session
+        params = self._get_pull_record_chunk_params(transfer_session)
+        return self._request_record_chunk(
+            "get",
+            self._get_expected_record_count(transfer_session, params),
+            params=params,
+            headers=self._get_pull_record_chunk_headers(),
+        )
+
+    def _pull_record_chunks(self, transfer_session, count):
+        """
+        Pulls the next `count` chunks of records for the transfer session, keeping up to
+        `pipeline_depth` requests in flight
+
+        :type transfer_session: TransferSession
+        :param count: The number of chunks to pull
+        :return: A generator of the responses, in the order of the chunks
+        """
+        # the params are built up front, since the transfer session's progress is updated while
+        # the responses are consumed
+        chunk_requests = []
+        for page in range(count):
+            params = self._get_pull_record_chunk_params(transfer_session, page=page)
+            records = self._get_expected_record_count(transfer_session, params, page)
+            chunk_requests.append((records, params))
+        return self._map_in_flight(
+            lambda chunk_request: self._request_record_chunk(
+                "get",
+                chunk_request[0],
+                params=chunk_request[1],
+                headers=self._get_pull_record_chunk_headers(),
+            ),
+            chunk_requests,
+        )
+
+    def _request_record_chunk(self, method, records, **kwargs):
+        """
+        Makes a request to the buffers endpoint, and adjusts the chunk size from how it went when
+        the chunk size is adaptive
+
+        :param method: The HTTP method
+        :param records: The number of records the request is expected to transfer
+        :return: The response
+        """
+        if self.chunk_size_controller is None:
+            return self.session.request(
+                method, self.urlresolve(api_urls.BUFFER), **kwargs
+            )
+
+        start = time.time()
+        try:
+            response = self.session.request(
+                method, self.urlresolve(api_urls.BUFFER), **kwargs
+            )
+        except (ConnectionError, Timeout):
+            with self._chunk_size_lock:
+                self.chunk_size = self.chunk_size_controller.failed(self.chunk_size)
+            raise
+        elapsed = time.time() - start
+
+        # the size of whichever of the request or response carried the records
+        nbytes = super_len(response.content)
+        if method == "post":
+            nbytes = super_len(response.request.body or b"")
+
+        with self._chunk_size_lock:
+            self.chunk_size = self.chunk_size_controller.record(
+                self.chunk_size, records, nbytes, elapsed
+            )
+        return response
+
+    def _get_expected_record_count(self, transfer_session, params, page=0):
+        # the number of records a pull request should return, which is fewer than the limit for
+        # the last chunk of the transfer session
+        remaining = (
+            (transfer_session.records_total or 0)
+            - transfer_session.records_transferred
+            - page * params["limit"]
+        )
+        return max(0, min(params["limit"], remaining))
+
+    def _get_pull_record_chunk_headers(self):
+        headers = {}
+        # when the server can compress pulled records, accept the encodings that responses are
+        # transparently decompressed from as they're read
+        if COMPRESSED_BUFFER_PULL in self.capabilities:
+            headers["Accept-Encoding"] = ", ".join(get_decodable_response_encodings())
+        if self._uses_columnar_format():
+            headers["Accept"] = columnar.MEDIA_TYPE
+        return headers or None
+
+    def _get_pull_record_chunk_params(self, transfer_session, page=0):
+        # `page` is the number of chunks beyond the current progress of the transfer session
         params = {
             "limit": self.chunk_size,
-            "offset": transfer_session.records_transferred,
             "transfer_session_id": transfer_session.id,
         }
-        return self.session.get(self.urlresolve(api_urls.BUFFER), params=params)
+        # when the server supports it, resume from the last buffer pk we received instead of
+        # from an offset, which the database has to scan past on each request
+        if (
+            BUFFER_KEYSET_PAGINATION in self.capabilities
+            and transfer_session.buffer_cursor is not None
+        ):
+            params["cursor"] = transfer_session.buffer_cursor
+            if page:
+                params["offset"] = page * self.chunk_size
+        else:
+            params["offset"] = (
+                transfer_session.records_transferred + page * self.chunk_size
+            )
+        return params
+
+    def _map_in_flight(self, func, iterable):
+        """
+        Calls `func` with each item of `iterable`, keeping up to `pipeline_depth` calls in flight
+        at once. Results are yielded in the order of `iterable`, and an exception raised by a call
+        is raised when its result is reached.
+
+        :param func: A callable that makes network requests, but does not touch the database
+        :param iterable: An iterable of single arguments for `func`
+        :return: A generator of results
+        """
+        if self.pipeline_depth <= 1:
+            for item in iterable:
+                yield func(item)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.pipeline_depth) as executor:
+            for result in executor.map(func, iterable):
+                yield result
 
 
 class SyncClientSignals(SyncSignal):
@@ -3,11 +3,13 @@ import functools
 import logging
 
 from django.db import transaction
+from django.db.models import F
 from rest_framework.exceptions import ValidationError
 
 from morango.models.core import Buffer
 from morango.models.core import RecordMaxCounterBuffer
 from morango.models.core import SyncableModel
+from morango.models.core import TransferSession
 from morango.registry import syncable_models
 
 
@@ -71,7 +73,7 @@ class mute_signals(object):
 
 
 def validate_and_create_buffer_data(  # noqa: C901
-    data, transfer_session, connection=None
+    data, transfer_session, connection=None, buffer_cursor=None
 ):
     data = copy.deepcopy(data)
     rmcb_list = []
@@ -128,14 +130,26 @@ def validate_and_create_buffer_data(  # noqa: C901
         buffer_list += [Buffer(**record)]
 
     with transaction.atomic():
-        transfer_session.records_transferred += len(data)
+        # buffers may be pushed by several concurrent requests, so the count is incremented by
+        # the database rather than saved from what may be a stale transfer session
+        TransferSession.objects.filter(pk=transfer_session.pk).update(
+            records_transferred=F("records_transferred") + len(data)
+        )
+        transfer_session.refresh_from_db(fields=["records_transferred"])
+
+        update_fields = []
+        # the remote's buffer cursor is saved alongside the count so that both resume together
+        if buffer_cursor is not None:
+            transfer_session.buffer_cursor = buffer_cursor
+            update_fields.append("buffer_cursor")
 
         if connection is not None:
             transfer_session.bytes_sent = connection.bytes_sent
-        if connection is not None:
             transfer_session.bytes_received = connection.bytes_received
+            update_fields.extend(["bytes_sent", "bytes_received"])
 
-        transfer_session.save()
+        if update_fields:
+            transfer_session.save(update_fields=update_fields)
 
         Buffer.objects.bulk_create(buffer_list)
         RecordMaxCounterBuffer.objects.bulk_create(rmcb_list)
@@ -232,6 +246,103 @@ class SyncSignalGroup(SyncSignal):
         self.completed.fire()
 
 
+class ChunkSizeController(object):
+    """
+    Adjusts the number of records transferred per chunk during a sync from the observed throughput
+    and latency of chunk requests. The chunk size grows additively while requests complete within
+    the target latency, and shrinks multiplicatively when they don't or when they fail
+    """
+
+    __slots__ = (
+        "min_chunk_size",
+        "max_chunk_size",
+        "target_latency",
+        "increase_step",
+        "decrease_factor",
+        "smoothing",
+        "throughput",
+        "bytes_per_record",
+    )
+
+    def __init__(
+        self,
+        min_chunk_size,
+        max_chunk_size,
+        target_latency=2.0,
+        increase_step=50,
+        decrease_factor=0.5,
+        smoothing=0.3,
+    ):
+        """
+        :param min_chunk_size: The smallest chunk size to use
+        :param max_chunk_size: The largest chunk size to use
+        :param target_latency: The time, in seconds, within which chunk requests should complete
+        :param increase_step: The number of records by which to grow the chunk size
+        :param decrease_factor: The factor by which to shrink the chunk size
+        :param smoothing: The weight given to each new measurement in the moving averages
+        """
+        if min_chunk_size < 1 or min_chunk_size > max_chunk_size:
+            raise ValueError(
+                "Invalid chunk size bounds | min={}, max={}".format(
+                    min_chunk_size, max_chunk_size
+                )
+            )
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.target_latency = target_latency
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.smoothing = smoothing
+        # exponential moving averages of bytes per second and bytes per record
+        self.throughput = None
+        self.bytes_per_record = None
+
+    def _average(self, current, value):
+        if current is None:
+            return value
+        return current + self.smoothing * (value - current)
+
+    def _clamp(self, chunk_size):
+        return int(max(self.min_chunk_size, min(self.max_chunk_size, chunk_size)))
+
+    def record(self, chunk_size, records, nbytes, elapsed):
+        """
+        :param chunk_size: The current chunk size
+        :param records: The number of records transferred by the request
+        :param nbytes: The number of bytes transferred by the request
+        :param elapsed: The time, in seconds, the request took
+        :return: The chunk size to use next
+        """
+        if records <= 0 or elapsed <= 0:
+            return self._clamp(chunk_size)
+
+        if elapsed > self.target_latency:
+            return self._clamp(chunk_size * self.decrease_factor)
+
+        self.throughput = self._average(self.throughput, nbytes / float(elapsed))
+        self.bytes_per_record = self._average(
+            self.bytes_per_record, nbytes / float(records)
+        )
+        next_chunk_size = chunk_size + self.increase_step
+        # don't grow beyond the number of records we expect to transfer within the target latency
+        if self.bytes_per_record:
+            next_chunk_size = min(
+                next_chunk_size,
+                max(
+                    chunk_size,
+                    self.throughput * self.target_latency / self.bytes_per_record,
+                ),
+            )
+        return self._clamp(next_chunk_size)
+
+    def failed(self, chunk_size):
+        """
+        :param chunk_size: The current chunk size
+        :return: The chunk size to use next, after a request failed
+        """
+        return self._clamp(chunk_size * self.decrease_factor)
+
+
 def lock_partitions(backend, sync_filter=None, shared=False):
     """
     Lock all partitions for a filter, and really lock everything if the filter is null
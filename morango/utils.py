@@ -6,8 +6,13 @@ from django.conf import settings
 from morango.constants import settings as default_settings
 from morango.constants.capabilities import ALLOW_CERTIFICATE_PUSHING
 from morango.constants.capabilities import ASYNC_OPERATIONS
+from morango.constants.capabilities import BUFFER_KEYSET_PAGINATION
+from morango.constants.capabilities import BUFFER_PIPELINING
+from morango.constants.capabilities import COLUMNAR_BUFFER_FORMAT
+from morango.constants.capabilities import COMPRESSED_BUFFER_PULL
 from morango.constants.capabilities import FSIC_V2_FORMAT
 from morango.constants.capabilities import GZIP_BUFFER_POST
+from morango.constants.capabilities import ZSTD_BUFFER_COMPRESSION
 
 
 def do_import(import_string):
@@ -49,6 +54,29 @@ def get_capabilities():
     except ImportError:
         pass
 
+    # Pulled buffers can be compressed by the server, and decompressed by the client
+    capabilities.add(COMPRESSED_BUFFER_PULL)
+
+    try:
+        import zstandard  # noqa
+
+        capabilities.add(ZSTD_BUFFER_COMPRESSION)
+    except ImportError:
+        pass
+
+    try:
+        import msgpack  # noqa
+
+        capabilities.add(COLUMNAR_BUFFER_FORMAT)
+    except ImportError:
+        pass
+
+    # Buffers can always be paginated by primary key cursor, instead of by offset
+    capabilities.add(BUFFER_KEYSET_PAGINATION)
+    # Buffers can be received from several concurrent requests, and pages requested ahead of the
+    # cursor, so that transfers can be pipelined
+    capabilities.add(BUFFER_PIPELINING)
+
     if SETTINGS.ALLOW_CERTIFICATE_PUSHING:
         capabilities.add(ALLOW_CERTIFICATE_PUSHING)
 
@@ -0,0 +1,255 @@
+"""
+Benchmarks dequeuing a transfer session's buffers into a store, with each of the dequeue engines, on
+buffers evenly split between records new to the store, fast-forwards, reverse fast-forwards and merge
+conflicts, and then deleting the session's buffers:
+
+    python tests/testapp/manage.py benchmark_dequeue --records 300000
+    python tests/testapp/manage.py benchmark_dequeue --settings testapp.postgres_settings
+"""
+import itertools
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from .benchmark_sync import benchmark_database
+from morango.models.core import Buffer
+from morango.models.core import InstanceIDModel
+from morango.models.core import RecordMaxCounter
+from morango.models.core import RecordMaxCounterBuffer
+from morango.models.core import Store
+from morango.models.core import SyncSession
+from morango.models.core import TransferSession
+from morango.sync.operations import _dequeue_into_store
+from morango.sync.stats import StageStats
+from morango.sync.stats import StatsRecorder
+
+
+PROFILE = "facilitydata"
+
+ENGINES = ("stepwise", "merge")
+
+NEW, FAST_FORWARD, REVERSE_FAST_FORWARD, MERGE_CONFLICT = range(4)
+
+
+class DequeueBenchmark(object):
+    """
+    Generates a store, and the buffers of a transfer session received from another instance, and
+    measures dequeuing the buffers with each engine, rolling back after each run so every run starts
+    from the same data
+    """
+
+    def __init__(self, records=10000, store_records=100000):
+        """
+        :param records: The number of buffered records, split evenly between the four ways they
+            merge into the store
+        :param store_records: The number of other store records, which aren't buffered
+        """
+        self.records = records
+        self.store_records = store_records
+        self.local_instance = uuid.uuid4().hex
+        self.remote_instance = uuid.uuid4().hex
+        self.partition = "{}:user:summary".format(uuid.uuid4().hex)
+        self.transfer_session = None
+
+    def _store(self, record_id, counter):
+        return Store(
+            id=record_id,
+            serialized='{"id": "%s"}' % record_id,
+            last_saved_instance=self.local_instance,
+            last_saved_counter=counter,
+            model_name="summarylog",
+            profile=PROFILE,
+            partition=self.partition,
+            source_id=record_id,
+            dirty_bit=False,
+        )
+
+    def _buffer(self, record_id, counter):
+        return Buffer(
+            model_uuid=record_id,
+            transfer_session=self.transfer_session,
+            serialized='{"id": "%s", "counter": %d}' % (record_id, counter),
+            last_saved_instance=self.remote_instance,
+            last_saved_counter=counter,
+            model_name="summarylog",
+            profile=PROFILE,
+            partition=self.partition,
+            source_id=record_id,
+        )
+
+    def _generate_records(self):
+        """
+        :return: A generator of lists of the models to create for each record
+        """
+        for i in range(self.records):
+            record_id = uuid.uuid4().hex
+            counter = i + 1
+            kind = i % 4
+            models = [self._buffer(record_id, counter)]
+            rmcbs = [(self.remote_instance, counter)]
+            if kind != NEW:
+                models.append(self._store(record_id, 1 if kind == FAST_FORWARD else 2))
+                models.append(
+                    RecordMaxCounter(
+                        store_model_id=record_id,
+                        instance_id=self.local_instance,
+                        counter=models[-1].last_saved_counter,
+                    )
+                )
+            if kind == REVERSE_FAST_FORWARD:
+                # the store already has the buffered version
+                models.append(
+                    RecordMaxCounter(
+                        store_model_id=record_id,
+                        instance_id=self.remote_instance,
+                        counter=counter,
+                    )
+                )
+            elif kind != NEW:
+                # the buffered version was saved over version 1 of the store's record, which is
+                # the store's version only for fast-forwards
+                rmcbs.append((self.local_instance, 1))
+            for instance_id, rmcb_counter in rmcbs:
+                models.append(
+                    RecordMaxCounterBuffer(
+                        model_uuid=record_id,
+                        transfer_session=self.transfer_session,
+                        instance_id=instance_id,
+                        counter=rmcb_counter,
+                    )
+                )
+            yield models
+
+        for i in range(self.store_records):
+            record_id = uuid.uuid4().hex
+            yield [
+                self._store(record_id, i + 1),
+                RecordMaxCounter(
+                    store_model_id=record_id,
+                    instance_id=self.local_instance,
+                    counter=i + 1,
+                ),
+            ]
+
+    def populate(self, batch_size=5000):
+        """
+        Creates the transfer session, and fills the store and its buffers
+        """
+        sync_session = SyncSession.objects.create(
+            id=uuid.uuid4().hex,
+            profile=PROFILE,
+            last_activity_timestamp=timezone.now(),
+        )
+        self.transfer_session = TransferSession.objects.create(
+            id=uuid.uuid4().hex,
+            sync_session=sync_session,
+            filter=self.partition,
+            push=True,
+            last_activity_timestamp=timezone.now(),
+        )
+        InstanceIDModel.get_or_create_current_instance()
+
+        records = self._generate_records()
+        while True:
+            batch = list(itertools.chain.from_iterable(itertools.islice(records, batch_size)))
+            if not batch:
+                break
+            for model in (Store, RecordMaxCounter, Buffer, RecordMaxCounterBuffer):
+                model.objects.bulk_create([m for m in batch if isinstance(m, model)])
+
+        with connection.cursor() as cursor:
+            for model in (Store, RecordMaxCounter, Buffer, RecordMaxCounterBuffer):
+                cursor.execute(
+                    "ANALYZE {}".format(connection.ops.quote_name(model._meta.db_table))
+                )
+
+    def run(self, engine):
+        """
+        Dequeues the buffers with the engine, and rolls back
+
+        :param engine: The `MORANGO_DEQUEUE_ENGINE` to dequeue with
+        :return: A tuple of the stats of dequeuing, and the number of store records it wrote
+        """
+        stats = StageStats("dequeue", operation=engine)
+        with transaction.atomic(), override_settings(MORANGO_DEQUEUE_ENGINE=engine):
+            with StatsRecorder(stats):
+                _dequeue_into_store(self.transfer_session, "{}")
+            written = Store.objects.filter(
+                last_transfer_session_id=self.transfer_session.id
+            ).count()
+            transaction.set_rollback(True)
+        return stats, written
+
+    def run_cleanup(self):
+        """
+        Deletes the buffers of the transfer session, and rolls back
+
+        :return: The stats of deleting the buffers
+        """
+        stats = StageStats("cleanup")
+        with transaction.atomic():
+            with StatsRecorder(stats):
+                self.transfer_session.delete_buffers()
+            transaction.set_rollback(True)
+        return stats
+
+
+class Command(BaseCommand):
+    help = "Benchmarks dequeuing buffers into the store with each of the dequeue engines."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--records",
+            type=int,
+            default=10000,
+            help="Number of buffered records to dequeue",
+        )
+        parser.add_argument(
+            "--store-records",
+            type=int,
+            default=100000,
+            help="Number of other store records, which aren't buffered",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Number of times to run each engine, keeping the fastest",
+        )
+
+    def handle(self, *args, **options):
+        benchmark = DequeueBenchmark(
+            records=options["records"], store_records=options["store_records"]
+        )
+        with benchmark_database():
+            self.stdout.write(
+                "Generating {} buffered and {} other store records...".format(
+                    benchmark.records, benchmark.store_records
+                )
+            )
+            benchmark.populate()
+            for engine in ENGINES:
+                runs = [benchmark.run(engine) for _ in range(options["repeat"])]
+                stats, written = min(runs, key=lambda run: run[0].wall_time)
+                self.stdout.write(
+                    "{} database, {} engine: wrote {} store records in {:.3f}s with {} queries".format(
+                        connection.vendor,
+                        engine,
+                        written,
+                        stats.wall_time,
+                        stats.query_count,
+                    )
+                )
+            stats = min(
+                (benchmark.run_cleanup() for _ in range(options["repeat"])),
+                key=lambda stats: stats.wall_time,
+            )
+            self.stdout.write(
+                "{} database: deleted buffers in {:.3f}s with {} queries".format(
+                    connection.vendor, stats.wall_time, stats.query_count
+                )
+            )
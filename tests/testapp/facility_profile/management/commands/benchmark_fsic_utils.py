@@ -0,0 +1,110 @@
+"""
+Microbenchmarks the FSIC utilities on FSICs shaped like a facility's, with one sub-partition per
+learner, at increasing numbers of learners:
+
+    python tests/testapp/manage.py benchmark_fsic_utils --learners 1000 10000
+"""
+import copy
+import timeit
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from morango.models.fsic_utils import calculate_directional_fsic_diff_v2
+from morango.models.fsic_utils import expand_fsic_for_use
+from morango.models.fsic_utils import remove_redundant_instance_counters
+
+
+def generate_raw_fsic(learners, instances):
+    """
+    :param learners: The number of learners in the facility, each with their own sub-partition
+    :param instances: The number of instances that saved data in each partition
+    :return: A tuple of a raw FSIC of a facility, and its filter
+    """
+    facility = uuid.uuid4().hex
+    instance_ids = [uuid.uuid4().hex for _ in range(instances)]
+    sub = {
+        "{}:user-rw:{}".format(facility, uuid.uuid4().hex): {
+            instance_id: i + j for j, instance_id in enumerate(instance_ids)
+        }
+        for i in range(learners)
+    }
+    sub["{}:anyone-rw".format(facility)] = {
+        instance_id: learners for instance_id in instance_ids
+    }
+    raw_fsic = {
+        "super": {facility: {instance_id: learners // 2 for instance_id in instance_ids}},
+        "sub": sub,
+    }
+    return raw_fsic, [facility]
+
+
+class Command(BaseCommand):
+    help = "Microbenchmarks the FSIC utilities at increasing numbers of sub-partitions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--learners",
+            type=int,
+            nargs="+",
+            default=[100, 1000, 10000],
+            help="Numbers of learners, each with their own sub-partition, to benchmark",
+        )
+        parser.add_argument(
+            "--instances",
+            type=int,
+            default=3,
+            help="Number of instances that saved data in each partition",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Number of times to time each function, keeping the fastest",
+        )
+
+    def _time(self, func, setup, repeat):
+        """
+        :return: The fastest time, in seconds, of calling the function with the arguments returned
+            by the setup, which isn't timed
+        """
+        times = []
+        for _ in range(repeat):
+            args = setup()
+            times.append(timeit.timeit(lambda: func(*args), number=1))
+        return min(times)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            "{:>10} {:>28} {:>24} {:>24}".format(
+                "learners",
+                "remove_redundant_counters",
+                "expand_fsic_for_use",
+                "directional_fsic_diff",
+            )
+        )
+        for learners in options["learners"]:
+            raw_fsic, sync_filter = generate_raw_fsic(learners, options["instances"])
+            expanded = expand_fsic_for_use(copy.deepcopy(raw_fsic), sync_filter)
+            receiving = {part: {} for part in expanded}
+
+            timings = (
+                self._time(
+                    remove_redundant_instance_counters,
+                    lambda: (copy.deepcopy(raw_fsic),),
+                    options["repeat"],
+                ),
+                self._time(
+                    expand_fsic_for_use,
+                    lambda: (copy.deepcopy(raw_fsic), sync_filter),
+                    options["repeat"],
+                ),
+                self._time(
+                    calculate_directional_fsic_diff_v2,
+                    lambda: (expanded, receiving),
+                    options["repeat"],
+                ),
+            )
+            self.stdout.write(
+                "{:>10} {:>27.4f}s {:>23.4f}s {:>23.4f}s".format(learners, *timings)
+            )
@@ -0,0 +1,236 @@
+"""
+Benchmarks queuing a few changed records out of a large store, with and without the store's
+queuing indexes, reporting the database's plan for the queuing query along with its timing:
+
+    python tests/testapp/manage.py benchmark_queue_plan --records 2000000
+    python tests/testapp/manage.py benchmark_queue_plan --synced-partitions 10
+    python tests/testapp/manage.py benchmark_queue_plan --settings testapp.postgres_settings
+"""
+import itertools
+import json
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from .benchmark_sync import benchmark_database
+from morango.models.core import Buffer
+from morango.models.core import Store
+from morango.models.core import SyncSession
+from morango.models.core import TransferSession
+from morango.sync.operations import _queue_into_buffer_v2
+from morango.sync.stats import StageStats
+from morango.sync.stats import StatsRecorder
+
+
+PROFILE = "facilitydata"
+
+QUEUE_INDEXES = ("idx_morango_queue_profile", "idx_morango_queue_partition")
+
+
+class QueuePlanBenchmark(object):
+    """
+    Generates a store of records saved by several instances, and measures queuing the records that
+    were changed since the receiving end last synced with each instance
+    """
+
+    def __init__(
+        self,
+        records=1000000,
+        instances=10,
+        partitions=100,
+        changed=1000,
+        synced_partitions=0,
+    ):
+        """
+        :param records: The number of store records, spread across the instances and partitions
+        :param instances: The number of instances that saved the records
+        :param partitions: The number of partitions to spread the records across
+        :param changed: The number of records that are newer than the receiving end's FSIC
+        :param synced_partitions: The number of partitions the sync is filtered to, or 0 to sync
+            the whole profile
+        """
+        self.records = records
+        self.instances = [uuid.uuid4().hex for _ in range(instances)]
+        self.partitions = [
+            "{}:user:summary".format(uuid.uuid4().hex) for _ in range(partitions)
+        ]
+        self.changed = changed
+        self.synced_partitions = self.partitions[:synced_partitions] or [""]
+
+    @property
+    def parameters(self):
+        return {
+            "records": self.records,
+            "instances": len(self.instances),
+            "partitions": len(self.partitions),
+            "changed": self.changed,
+            "synced_partitions": len([p for p in self.synced_partitions if p]),
+        }
+
+    def _generate_records(self):
+        for i in range(self.records):
+            yield Store(
+                id=uuid.uuid4().hex,
+                serialized="{}",
+                last_saved_instance=self.instances[i % len(self.instances)],
+                last_saved_counter=i // len(self.instances) + 1,
+                model_name="summarylog",
+                profile=PROFILE,
+                partition=self.partitions[i % len(self.partitions)],
+                source_id=uuid.uuid4().hex,
+                dirty_bit=False,
+            )
+
+    def populate(self, batch_size=5000):
+        """
+        Fills the store with the synthetic records
+        """
+        records = self._generate_records()
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                break
+            Store.objects.bulk_create(batch)
+
+    def _get_fsics(self):
+        """
+        :return: A tuple of the FSIC of the producing end, which has all records, and of the
+            receiving end, which lacks the last `changed` records
+        """
+        counters = dict.fromkeys(self.instances, 0)
+        for i in range(self.records):
+            counters[self.instances[i % len(self.instances)]] += 1
+        client_fsic = {
+            "super": {},
+            "sub": {p: dict(counters) for p in self.synced_partitions},
+        }
+        for i in range(self.records - self.changed, self.records):
+            counters[self.instances[i % len(self.instances)]] -= 1
+        server_fsic = {
+            "super": {},
+            "sub": {p: dict(counters) for p in self.synced_partitions},
+        }
+        return client_fsic, server_fsic
+
+    def set_indexed(self, indexed):
+        """
+        Adds or removes the store's queuing indexes, and refreshes the planner's statistics
+        """
+        indexes = [i for i in Store._meta.indexes if i.name in QUEUE_INDEXES]
+        with connection.schema_editor() as schema_editor:
+            for index in indexes:
+                if indexed:
+                    schema_editor.add_index(Store, index)
+                else:
+                    schema_editor.remove_index(Store, index)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "ANALYZE {}".format(connection.ops.quote_name(Store._meta.db_table))
+            )
+
+    def _explain(self, plan, execute, sql, params, many, context):
+        # the temporary table of the FSIC only exists during queuing, so explain it from within,
+        # once for the first partition queued
+        if not plan and sql.lstrip().startswith(
+            "INSERT INTO {}".format(Buffer._meta.db_table)
+        ):
+            prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+            cursor = context["cursor"].cursor
+            cursor.execute(prefix + sql, params)
+            plan.extend(str(row[-1]) for row in cursor.fetchall())
+        return execute(sql, params, many, context)
+
+    def run(self):
+        """
+        Queues the changed records, in the current state of the store's indexes
+
+        :return: A tuple of the stats of queuing, the number of records queued, and a list of the
+            lines of the plan of the query that queued them
+        """
+        client_fsic, server_fsic = self._get_fsics()
+        sync_session = SyncSession.objects.create(
+            id=uuid.uuid4().hex,
+            profile=PROFILE,
+            last_activity_timestamp=timezone.now(),
+        )
+        transfer_session = TransferSession.objects.create(
+            id=uuid.uuid4().hex,
+            sync_session=sync_session,
+            filter="\n".join(self.synced_partitions),
+            push=True,
+            last_activity_timestamp=timezone.now(),
+            client_fsic=json.dumps(client_fsic),
+            server_fsic=json.dumps(server_fsic),
+        )
+
+        plan = []
+        stats = StageStats("queue")
+        with connection.execute_wrapper(
+            lambda *args: self._explain(plan, *args)
+        ), StatsRecorder(stats):
+            _queue_into_buffer_v2(transfer_session)
+        queued = Buffer.objects.filter(transfer_session=transfer_session).count()
+        return stats, queued, plan
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the plan and timing of queuing, with and without the store's queuing indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--records",
+            type=int,
+            default=1000000,
+            help="Number of store records to generate",
+        )
+        parser.add_argument(
+            "--instances",
+            type=int,
+            default=10,
+            help="Number of instances that saved the records",
+        )
+        parser.add_argument(
+            "--partitions",
+            type=int,
+            default=100,
+            help="Number of partitions to spread the records across",
+        )
+        parser.add_argument(
+            "--changed",
+            type=int,
+            default=1000,
+            help="Number of records to queue, as the newest saved by the instances",
+        )
+        parser.add_argument(
+            "--synced-partitions",
+            type=int,
+            default=0,
+            help="Number of partitions to filter the sync to, or 0 to sync the whole profile",
+        )
+
+    def handle(self, *args, **options):
+        benchmark = QueuePlanBenchmark(
+            records=options["records"],
+            instances=options["instances"],
+            partitions=options["partitions"],
+            changed=options["changed"],
+            synced_partitions=options["synced_partitions"],
+        )
+        with benchmark_database():
+            self.stdout.write("Generating {} store records...".format(benchmark.records))
+            benchmark.populate()
+            for indexed in (False, True):
+                benchmark.set_indexed(indexed)
+                stats, queued, plan = benchmark.run()
+                self.stdout.write(
+                    "{} database, {} queuing indexes: queued {} records in {:.3f}s".format(
+                        connection.vendor,
+                        "with" if indexed else "without",
+                        queued,
+                        stats.wall_time,
+                    )
+                )
+                for line in plan:
+                    self.stdout.write("    {}".format(line))
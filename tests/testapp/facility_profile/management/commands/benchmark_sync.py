@@ -0,0 +1,432 @@
+"""
+Benchmarks the stages of the sync pipeline, on synthetic datasets of the `facility_profile` models,
+in a fresh test database. Runs against SQLite by default, or PostgreSQL with its settings:
+
+    python tests/testapp/manage.py benchmark_sync --records 10000 --output sqlite.json
+    python tests/testapp/manage.py benchmark_sync --settings testapp.postgres_settings
+
+Results are written as JSON, so that runs can be compared across commits with `--compare`.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from facility_profile.models import Facility
+from facility_profile.models import MyUser
+from facility_profile.models import SummaryLog
+
+from morango.models.certificates import Filter
+from morango.models.core import Buffer
+from morango.models.core import DatabaseMaxCounter
+from morango.models.core import InstanceIDModel
+from morango.models.core import RecordMaxCounterBuffer
+from morango.models.core import Store
+from morango.models.core import SyncSession
+from morango.models.core import TransferSession
+from morango.sync.operations import _dequeue_into_store
+from morango.sync.operations import _deserialize_from_store
+from morango.sync.operations import _queue_into_buffer_v2
+from morango.sync.operations import _serialize_into_store
+from morango.sync.stats import StageStats
+from morango.sync.stats import StatsRecorder
+
+
+PROFILE = "facilitydata"
+
+SERIALIZE = "serialize"
+QUEUE = "queue"
+DEQUEUE = "dequeue"
+DESERIALIZE = "deserialize"
+STAGES = (SERIALIZE, QUEUE, DEQUEUE, DESERIALIZE)
+
+RESULTS_VERSION = 1
+
+
+class SyncBenchmark(object):
+    """
+    Generates a synthetic dataset, and measures each stage of syncing it: serializing the app models
+    of several instances into the store, queuing the store for a transfer, dequeuing records changed
+    by another instance back into the store, and deserializing them into the app models
+    """
+
+    def __init__(self, records=1000, partitions=10, instances=2, depth=3, facilities=10):
+        """
+        :param records: The number of log records, spread across the users
+        :param partitions: The number of users, each with their own partition
+        :param instances: The number of instances that create and serialize the data
+        :param depth: The depth of the chains of self-referential facilities
+        :param facilities: The number of facilities each instance creates
+        """
+        self.records = records
+        self.partitions = partitions
+        self.instances = instances
+        self.depth = depth
+        self.facilities = facilities
+
+    @property
+    def parameters(self):
+        return {
+            "records": self.records,
+            "partitions": self.partitions,
+            "instances": self.instances,
+            "depth": self.depth,
+            "facilities": self.facilities,
+        }
+
+    def _use_instance(self, name):
+        """
+        Switches the current morango instance, through its system ID
+        """
+        os.environ["MORANGO_SYSTEM_ID"] = "morango-benchmark-{}".format(name)
+        return InstanceIDModel.get_or_create_current_instance(clear_cache=True)[0]
+
+    def _create_app_data(self, index):
+        """
+        Creates the app models of one instance
+        """
+        facilities = []
+        for i in range(self.facilities):
+            parent = facilities[-1] if i % self.depth and facilities else None
+            facility = Facility(name="Facility {}-{}".format(index, i), parent=parent)
+            facility.id = facility.calculate_uuid()
+            facilities.append(facility)
+        Facility.objects.bulk_create(facilities)
+
+        users = []
+        for i in range(index, self.partitions, self.instances):
+            user = MyUser(username="user{}".format(i))
+            user.set_unusable_password()
+            user.id = user.calculate_uuid()
+            users.append(user)
+        MyUser.objects.bulk_create(users)
+
+        logs = []
+        for i in range(index, self.records, self.instances):
+            # spread the logs of this instance across its users
+            if not users:
+                break
+            log = SummaryLog(user=users[(i // self.instances) % len(users)])
+            log.id = log.calculate_uuid()
+            logs.append(log)
+        SummaryLog.objects.bulk_create(logs, batch_size=500)
+
+    def _serialize(self):
+        stats = StageStats(SERIALIZE)
+        for index in range(self.instances):
+            self._use_instance(index)
+            self._create_app_data(index)
+            with StatsRecorder(stats):
+                _serialize_into_store(PROFILE)
+        return stats, Store.objects.count()
+
+    def _create_transfer_session(self, push, **kwargs):
+        sync_session = SyncSession.objects.create(
+            id=uuid.uuid4().hex,
+            profile=PROFILE,
+            last_activity_timestamp=timezone.now(),
+        )
+        return TransferSession.objects.create(
+            id=uuid.uuid4().hex,
+            sync_session=sync_session,
+            filter="",
+            push=push,
+            last_activity_timestamp=timezone.now(),
+            **kwargs
+        )
+
+    def _queue(self):
+        client_fsic = DatabaseMaxCounter.calculate_filter_specific_instance_counters(
+            Filter(""), is_producer=True, v2_format=True
+        )
+        transfer_session = self._create_transfer_session(
+            True,
+            client_fsic=json.dumps(client_fsic),
+            server_fsic=json.dumps({"super": {}, "sub": {}}),
+        )
+        stats = StageStats(QUEUE)
+        with StatsRecorder(stats):
+            _queue_into_buffer_v2(transfer_session)
+        return stats, transfer_session
+
+    def _receive(self, queued_transfer_session):
+        """
+        Buffers the queued records as if another instance had changed all of them and they had been
+        transferred from it
+
+        :return: A tuple of the receiving transfer session, and the FSIC of the other instance
+        """
+        remote_instance_id = uuid.uuid4().hex
+        transfer_session = self._create_transfer_session(False)
+
+        buffers = []
+        rmcbs = []
+        for buffer in Buffer.objects.filter(transfer_session=queued_transfer_session):
+            buffer.pk = None
+            buffer.transfer_session = transfer_session
+            buffer.last_saved_instance = remote_instance_id
+            buffer.last_saved_counter = 1
+            buffers.append(buffer)
+            rmcbs.append(
+                RecordMaxCounterBuffer(
+                    transfer_session=transfer_session,
+                    model_uuid=buffer.model_uuid,
+                    instance_id=remote_instance_id,
+                    counter=1,
+                )
+            )
+        for rmcb in RecordMaxCounterBuffer.objects.filter(
+            transfer_session=queued_transfer_session
+        ):
+            rmcb.pk = None
+            rmcb.transfer_session = transfer_session
+            rmcbs.append(rmcb)
+        Buffer.objects.bulk_create(buffers, batch_size=500)
+        RecordMaxCounterBuffer.objects.bulk_create(rmcbs, batch_size=500)
+
+        transfer_session.records_total = transfer_session.records_transferred = len(
+            buffers
+        )
+        transfer_session.save()
+        fsic = {"super": {}, "sub": {"": {remote_instance_id: 1}}}
+        return transfer_session, json.dumps(fsic)
+
+    def _dequeue(self, transfer_session, fsic):
+        stats = StageStats(DEQUEUE)
+        with StatsRecorder(stats):
+            _dequeue_into_store(transfer_session, fsic, v2_format=True)
+        return stats
+
+    def _deserialize(self):
+        stats = StageStats(DESERIALIZE)
+        with StatsRecorder(stats):
+            _deserialize_from_store(PROFILE)
+        return stats
+
+    def run(self):
+        """
+        Runs the benchmark once, in the current database, which should be empty
+
+        :return: A dict of the stats of each stage, and the number of records it handled, by stage
+        """
+        system_id = os.environ.get("MORANGO_SYSTEM_ID")
+        try:
+            results = {}
+            stats, records = self._serialize()
+            results[SERIALIZE] = (stats, records)
+
+            stats, queued_transfer_session = self._queue()
+            queued = Buffer.objects.filter(
+                transfer_session=queued_transfer_session
+            ).count()
+            results[QUEUE] = (stats, queued)
+
+            self._use_instance("receiver")
+            transfer_session, fsic = self._receive(queued_transfer_session)
+            results[DEQUEUE] = (self._dequeue(transfer_session, fsic), queued)
+
+            dirty = Store.objects.filter(dirty_bit=True).count()
+            results[DESERIALIZE] = (self._deserialize(), dirty)
+            return results
+        finally:
+            if system_id is None:
+                os.environ.pop("MORANGO_SYSTEM_ID", None)
+            else:
+                os.environ["MORANGO_SYSTEM_ID"] = system_id
+            InstanceIDModel.get_or_create_current_instance(clear_cache=True)
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Runs the wrapped code in a fresh database, the same way tests do, so no existing data is touched
+    """
+    old_name = connection.settings_dict["NAME"]
+    # SQLite test databases default to being in memory, which wouldn't measure any disk I/O
+    if connection.vendor == "sqlite" and not connection.settings_dict["TEST"]["NAME"]:
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(
+            tempfile.gettempdir(), "morango_benchmark.db"
+        )
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def _get_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(__file__),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(benchmark, runs):
+    """
+    :param benchmark: The benchmark that was run
+    :type benchmark: SyncBenchmark
+    :param runs: A list of the results of each `SyncBenchmark.run`
+    :return: A JSON serializable dict of the results
+    """
+    stages = {}
+    for stage in STAGES:
+        stage_runs = [run[stage][0].as_dict() for run in runs]
+        wall_times = [stage_run["wall_time"] for stage_run in stage_runs]
+        stages[stage] = {
+            "records": runs[0][stage][1],
+            "wall_time": {
+                "min": min(wall_times),
+                "median": statistics.median(wall_times),
+                "max": max(wall_times),
+            },
+            "runs": stage_runs,
+        }
+    return {
+        "version": RESULTS_VERSION,
+        "commit": _get_commit(),
+        "timestamp": timezone.now().isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "platform": platform.platform(),
+            "database": connection.vendor,
+        },
+        "parameters": benchmark.parameters,
+        "stages": stages,
+    }
+
+
+class Command(BaseCommand):
+    help = "Benchmarks serializing, queuing, dequeuing and deserializing synthetic sync data."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--records",
+            type=int,
+            default=1000,
+            help="Number of log records to generate",
+        )
+        parser.add_argument(
+            "--partitions",
+            type=int,
+            default=10,
+            help="Number of users to spread the records across, each with their own partition",
+        )
+        parser.add_argument(
+            "--instances",
+            type=int,
+            default=2,
+            help="Number of morango instances that create and serialize the data",
+        )
+        parser.add_argument(
+            "--depth",
+            type=int,
+            default=3,
+            help="Depth of the chains of self-referential facilities",
+        )
+        parser.add_argument(
+            "--facilities",
+            type=int,
+            default=10,
+            help="Number of facilities each instance creates",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Number of times to run the benchmark, from an empty database",
+        )
+        parser.add_argument(
+            "--output",
+            type=str,
+            default=None,
+            help="Path of a JSON file to write the results to",
+        )
+        parser.add_argument(
+            "--compare",
+            type=str,
+            default=None,
+            help="Path of a JSON file of earlier results to compare against",
+        )
+
+    def handle(self, *args, **options):
+        benchmark = SyncBenchmark(
+            records=options["records"],
+            partitions=options["partitions"],
+            instances=options["instances"],
+            depth=options["depth"],
+            facilities=options["facilities"],
+        )
+
+        previous = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                previous = json.load(f)
+
+        with benchmark_database():
+            runs = []
+            for i in range(options["repeat"]):
+                if i > 0:
+                    call_command("flush", interactive=False, verbosity=0)
+                runs.append(benchmark.run())
+            results = summarize(benchmark, runs)
+
+        self._print_results(results, previous)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+
+    def _print_results(self, results, previous=None):
+        if previous:
+            self.stdout.write(
+                "Comparing with the results of commit {}".format(previous.get("commit"))
+            )
+            if previous.get("parameters") != results["parameters"]:
+                self.stdout.write(
+                    self.style.WARNING(
+                        "The results were measured with different parameters: {}".format(
+                            previous.get("parameters")
+                        )
+                    )
+                )
+        self.stdout.write(
+            "{} database, {}".format(
+                results["environment"]["database"],
+                ", ".join(
+                    "{}={}".format(key, value)
+                    for key, value in sorted(results["parameters"].items())
+                ),
+            )
+        )
+        for stage in STAGES:
+            stage_results = results["stages"][stage]
+            median = stage_results["wall_time"]["median"]
+            line = "{:<12} {:>8} records {:>10.3f}s median {:>8} queries".format(
+                stage,
+                stage_results["records"],
+                median,
+                stage_results["runs"][0]["query_count"],
+            )
+            if previous and stage in previous.get("stages", {}):
+                previous_median = previous["stages"][stage]["wall_time"]["median"]
+                if previous_median:
+                    line += " {:>+8.1%}".format(median / previous_median - 1)
+            self.stdout.write(line)
@@ -1,6 +1,8 @@
 """
 A settings module for running tests using a postgres db backend.
 """
+import os
+
 from .settings import *  # noqa
 
 DATABASES = {
@@ -17,3 +19,6 @@ DATABASES = {
 }
 
 MORANGO_TEST_POSTGRESQL = True
+
+# the dequeue engine can be switched to run the suite against each engine's SQL
+MORANGO_DEQUEUE_ENGINE = os.environ.get("MORANGO_DEQUEUE_ENGINE", "stepwise")
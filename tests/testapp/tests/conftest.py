@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_morango_caches():
+    from morango.models.core import DatabaseMaxCounter
+    from morango.models.core import InstanceIDModel
+
+    # tests roll back their changes, which can remove the cached instance ID, or restore the
+    # counters an FSIC was cached for while the store records it was reduced against differ
+    InstanceIDModel._cached_instance = None
+    DatabaseMaxCounter.clear_fsic_cache()
+    yield
+    InstanceIDModel._cached_instance = None
+    DatabaseMaxCounter.clear_fsic_cache()
@@ -28,6 +28,7 @@ from morango.models.core import Buffer
 from morango.models.core import InstanceIDModel
 from morango.models.core import TransferSession
 from morango.sync.controller import MorangoProfileController
+from morango.sync.utils import ChunkSizeController
 
 
 SECOND_TEST_DATABASE = "default2"
@@ -291,6 +292,88 @@ class PushPullClientTestCase(TransactionTestCase):
         self.assertEqual(5, SummaryLog.objects.filter(user=self.local_user).count())
         self.assertEqual(5, InteractionLog.objects.filter(user=self.local_user).count())
 
+    def test_push__pipelined(self):
+        self.conn.pipeline_depth = 3
+        for _ in range(10):
+            SummaryLog.objects.create(user=self.local_user)
+            InteractionLog.objects.create(user=self.local_user)
+
+        client = self.client.get_push_client()
+        client.initialize(self.filter)
+        transfer_session = client.context.transfer_session
+        self.assertLess(
+            self.conn.chunk_size * self.conn.pipeline_depth,
+            transfer_session.records_total,
+        )
+        client.run()
+        self.assertEqual(
+            transfer_session.records_total, transfer_session.records_transferred
+        )
+        with second_environment():
+            remote_transfer_session = TransferSession.objects.get(id=transfer_session.id)
+            self.assertEqual(
+                transfer_session.records_total,
+                remote_transfer_session.records_transferred,
+            )
+        client.finalize()
+
+        with second_environment():
+            self.assertEqual(
+                10, SummaryLog.objects.filter(user=self.remote_user).count()
+            )
+            self.assertEqual(
+                10, InteractionLog.objects.filter(user=self.remote_user).count()
+            )
+
+    def test_pull__pipelined(self):
+        self.conn.pipeline_depth = 3
+        with second_environment():
+            for _ in range(10):
+                SummaryLog.objects.create(user=self.remote_user)
+                InteractionLog.objects.create(user=self.remote_user)
+
+        client = self.client.get_pull_client()
+        client.initialize(self.filter)
+        transfer_session = client.context.transfer_session
+        self.assertLess(
+            self.conn.chunk_size * self.conn.pipeline_depth,
+            transfer_session.records_total,
+        )
+        client.run()
+        self.assertEqual(
+            transfer_session.records_total, transfer_session.records_transferred
+        )
+        self.assertEqual(
+            transfer_session.records_total,
+            Buffer.objects.filter(transfer_session=transfer_session).count(),
+        )
+        client.finalize()
+
+        self.assertEqual(10, SummaryLog.objects.filter(user=self.local_user).count())
+        self.assertEqual(10, InteractionLog.objects.filter(user=self.local_user).count())
+
+    def test_pull__adaptive_chunk_size(self):
+        self.conn.chunk_size_controller = ChunkSizeController(2, 10, increase_step=2)
+        with second_environment():
+            for _ in range(10):
+                SummaryLog.objects.create(user=self.remote_user)
+                InteractionLog.objects.create(user=self.remote_user)
+
+        client = self.client.get_pull_client()
+        client.initialize(self.filter)
+        transfer_session = client.context.transfer_session
+        client.run()
+        self.assertEqual(
+            transfer_session.records_total, transfer_session.records_transferred
+        )
+        chunk_sizes = transfer_session.get_chunk_sizes()
+        self.assertEqual([0, 3], chunk_sizes[0])
+        self.assertLess(1, len(chunk_sizes))
+        client.finalize()
+
+        self.assertEqual(10, SummaryLog.objects.filter(user=self.local_user).count())
+        self.assertEqual(10, InteractionLog.objects.filter(user=self.local_user).count())
+
     def test_full_flow_and_repeat(self):
         with second_environment():
             for _ in range(5):
@@ -1,21 +1,34 @@
+import json
 import uuid
+from unittest import skipUnless
 
 import factory
+import mock
+from django.db import connection
+from django.db.models import F
 from django.test import override_settings
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from facility_profile.models import MyUser
 
+from ..helpers import BufferFactory
+from ..helpers import RecordMaxCounterBufferFactory
 from ..helpers import RecordMaxCounterFactory
 from ..helpers import StoreFactory
 from morango.constants import transfer_stages
 from morango.constants import transfer_statuses
 from morango.models.certificates import Filter
+from morango.models.core import Buffer
 from morango.models.core import DatabaseMaxCounter
+from morango.models.core import InstanceIDModel
+from morango.models.core import RecordMaxCounterBuffer
 from morango.models.core import Store
 from morango.models.core import SyncSession
 from morango.models.core import TransferSession
 from morango.sync.controller import MorangoProfileController
+from morango.sync.operations import _dequeue_into_store
+from morango.sync.operations import _serialize_into_store
 
 
 class DatabaseMaxCounterFactory(factory.DjangoModelFactory):
@@ -246,6 +259,211 @@ class DatabaseMaxCounterTestCase(BaseDatabaseMaxCounterTestCase):
         self.assertEqual(20, partition_counters.get(self.instance_a))
         self.assertEqual(10, partition_counters.get(self.instance_b))
 
+    def _get_counters(self):
+        return {
+            (dmc.instance_id, dmc.partition): dmc.counter
+            for dmc in DatabaseMaxCounter.objects.all()
+        }
+
+    def test_update_fsics__v2(self):
+        instance_c = "c" * 32
+        fsics = {
+            "super": {},
+            "sub": {
+                self.user_prefix_a: {self.instance_a: 25, self.instance_b: 1},
+                self.user_prefix_b: {self.instance_b: 11, instance_c: 3},
+            },
+        }
+        with CaptureQueriesContext(connection) as queries:
+            DatabaseMaxCounter.update_fsics(
+                fsics, Filter(self.user_prefix_a + "\n" + self.user_prefix_b), v2_format=True
+            )
+        self.assertEqual(
+            1, len([q for q in queries if q["sql"].lstrip().startswith("INSERT")])
+        )
+
+        counters = self._get_counters()
+        # raised
+        self.assertEqual(25, counters[(self.instance_a, self.user_prefix_a)])
+        self.assertEqual(11, counters[(self.instance_b, self.user_prefix_b)])
+        # not lowered
+        self.assertEqual(10, counters[(self.instance_b, self.user_prefix_a)])
+        # added
+        self.assertEqual(3, counters[(instance_c, self.user_prefix_b)])
+        # untouched
+        self.assertEqual(15, counters[(self.instance_a, self.prefix_a)])
+
+    def test_update_fsics__v1(self):
+        DatabaseMaxCounter.update_fsics(
+            {self.instance_a: 18, self.instance_b: 11},
+            Filter(self.user_prefix_a + "\n" + self.user_prefix_b),
+        )
+        counters = self._get_counters()
+        self.assertEqual(20, counters[(self.instance_a, self.user_prefix_a)])
+        self.assertEqual(18, counters[(self.instance_a, self.user_prefix_b)])
+        self.assertEqual(11, counters[(self.instance_b, self.user_prefix_a)])
+        self.assertEqual(11, counters[(self.instance_b, self.user_prefix_b)])
+
+    @skipUnless(connection.vendor == "sqlite", "Only SQLite lacks upserts in older versions")
+    def test_update_fsics__sqlite_without_upsert(self):
+        fsics = {
+            "super": {},
+            "sub": {
+                self.user_prefix_a: {self.instance_a: 25, self.instance_b: 1, "c" * 32: 3}
+            },
+        }
+        with mock.patch.object(connection.Database, "sqlite_version_info", (3, 22, 0)):
+            DatabaseMaxCounter.update_fsics(fsics, Filter(self.user_prefix_a), v2_format=True)
+        counters = self._get_counters()
+        self.assertEqual(25, counters[(self.instance_a, self.user_prefix_a)])
+        self.assertEqual(10, counters[(self.instance_b, self.user_prefix_a)])
+        self.assertEqual(3, counters[("c" * 32, self.user_prefix_a)])
+
+
+@override_settings(MORANGO_DISABLE_FSIC_REDUCTION=True)
+class FSICCacheTestCase(BaseDatabaseMaxCounterTestCase):
+    def setUp(self):
+        super(FSICCacheTestCase, self).setUp()
+        DatabaseMaxCounter.clear_fsic_cache()
+        self.filter = Filter(self.user_prefix_a + "\n" + self.user_prefix_b)
+
+    def tearDown(self):
+        DatabaseMaxCounter.clear_fsic_cache()
+        super(FSICCacheTestCase, self).tearDown()
+
+    def _calculate(self, **kwargs):
+        return DatabaseMaxCounter.calculate_filter_specific_instance_counters(
+            self.filter, v2_format=True, **kwargs
+        )
+
+    def test_cached(self):
+        fsic = self._calculate()
+        with CaptureQueriesContext(connection) as queries:
+            cached_fsic = self._calculate()
+        # only the version of the counters is queried
+        self.assertEqual(1, len(queries))
+        self.assertEqual(fsic, cached_fsic)
+
+        # the cached FSIC is a copy
+        cached_fsic["sub"].clear()
+        self.assertEqual(fsic, self._calculate())
+
+    def test_cached__by_arguments(self):
+        self._calculate()
+        with CaptureQueriesContext(connection) as queries:
+            self._calculate(is_producer=True)
+        self.assertGreater(len(queries), 1)
+
+    def test_invalidated__counter_raised(self):
+        self._calculate()
+        DatabaseMaxCounter.update_fsics(
+            {"super": {}, "sub": {self.user_prefix_b: {self.instance_b: 30}}},
+            self.filter,
+            v2_format=True,
+        )
+        fsic = self._calculate()
+        self.assertEqual(30, fsic["sub"][self.user_prefix_b][self.instance_b])
+
+    def test_invalidated__counter_added(self):
+        instance_c = "c" * 32
+        self._calculate()
+        DatabaseMaxCounterFactory(
+            instance_id=instance_c, partition=self.user_prefix_b, counter=1
+        )
+        fsic = self._calculate()
+        self.assertEqual(1, fsic["sub"][self.user_prefix_b][instance_c])
+
+    def test_invalidated__counter_deleted(self):
+        self._calculate()
+        DatabaseMaxCounter.objects.filter(partition=self.user_prefix_b).delete()
+        fsic = self._calculate()
+        self.assertNotIn(self.user_prefix_b, fsic["sub"])
+
+    def test_invalidated__serialization(self):
+        MyUser.objects.create(username="serialized")
+        self._calculate(is_producer=True)
+        _serialize_into_store(MyUser.morango_profile)
+        current_id = InstanceIDModel.get_or_create_current_instance()[0]
+        fsic = DatabaseMaxCounter.calculate_filter_specific_instance_counters(
+            Filter(""), is_producer=True, v2_format=True
+        )
+        self.assertEqual(current_id.counter, fsic["sub"][""][current_id.id])
+
+    def _create_pushed_transfer_session(self):
+        sync_session = SyncSession.objects.create(
+            id=uuid.uuid4().hex,
+            profile="facilitydata",
+            is_server=True,
+            last_activity_timestamp=timezone.now(),
+        )
+        return TransferSession.objects.create(
+            id=uuid.uuid4().hex,
+            sync_session=sync_session,
+            filter=self.user_prefix_a,
+            push=True,
+            last_activity_timestamp=timezone.now(),
+        )
+
+    def _buffer_record(self, transfer_session):
+        record_id = uuid.uuid4().hex
+        BufferFactory(
+            model_uuid=record_id,
+            transfer_session=transfer_session,
+            serialized="{}",
+            partition=self.user_prefix_a,
+            source_id=record_id,
+            last_saved_instance=self.instance_b,
+            last_saved_counter=5,
+        )
+        RecordMaxCounterBufferFactory(
+            model_uuid=record_id,
+            transfer_session=transfer_session,
+            instance_id=self.instance_b,
+            counter=5,
+        )
+
+    @override_settings(MORANGO_DISABLE_FSIC_REDUCTION=False)
+    def test_invalidated__dequeuing(self):
+        # no store record was saved by instance B, so its counters are reduced out
+        fsic = self._calculate(is_producer=True)
+        self.assertNotIn(self.user_prefix_a, fsic["sub"])
+
+        transfer_session = self._create_pushed_transfer_session()
+        self._buffer_record(transfer_session)
+        # the dequeued FSIC raises no counters
+        _dequeue_into_store(
+            transfer_session, json.dumps({"super": {}, "sub": {}}), v2_format=True
+        )
+        fsic = self._calculate(is_producer=True)
+        self.assertEqual(10, fsic["sub"][self.user_prefix_a][self.instance_b])
+
+    def test_invalidated__during_calculation(self):
+        calculate = DatabaseMaxCounter._calculate_filter_specific_instance_counters
+
+        def calculate_while_updated(*args, **kwargs):
+            fsic = calculate(*args, **kwargs)
+            DatabaseMaxCounter.update_fsics(
+                {"super": {}, "sub": {self.user_prefix_b: {self.instance_b: 30}}},
+                self.filter,
+                v2_format=True,
+            )
+            return fsic
+
+        with mock.patch.object(
+            DatabaseMaxCounter,
+            "_calculate_filter_specific_instance_counters",
+            side_effect=calculate_while_updated,
+        ):
+            self._calculate()
+        fsic = self._calculate()
+        self.assertEqual(30, fsic["sub"][self.user_prefix_b][self.instance_b])
+
+    @override_settings(MORANGO_FSIC_CACHE_SIZE=1)
+    def test_evicted(self):
+        self._calculate()
+        self._calculate(is_producer=True)
+        self.assertEqual(1, len(DatabaseMaxCounter._fsic_cache))
+
 
 class TransferSessionTestCase(TestCase):
     def setUp(self):
@@ -309,6 +527,18 @@ class TransferSessionTestCase(TestCase):
             previous_sync_activity, self.sync_session.last_activity_timestamp
         )
 
+    def test_update_state__keeps_concurrent_counts(self):
+        # a concurrent request adds to the records transferred after this one was loaded
+        TransferSession.objects.filter(pk=self.instance.pk).update(
+            records_transferred=F("records_transferred") + 10
+        )
+        self.instance.update_state(
+            stage=transfer_stages.TRANSFERRING, stage_status=transfer_statuses.PENDING
+        )
+        self.instance.refresh_from_db()
+        self.assertEqual(10, self.instance.records_transferred)
+        self.assertEqual(transfer_stages.TRANSFERRING, self.instance.transfer_stage)
+
     def test_update_state__none(self):
         self.assertIsNone(self.instance.transfer_stage)
         self.assertIsNone(self.instance.transfer_stage_status)
@@ -324,6 +554,71 @@ class TransferSessionTestCase(TestCase):
             previous_sync_activity, self.sync_session.last_activity_timestamp
         )
 
+    def test_record_chunk_size(self):
+        self.assertEqual([], self.instance.get_chunk_sizes())
+        self.instance.record_chunk_size(500)
+        self.instance.records_transferred = 500
+        self.instance.record_chunk_size(500)
+        self.instance.record_chunk_size(550)
+        self.instance.refresh_from_db()
+        self.assertEqual([[0, 500], [500, 550]], self.instance.get_chunk_sizes())
+
+
+class BufferQuerysetTestCase(TestCase):
+    def setUp(self):
+        super(BufferQuerysetTestCase, self).setUp()
+        sync_session = SyncSession.objects.create(
+            id=uuid.uuid4().hex,
+            profile="facilitydata",
+            last_activity_timestamp=timezone.now(),
+        )
+        self.transfer_session = TransferSession.objects.create(
+            id=uuid.uuid4().hex,
+            sync_session=sync_session,
+            push=True,
+            last_activity_timestamp=timezone.now(),
+        )
+        for i in range(5):
+            model_uuid = uuid.uuid4().hex
+            Buffer.objects.create(
+                transfer_session=self.transfer_session,
+                model_uuid=model_uuid,
+                serialized="{}",
+                last_saved_instance=uuid.uuid4().hex,
+                last_saved_counter=i,
+                partition="partition",
+                source_id=uuid.uuid4().hex,
+                model_name="facility",
+                profile="facilitydata",
+            )
+            for counter in range(i):
+                RecordMaxCounterBuffer.objects.create(
+                    transfer_session=self.transfer_session,
+                    model_uuid=model_uuid,
+                    instance_id=uuid.uuid4().hex,
+                    counter=counter,
+                )
+
+    def test_prefetch_rmcb_list(self):
+        queryset = Buffer.objects.filter(transfer_session=self.transfer_session)
+        expected = {
+            buffer.model_uuid: sorted(rmcb.pk for rmcb in buffer.rmcb_list())
+            for buffer in queryset
+        }
+
+        with self.assertNumQueries(2):
+            buffers = list(queryset.order_by("pk").prefetch_rmcb_list()[:5])
+            rmcb_lists = {
+                buffer.model_uuid: sorted(rmcb.pk for rmcb in buffer.rmcb_list())
+                for buffer in buffers
+            }
+        self.assertEqual(expected, rmcb_lists)
+
+    def test_prefetch_rmcb_list__values(self):
+        queryset = Buffer.objects.prefetch_rmcb_list().values_list("pk", flat=True)
+        with self.assertNumQueries(1):
+            self.assertEqual(5, len(queryset))
+
 
 class TransferSessionAndStoreTestCase(TestCase):
     def setUp(self):
@@ -0,0 +1,174 @@
+import json
+import uuid
+
+import mock
+from django.db.models import ForeignKey
+from django.db.models.signals import post_delete
+from django.test import override_settings
+from django.test import TestCase
+from facility_profile.models import Facility
+from facility_profile.models import MyUser
+from facility_profile.models import SummaryLog
+
+from morango.models.core import InstanceIDModel
+from morango.models.core import Store
+from morango.models.fk_cache import fk_existence_cache
+from morango.models.fk_cache import ForeignKeyCache
+from morango.models.fk_cache import ForeignKeyExistenceCache
+from morango.models.fk_cache import get_foreign_key_cache_key
+from morango.serialization import get_codec
+from morango.sync.controller import MorangoProfileController
+from morango.sync.utils import mute_signals
+
+
+class ForeignKeyCacheTestCase(TestCase):
+    def setUp(self):
+        InstanceIDModel.get_or_create_current_instance()
+        self.mc = MorangoProfileController("facilitydata")
+        self.user = MyUser.objects.create(username="penguin")
+        self.log = SummaryLog.objects.create(user=self.user)
+        self.mc.serialize_into_store()
+        self.user_key = (MyUser._meta.db_table, self.user.id)
+
+    def test_get_foreign_key_cache_key(self):
+        field = SummaryLog._meta.get_field("user")
+        self.assertEqual(self.user_key, get_foreign_key_cache_key(field, self.user.id))
+        self.assertIsNone(get_foreign_key_cache_key(field, None))
+
+    def test_prefetch(self):
+        fk_cache = ForeignKeyCache(ForeignKeyExistenceCache())
+        store_models = list(Store.objects.all())
+        # one query for the only referenced user
+        with self.assertNumQueries(1):
+            fk_cache.prefetch(store_models)
+        self.assertIn(self.user_key, fk_cache)
+
+        # already cached
+        with self.assertNumQueries(0):
+            fk_cache.prefetch(store_models)
+
+    def test_prefetch__missing(self):
+        store_log = Store.objects.get(id=self.log.id)
+        data = json.loads(store_log.serialized)
+        data["user_id"] = uuid.uuid4().hex
+        store_log.serialized = json.dumps(data)
+
+        fk_cache = ForeignKeyCache(ForeignKeyExistenceCache())
+        fk_cache.prefetch([store_log])
+        self.assertNotIn((MyUser._meta.db_table, data["user_id"]), fk_cache)
+
+    def test_cached_clean_fields(self):
+        fk_cache = ForeignKeyCache(ForeignKeyExistenceCache())
+        fk_cache.prefetch(Store.objects.all())
+        with mock.patch.object(ForeignKey, "validate") as validate:
+            self.log.cached_clean_fields(fk_cache)
+        validate.assert_not_called()
+        self.assertIn((SummaryLog._meta.db_table, self.log.id), fk_cache)
+
+    @override_settings(MORANGO_FK_CACHE_SIZE=10)
+    def test_publish(self):
+        existence_cache = ForeignKeyExistenceCache()
+        fk_cache = ForeignKeyCache(existence_cache)
+        fk_cache.prefetch(Store.objects.all())
+        with self.captureOnCommitCallbacks(execute=True):
+            fk_cache.publish()
+        self.assertEqual({self.user_key}, existence_cache.get_many([self.user_key]))
+
+        # later deserializations don't query for the cached keys
+        store_models = list(Store.objects.filter(id=self.log.id))
+        with self.assertNumQueries(0):
+            ForeignKeyCache(existence_cache).prefetch(store_models)
+
+    @override_settings(MORANGO_FK_CACHE_SIZE=10)
+    def test_publish__rolled_back(self):
+        existence_cache = ForeignKeyExistenceCache()
+        fk_cache = ForeignKeyCache(existence_cache)
+        fk_cache[self.user_key] = True
+        with self.captureOnCommitCallbacks(execute=False):
+            fk_cache.publish()
+        self.assertEqual(set(), existence_cache.get_many([self.user_key]))
+
+    def test_existence_cache__disabled(self):
+        existence_cache = ForeignKeyExistenceCache()
+        existence_cache.set_many([self.user_key])
+        self.assertEqual(set(), existence_cache.get_many([self.user_key]))
+
+    @override_settings(MORANGO_FK_CACHE_SIZE=2)
+    def test_existence_cache__least_recently_used(self):
+        existence_cache = ForeignKeyExistenceCache()
+        keys = [("table", uuid.uuid4().hex) for _ in range(3)]
+        existence_cache.set_many(keys[:2])
+        existence_cache.get_many(keys[:1])
+        existence_cache.set_many(keys[2:])
+        self.assertEqual({keys[0], keys[2]}, existence_cache.get_many(keys))
+
+    @override_settings(MORANGO_FK_CACHE_SIZE=2, MORANGO_FK_CACHE_TIMEOUT=-1)
+    def test_existence_cache__expired(self):
+        existence_cache = ForeignKeyExistenceCache()
+        existence_cache.set_many([self.user_key])
+        self.assertEqual(set(), existence_cache.get_many([self.user_key]))
+
+    @override_settings(MORANGO_FK_CACHE_SIZE=2, MORANGO_FK_CACHE_ALIAS="default")
+    def test_existence_cache__shared(self):
+        ForeignKeyExistenceCache().set_many([self.user_key])
+        existence_cache = ForeignKeyExistenceCache()
+        self.assertEqual({self.user_key}, existence_cache.get_many([self.user_key]))
+        existence_cache.delete(self.user_key)
+        self.assertEqual(set(), ForeignKeyExistenceCache().get_many([self.user_key]))
+
+    @override_settings(MORANGO_FK_CACHE_SIZE=2)
+    def test_existence_cache__deleted(self):
+        fk_existence_cache.set_many([self.user_key])
+        try:
+            self.user.delete()
+            self.assertEqual(set(), fk_existence_cache.get_many([self.user_key]))
+        finally:
+            fk_existence_cache.clear()
+
+    @override_settings(MORANGO_FK_CACHE_SIZE=2)
+    def test_existence_cache__cleared_around_deserialization(self):
+        fk_existence_cache.set_many([self.user_key])
+        try:
+            # deleted without discarding the key, as with cascades during deserialization
+            with mute_signals(post_delete):
+                MyUser.objects.filter(id=self.user.id).delete()
+            with ForeignKeyCache() as fk_cache:
+                self.assertEqual(set(), fk_existence_cache.get_many([self.user_key]))
+                fk_cache.prefetch(Store.objects.filter(id=self.log.id))
+                self.assertNotIn(self.user_key, fk_cache)
+                fk_existence_cache.set_many([self.user_key])
+            self.assertEqual(set(), fk_existence_cache.get_many([self.user_key]))
+        finally:
+            fk_existence_cache.clear()
+
+    def test_prefetch__decoded_once(self):
+        store_log = Store.objects.get(id=self.log.id)
+        codec = type(get_codec())
+        with mock.patch.object(
+            codec, "loads", autospec=True, side_effect=codec.loads
+        ) as loads:
+            fk_cache = ForeignKeyCache(ForeignKeyExistenceCache())
+            fk_cache.prefetch([store_log])
+            store_log._deserialize_store_model(fk_cache)
+        self.assertEqual(1, loads.call_count)
+
+    def test_deserialize_self_referential_children(self):
+        parent = Facility.objects.create(name="parent")
+        self.mc.serialize_into_store()
+        store_parent = Store.objects.get(id=parent.id)
+        for i in range(5):
+            data = json.loads(store_parent.serialized)
+            data["id"] = uuid.uuid4().hex
+            data["name"] = "child{}".format(i)
+            data["parent_id"] = parent.id
+            store_parent.id = data["id"]
+            store_parent.serialized = json.dumps(data)
+            store_parent._self_ref_fk = parent.id
+            store_parent.dirty_bit = True
+            store_parent.save(force_insert=True)
+
+        # the parent is prefetched with the chunk, so no child validates it
+        with mock.patch.object(ForeignKey, "validate") as validate:
+            self.mc.deserialize_from_store()
+        validate.assert_not_called()
+        self.assertEqual(5, Facility.objects.filter(parent=parent).count())
@@ -1,9 +1,17 @@
-from morango.models.fsic_utils import chunk_fsic_v2
-from morango.models.fsic_utils import expand_fsic_for_use
-from morango.models.fsic_utils import remove_redundant_instance_counters
-from morango.models.fsic_utils import calculate_directional_fsic_diff_v2
+import copy
+from collections import defaultdict
 
+from django.test import SimpleTestCase
 from django.test import TestCase
+from hypothesis import given
+from hypothesis import strategies as st
+
+from morango.models.fsic_utils import _build_prefix_mapper
+from morango.models.fsic_utils import _get_sub_partitions
+from morango.models.fsic_utils import calculate_directional_fsic_diff_v2
+from morango.models.fsic_utils import expand_fsic_for_use
+from morango.models.fsic_utils import PrefixTrie
+from morango.models.fsic_utils import remove_redundant_instance_counters
 
 
 class TestFSICUtils(TestCase):
@@ -267,67 +275,119 @@ class TestFSICUtils(TestCase):
             expected_diff,
         )
 
-    def test_chunk_fsic_v2(self):
-        fsic = {
-            "p": {
-                "a": 5,
-                "c": 7,
-            },
-            "p1": {
-                "a": 7,
-                "b": 9,
-                "d": 2,
-            },
-            "p1i": {
-                "a": 7,
-                "b": 19,
-                "c": 32,
-                "d": 12,
-            },
-            "p2": {
-                "a": 8,
-            },
+
+def _reference_build_prefix_mapper(keys, include_self=False):
+    prefix_mapper = defaultdict(list)
+    for key in keys:
+        for otherkey in keys:
+            if key.startswith(otherkey) and (include_self or key != otherkey):
+                prefix_mapper[key].append(otherkey)
+    return prefix_mapper
+
+
+def _reference_get_sub_partitions(partitions):
+    return {
+        partition
+        for partition in partitions
+        for other_partition in partitions
+        if partition.startswith(other_partition) and partition != other_partition
+    }
+
+
+def _reference_remove_redundant_instance_counters(raw_fsic):
+    merged_dict = dict(raw_fsic["super"], **raw_fsic["sub"])
+    prefix_mapper = _reference_build_prefix_mapper(list(merged_dict.keys()))
+    for fsic_dict in [raw_fsic["super"], raw_fsic["sub"]]:
+        for part, sub_dict in list(fsic_dict.items()):
+            for superpart in prefix_mapper[part]:
+                for inst, counter in merged_dict[superpart].items():
+                    if inst in sub_dict and sub_dict[inst] <= counter:
+                        del sub_dict[inst]
+
+
+def _reference_expand_fsic_for_use(raw_fsic, sync_filter):
+    raw_fsic = raw_fsic.copy()
+    for partition in sync_filter:
+        raw_fsic["sub"].setdefault(partition, {})
+    subordinates = _reference_get_sub_partitions(list(raw_fsic["sub"].keys()))
+    for sub_part, sub_fsic in raw_fsic["sub"].items():
+        if sub_part in subordinates:
+            continue
+        for super_part, super_fsic in raw_fsic["super"].items():
+            if sub_part.startswith(super_part):
+                for instance, counter in super_fsic.items():
+                    if counter > sub_fsic.get(instance, 0):
+                        sub_fsic[instance] = counter
+    return {part: insts for part, insts in raw_fsic["sub"].items() if insts}
+
+
+def _reference_calculate_directional_fsic_diff_v2(fsic1, fsic2):
+    prefixes = _reference_build_prefix_mapper(
+        list(fsic1.keys()) + list(fsic2.keys()), include_self=True
+    )
+    result = defaultdict(dict)
+    for part, insts in fsic1.items():
+        for inst, sending_counter in insts.items():
+            receiving_counter = max(
+                fsic2.get(prefix, {}).get(inst, 0) for prefix in prefixes[part]
+            )
+            if receiving_counter < sending_counter:
+                result[part][inst] = receiving_counter
+    return dict(result)
+
+
+# a small alphabet makes partitions that are prefixes of each other common
+partitions = st.text(alphabet="ab:", max_size=6)
+fsic_dicts = st.dictionaries(
+    partitions,
+    st.dictionaries(st.sampled_from("wxyz"), st.integers(min_value=0, max_value=10)),
+    max_size=12,
+)
+raw_fsics = st.fixed_dictionaries({"super": fsic_dicts, "sub": fsic_dicts})
+
+
+class PrefixTriePropertiesTestCase(SimpleTestCase):
+    """
+    Checks the trie-based functions return the same results as comparing every partition to
+    every other
+    """
+
+    @given(st.lists(partitions), partitions, st.booleans())
+    def test_prefixes(self, keys, key, include_self):
+        expected = {
+            other for other in keys if key.startswith(other) and (include_self or other != key)
         }
-        expected_chunks_1_2 = [
-            {"p": {"a": 5}},
-            {"p": {"c": 7}},
-            {"p1": {"a": 7}},
-            {"p1": {"b": 9}},
-            {"p1": {"d": 2}},
-            {"p1i": {"a": 7}},
-            {"p1i": {"b": 19}},
-            {"p1i": {"c": 32}},
-            {"p1i": {"d": 12}},
-            {"p2": {"a": 8}},
-        ]
-        expected_chunks_3 = [
-            {"p": {"a": 5, "c": 7}},
-            {"p1": {"a": 7, "b": 9}},
-            {"p1": {"d": 2}},
-            {"p1i": {"a": 7, "b": 19}},
-            {"p1i": {"c": 32, "d": 12}},
-            {"p2": {"a": 8}},
-        ]
-        expected_chunks_4 = [
-            {"p": {"a": 5, "c": 7}},
-            {"p1": {"a": 7, "b": 9, "d": 2}},
-            {"p1i": {"a": 7, "b": 19, "c": 32}},
-            {"p1i": {"d": 12}, "p2": {"a": 8}},
-        ]
-        expected_chunks_5 = [
-            {"p": {"a": 5, "c": 7}, "p1": {"a": 7}},
-            {"p1": {"b": 9, "d": 2}, "p1i": {"a": 7}},
-            {"p1i": {"b": 19, "c": 32, "d": 12}},
-            {"p2": {"a": 8}},
-        ]
-        expected_chunks_6 = [
-            {"p": {"a": 5, "c": 7}, "p1": {"a": 7, "b": 9}},
-            {"p1": {"d": 2}, "p1i": {"a": 7, "b": 19, "c": 32}},
-            {"p1i": {"d": 12}, "p2": {"a": 8}},
-        ]
-        self.assertEqual(chunk_fsic_v2(fsic, 1), expected_chunks_1_2)
-        self.assertEqual(chunk_fsic_v2(fsic, 2), expected_chunks_1_2)
-        self.assertEqual(chunk_fsic_v2(fsic, 3), expected_chunks_3)
-        self.assertEqual(chunk_fsic_v2(fsic, 4), expected_chunks_4)
-        self.assertEqual(chunk_fsic_v2(fsic, 5), expected_chunks_5)
-        self.assertEqual(chunk_fsic_v2(fsic, 6), expected_chunks_6)
+        prefixes = list(PrefixTrie(keys).prefixes(key, include_self=include_self))
+        self.assertEqual(expected, set(prefixes))
+        self.assertEqual(len(expected), len(prefixes))
+        self.assertEqual(sorted(prefixes, key=len), prefixes)
+
+    @given(st.lists(partitions), st.booleans())
+    def test_build_prefix_mapper(self, keys, include_self):
+        expected = _reference_build_prefix_mapper(keys, include_self=include_self)
+        mapper = _build_prefix_mapper(keys, include_self=include_self)
+        for key in keys:
+            self.assertEqual(set(expected[key]), set(mapper[key]))
+
+    @given(st.lists(partitions))
+    def test_get_sub_partitions(self, keys):
+        self.assertEqual(_reference_get_sub_partitions(keys), _get_sub_partitions(keys))
+
+    @given(raw_fsics)
+    def test_remove_redundant_instance_counters(self, raw_fsic):
+        expected = copy.deepcopy(raw_fsic)
+        _reference_remove_redundant_instance_counters(expected)
+        remove_redundant_instance_counters(raw_fsic)
+        self.assertEqual(expected, raw_fsic)
+
+    @given(raw_fsics, st.lists(partitions, max_size=3))
+    def test_expand_fsic_for_use(self, raw_fsic, sync_filter):
+        expected = _reference_expand_fsic_for_use(copy.deepcopy(raw_fsic), sync_filter)
+        self.assertEqual(expected, expand_fsic_for_use(raw_fsic, sync_filter))
+
+    @given(fsic_dicts, fsic_dicts)
+    def test_calculate_directional_fsic_diff_v2(self, fsic1, fsic2):
+        self.assertEqual(
+            _reference_calculate_directional_fsic_diff_v2(fsic1, fsic2),
+            calculate_directional_fsic_diff_v2(fsic1, fsic2),
+        )
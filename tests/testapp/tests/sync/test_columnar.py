@@ -0,0 +1,89 @@
+import json
+import uuid
+
+import pytest
+from django.test import SimpleTestCase
+
+from morango.sync import columnar
+
+
+def _build_record(transfer_session, instance_id, model_name="facility", rmcb_count=2):
+    model_uuid = uuid.uuid4().hex
+    return {
+        "serialized": '{"id": "%s"}' % model_uuid,
+        "deleted": False,
+        "last_saved_instance": instance_id,
+        "last_saved_counter": 12,
+        "hard_deleted": False,
+        "partition": "{}:user".format(instance_id),
+        "source_id": uuid.uuid4().hex,
+        "model_name": model_name,
+        "conflicting_serialized_data": "",
+        "model_uuid": model_uuid,
+        "transfer_session": transfer_session,
+        "profile": "facilitydata",
+        "_self_ref_fk": "",
+        "rmcb_list": [
+            {
+                "transfer_session": transfer_session,
+                "model_uuid": model_uuid,
+                "instance_id": instance_id if i == 0 else uuid.uuid4().hex,
+                "counter": i,
+            }
+            for i in range(rmcb_count)
+        ],
+    }
+
+
+@pytest.mark.skipif(not columnar.MSGPACK_EXISTS, reason="msgpack is not installed")
+class ColumnarTestCase(SimpleTestCase):
+    def setUp(self):
+        self.transfer_session = uuid.uuid4().hex
+        self.instance_ids = [uuid.uuid4().hex for _ in range(3)]
+        self.records = [
+            _build_record(
+                self.transfer_session,
+                self.instance_ids[i % 3],
+                model_name="facility" if i % 2 else "myuser",
+                rmcb_count=i % 3,
+            )
+            for i in range(30)
+        ]
+
+    def test_round_trip(self):
+        self.assertEqual(self.records, columnar.unpack(columnar.pack(self.records)))
+
+    def test_round_trip__paginated(self):
+        data = {"count": 30, "cursor": 10, "results": self.records}
+        self.assertEqual(data, columnar.unpack(columnar.pack(data)))
+
+    def test_round_trip__empty(self):
+        self.assertEqual([], columnar.unpack(columnar.pack([])))
+
+    def test_round_trip__not_uuids(self):
+        self.records[0]["last_saved_instance"] = "abc"
+        self.records[1]["last_saved_instance"] = "x" * 32
+        self.assertEqual(self.records, columnar.unpack(columnar.pack(self.records)))
+
+    def test_encode_buffers(self):
+        encoded = columnar.encode_buffers(self.records)
+        columns = encoded["columns"]
+        self.assertEqual(
+            {"constant": bytes.fromhex(self.transfer_session)},
+            columns["transfer_session"],
+        )
+        self.assertEqual({"constant": "facilitydata"}, columns["profile"])
+        self.assertEqual(["myuser", "facility"], columns["model_name"]["table"])
+        self.assertEqual(3, len(columns["last_saved_instance"]["table"]))
+        self.assertEqual(30, len(columns["model_uuid"]["values"]))
+
+    def test_smaller_than_json(self):
+        self.assertLess(
+            len(columnar.pack(self.records)), len(json.dumps(self.records)) / 2
+        )
+
+    def test_decode_buffers__unsupported_version(self):
+        encoded = columnar.encode_buffers(self.records)
+        encoded["version"] = 99
+        with self.assertRaises(ValueError):
+            columnar.decode_buffers(encoded)
@@ -0,0 +1,54 @@
+import io
+import json
+
+import pytest
+from django.test import SimpleTestCase
+
+from morango.sync.compression import compress_iter
+from morango.sync.compression import decompress_iter
+from morango.sync.compression import get_encodings
+from morango.sync.compression import GZIP
+from morango.sync.compression import iter_blocks
+from morango.sync.compression import read_blocks
+from morango.sync.compression import ZSTD
+from morango.sync.compression import ZSTD_EXISTS
+
+
+class CompressionTestCase(SimpleTestCase):
+    def setUp(self):
+        self.data = [{"id": i, "serialized": u"ünïcode {}".format(i)} for i in range(2000)]
+        self.pieces = json.JSONEncoder().iterencode(self.data)
+
+    def assertRoundTrip(self, encoding):
+        compressed = b"".join(compress_iter(self.pieces, encoding, 6))
+        decompressed = b"".join(
+            decompress_iter(read_blocks(io.BytesIO(compressed), 1024), encoding)
+        )
+        self.assertEqual(self.data, json.loads(decompressed.decode("utf-8")))
+
+    def test_gzip(self):
+        self.assertRoundTrip(GZIP)
+
+    def test_gzip__compatible(self):
+        import gzip
+
+        compressed = b"".join(compress_iter(self.pieces, GZIP, 6))
+        self.assertEqual(self.data, json.loads(gzip.decompress(compressed).decode("utf-8")))
+
+    @pytest.mark.skipif(not ZSTD_EXISTS, reason="zstandard is not installed")
+    def test_zstd(self):
+        self.assertRoundTrip(ZSTD)
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            list(compress_iter(self.pieces, "brotli", 6))
+        with self.assertRaises(ValueError):
+            list(decompress_iter([b""], "brotli"))
+
+    def test_get_encodings(self):
+        self.assertEqual(GZIP, get_encodings()[-1])
+        self.assertEqual(ZSTD_EXISTS, ZSTD in get_encodings())
+
+    def test_iter_blocks(self):
+        blocks = list(iter_blocks(["ab", b"cd", "ef"], block_size=3))
+        self.assertEqual([b"abcd", b"ef"], blocks)
@@ -1,11 +1,17 @@
 import contextlib
 import json
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import factory
 import mock
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
 from django.test import SimpleTestCase
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from facility_profile.models import Facility
 from facility_profile.models import InteractionLog
 from facility_profile.models import MyUser
@@ -21,9 +27,17 @@ from morango.models.core import DeletedModels
 from morango.models.core import InstanceIDModel
 from morango.models.core import RecordMaxCounter
 from morango.models.core import Store
+from morango.models.core import StoreQueryset
+from morango.models.core import SyncableModel
+from morango.registry import SessionMiddlewareOperations
+from morango.serialization import encode_serialized_data
 from morango.sync.controller import _self_referential_fk
 from morango.sync.controller import MorangoProfileController
 from morango.sync.controller import SessionController
+from morango.sync.operations import _deserialize_from_store
+from morango.sync.operations import _serialization_executor
+from morango.sync.operations import _serialize_into_store
+from morango.sync.stats import StageStats
 
 
 class FacilityModelFactory(factory.DjangoModelFactory):
@@ -57,6 +71,17 @@ class SerializeIntoStoreTestCase(TestCase):
         self.mc.serialize_into_store()
         self.assertEqual(len(Store.objects.all()), self.range)
 
+    def test_all_models_get_serialized_in_chunks(self):
+        [FacilityModelFactory() for _ in range(self.range)]
+        with mock.patch.object(
+            Store.objects, "in_bulk", wraps=Store.objects.in_bulk
+        ) as in_bulk:
+            _serialize_into_store(self.mc.profile, chunk_size=3)
+        # one lookup of existing store records per chunk
+        self.assertEqual(in_bulk.call_count, 4)
+        self.assertEqual(Store.objects.count(), self.range)
+        self.assertFalse(Facility.objects.filter(_morango_dirty_bit=True).exists())
+
     def test_no_models_get_serialized(self):
         # set dirty bit off on new models created
         [
@@ -91,6 +116,38 @@ class SerializeIntoStoreTestCase(TestCase):
         deserialized_model = json.loads(store_facility.serialized)
         self.assertEqual(deserialized_model["name"], self.new_name)
 
+    def test_unchanged_models_are_not_rewritten(self):
+        [FacilityModelFactory() for _ in range(self.range)]
+        counts = self.mc.serialize_into_store()
+        self.assertEqual(self.range, counts["created"])
+        before = {
+            store.id: (store.serialized, store.last_saved_counter)
+            for store in Store.objects.all()
+        }
+        rmcs_before = set(RecordMaxCounter.objects.values_list("store_model_id", "counter"))
+
+        # re-save all the models, changing only one of them
+        facilities = list(Facility.objects.all())
+        for facility in facilities:
+            facility.save(update_dirty_bit_to=True)
+        facilities[0].name = self.new_name
+        facilities[0].save(update_dirty_bit_to=True)
+        counts = self.mc.serialize_into_store()
+
+        self.assertEqual(0, counts["created"])
+        self.assertEqual(1, counts["updated"])
+        self.assertEqual(self.range - 1, counts["unchanged"])
+        self.assertFalse(Facility.objects.filter(_morango_dirty_bit=True).exists())
+        for store in Store.objects.exclude(id=facilities[0].id):
+            self.assertEqual(before[store.id], (store.serialized, store.last_saved_counter))
+        changed = Store.objects.get(id=facilities[0].id)
+        self.assertGreater(changed.last_saved_counter, before[changed.id][1])
+        rmcs_after = set(RecordMaxCounter.objects.values_list("store_model_id", "counter"))
+        self.assertEqual(
+            {rmc for rmc in rmcs_before if rmc[0] != facilities[0].id},
+            {rmc for rmc in rmcs_after if rmc[0] != facilities[0].id},
+        )
+
     def test_last_saved_counter_updates(self):
         FacilityModelFactory(name=self.original_name)
         self.mc.serialize_into_store()
@@ -118,6 +175,25 @@ class SerializeIntoStoreTestCase(TestCase):
         self.assertNotEqual(old_instance_id, new_instance_id)
         self.assertEqual(new_instance_id, new_id.id)
 
+    def test_store_models_get_updated_in_bulk(self):
+        def count_update_queries(num_updated):
+            Facility.objects.filter(
+                id__in=list(Facility.objects.values_list("id", flat=True)[:num_updated])
+            ).update(name=self.new_name)
+            with CaptureQueriesContext(connection) as ctx:
+                self.mc.serialize_into_store()
+            return len(ctx.captured_queries)
+
+        [FacilityModelFactory() for _ in range(self.range)]
+        self.mc.serialize_into_store()
+
+        # the number of queries should not depend on the number of updated records
+        self.assertEqual(count_update_queries(2), count_update_queries(self.range))
+        for store_facility in Store.objects.all():
+            self.assertEqual(
+                json.loads(store_facility.serialized)["name"], self.new_name
+            )
+
     def test_extra_fields_dont_get_overwritten(self):
         serialized = """{"username": "deadbeef", "height": 6.0, "weight": 100}"""
         MyUser.objects.create(username="deadbeef")
@@ -289,6 +365,54 @@ class SerializeIntoStoreTestCase(TestCase):
         self.assertFalse(SummaryLog.objects.filter(id=log.id).exists())
 
 
+@override_settings(
+    MORANGO_SERIALIZATION_WORKERS=2, MORANGO_SERIALIZATION_EXECUTOR="thread"
+)
+class ThreadPoolSerializeIntoStoreTestCase(SerializeIntoStoreTestCase):
+    def test_chunks_get_encoded_by_workers(self):
+        [FacilityModelFactory() for _ in range(self.range)]
+        encoding_threads = []
+
+        def encode(payloads, codec_name):
+            encoding_threads.append(threading.current_thread())
+            return encode_serialized_data(payloads, codec_name)
+
+        with mock.patch(
+            "morango.sync.operations.encode_serialized_data", side_effect=encode
+        ):
+            _serialize_into_store(self.mc.profile, chunk_size=3)
+        self.assertEqual(len(encoding_threads), 4)
+        self.assertNotIn(threading.main_thread(), encoding_threads)
+        self.assertEqual(Store.objects.count(), self.range)
+        for facility in Facility.objects.all():
+            self.assertEqual(
+                json.loads(Store.objects.get(id=facility.id).serialized)["name"],
+                facility.name,
+            )
+
+    @override_settings(MORANGO_SERIALIZATION_EXECUTOR="greenlet")
+    def test_invalid_executor(self):
+        FacilityModelFactory()
+        with self.assertRaises(ValueError):
+            self.mc.serialize_into_store()
+
+
+@override_settings(
+    MORANGO_SERIALIZATION_WORKERS=2, MORANGO_SERIALIZATION_EXECUTOR="process"
+)
+class ProcessPoolSerializeIntoStoreTestCase(SerializeIntoStoreTestCase):
+    def test_workers_are_spawned(self):
+        # forked workers would share the connection of the serialization transaction
+        with _serialization_executor() as executor:
+            self.assertEqual("spawn", executor._mp_context.get_start_method())
+
+    def test_thread_pool_by_default(self):
+        with self.settings():
+            del settings.MORANGO_SERIALIZATION_EXECUTOR
+            with _serialization_executor() as executor:
+                self.assertIsInstance(executor, ThreadPoolExecutor)
+
+
 class RecordMaxCounterUpdatesDuringSerialization(TestCase):
     def setUp(self):
         (self.current_id, _) = InstanceIDModel.get_or_create_current_instance()
@@ -420,6 +544,48 @@ class DeserializationFromStoreIntoAppTestCase(TestCase):
         self.mc.deserialize_from_store()
         self.assertFalse(Store.objects.filter(dirty_bit=True))
 
+    def test_store_records_are_deserialized_in_chunks(self):
+        users = [
+            MyUser(username="user{}".format(i), password="password")
+            for i in range(self.range)
+        ]
+        for user in users:
+            user.id = user.calculate_uuid()
+            StoreModelFacilityFactory(
+                model_name="user",
+                id=user.id,
+                serialized=json.dumps(user.serialize()),
+            )
+        _deserialize_from_store(self.mc.profile, chunk_size=3)
+        self.assertEqual(
+            MyUser.objects.filter(id__in=[user.id for user in users]).count(),
+            self.range,
+        )
+        self.assertFalse(Store.objects.filter(dirty_bit=True).exists())
+
+    def test_store_records_with_foreign_keys_are_deserialized_in_chunks(self):
+        user = MyUser(username="user", password="password")
+        user.id = user.calculate_uuid()
+        StoreModelFacilityFactory(
+            model_name="user",
+            id=user.id,
+            serialized=json.dumps(user.serialize()),
+        )
+        logs = [SummaryLog(user=user) for _ in range(self.range)]
+        for log in logs:
+            log.id = log.calculate_uuid()
+            StoreModelFacilityFactory(
+                model_name="contentsummarylog",
+                id=log.id,
+                serialized=json.dumps(log.serialize()),
+            )
+        _deserialize_from_store(self.mc.profile, chunk_size=3)
+        self.assertEqual(
+            SummaryLog.objects.filter(id__in=[log.id for log in logs]).count(),
+            self.range,
+        )
+        self.assertFalse(Store.objects.filter(dirty_bit=True).exists())
+
     def test_record_with_dirty_bit_off_doesnt_deserialize(self):
         st = Store.objects.first()
         st.dirty_bit = False
@@ -589,6 +755,114 @@ class SelfReferentialFKDeserializationTestCase(TestCase):
         self.assertTrue(child2.exists())
         self.assertEqual(child2[0].parent_id, root.id)
 
+    def test_deep_tree_deserialized_level_by_level(self):
+        parent = root = FacilityModelFactory()
+        descendants = []
+        for _ in range(5):
+            parent = FacilityModelFactory(parent=parent)
+            descendants.append(parent)
+        sibling = FacilityModelFactory(parent=root)
+        self.mc.serialize_into_store()
+        Facility.objects.all().delete()
+        DeletedModels.objects.all().delete()
+        Store.objects.update(dirty_bit=True, deleted=False)
+
+        _deserialize_from_store(self.mc.profile, chunk_size=2)
+        # ensure tree structure in app layer is correct
+        parent = root
+        for descendant in descendants:
+            self.assertEqual(Facility.objects.get(id=descendant.id).parent_id, parent.id)
+            parent = descendant
+        self.assertEqual(Facility.objects.get(id=sibling.id).parent_id, root.id)
+        self.assertFalse(Store.objects.filter(dirty_bit=True).exists())
+
+    def test_deep_tree_deserialized_with_overridden_save(self):
+        root = FacilityModelFactory()
+        child = FacilityModelFactory(parent=root)
+        self.mc.serialize_into_store()
+        Facility.objects.all().delete()
+        DeletedModels.objects.all().delete()
+        Store.objects.update(dirty_bit=True, deleted=False)
+
+        # models that customize saving are saved one by one, rather than written in bulk
+        with mock.patch.object(
+            Facility, "save", autospec=True, side_effect=SyncableModel.save
+        ) as save:
+            _deserialize_from_store(self.mc.profile, chunk_size=1)
+        self.assertEqual(2, save.call_count)
+        for call in save.call_args_list:
+            self.assertEqual({"update_dirty_bit_to": False}, call[1])
+        self.assertEqual(Facility.objects.get(id=child.id).parent_id, root.id)
+        self.assertFalse(Store.objects.filter(dirty_bit=True).exists())
+
+    def test_tree_levels_worked_out_once(self):
+        root = FacilityModelFactory()
+        children = [FacilityModelFactory(parent=root) for _ in range(4)]
+        for child in children:
+            FacilityModelFactory(parent=child)
+        self.mc.serialize_into_store()
+        Store.objects.update(dirty_bit=True)
+
+        char_ids_list = StoreQueryset.char_ids_list
+        with mock.patch.object(
+            StoreQueryset, "char_ids_list", autospec=True, side_effect=char_ids_list
+        ) as clean_parent_ids:
+            _deserialize_from_store(self.mc.profile, chunk_size=2)
+        # the clean parents are only looked up for the first level, rather than for every chunk
+        self.assertEqual(1, clean_parent_ids.call_count)
+        self.assertFalse(Store.objects.filter(dirty_bit=True).exists())
+        self.assertEqual(4, Facility.objects.filter(parent__parent=root).count())
+
+    def test_deserialization_errors_not_retried_within_level(self):
+        root = FacilityModelFactory()
+        children = [FacilityModelFactory(parent=root) for _ in range(4)]
+        self.mc.serialize_into_store()
+        store_child = Store.objects.get(id=children[0].id)
+        data = json.loads(store_child.serialized)
+        data["name"] = "a" * 101
+        store_child.serialized = json.dumps(data)
+        store_child.save()
+        Store.objects.update(dirty_bit=True)
+
+        deserialize = Store._deserialize_store_model
+        with mock.patch.object(
+            Store, "_deserialize_store_model", autospec=True, side_effect=deserialize
+        ) as deserialize_store_model:
+            _deserialize_from_store(self.mc.profile, chunk_size=2)
+        # each record is only deserialized once, including the one that errored
+        self.assertEqual(5, deserialize_store_model.call_count)
+        self.assertEqual(
+            [children[0].id],
+            list(Store.objects.filter(dirty_bit=True).values_list("id", flat=True)),
+        )
+
+    def test_deserialization_of_model_with_dirty_parent(self):
+        root = FacilityModelFactory()
+        child = FacilityModelFactory(parent=root)
+        grandchild = FacilityModelFactory(parent=child)
+        self.mc.serialize_into_store()
+
+        # make the child fail validation, which should leave the grandchild with a dirty parent
+        store_child = Store.objects.get(id=child.id)
+        data = json.loads(store_child.serialized)
+        data["name"] = "a" * 101
+        store_child.serialized = json.dumps(data)
+        store_child.save()
+        Store.objects.update(dirty_bit=True)
+
+        self.mc.deserialize_from_store()
+
+        store_child.refresh_from_db()
+        self.assertTrue(store_child.dirty_bit)
+        self.assertIn("name", store_child.deserialization_error)
+        store_grandchild = Store.objects.get(id=grandchild.id)
+        self.assertTrue(store_grandchild.dirty_bit)
+        self.assertEqual(
+            store_grandchild.deserialization_error,
+            "Parent is dirty; could not deserialize.",
+        )
+        self.assertFalse(Store.objects.get(id=root.id).dirty_bit)
+
     def test_deserialization_of_model_with_missing_parent(self):
         self._test_deserialization_of_model_with_missing_parent(correct_self_ref_fk=True)
 
@@ -703,6 +977,40 @@ class ForeignKeyDeserializationTestCase(TestCase):
         self.assertTrue(new_log.deserialization_error == "")
         self.assertTrue(SummaryLog.objects.filter(id=new_log.id).exists())
 
+    def test_deserialization_errors_are_updated_in_bulk(self):
+        user = MyUser.objects.create(username="penguin")
+        log = SummaryLog.objects.create(user=user)
+        self.mc.serialize_into_store()
+
+        store_log = Store.objects.get(id=log.id)
+        missing_ids = []
+        null_ids = []
+        for i in range(10):
+            for user_id, ids in (("e" * 32, missing_ids), (None, null_ids)):
+                data = json.loads(store_log.serialized)
+                store_log.id = data["id"] = uuid.uuid4().hex
+                data["user_id"] = user_id
+                store_log.serialized = json.dumps(data)
+                store_log.dirty_bit = True
+                store_log.save(force_insert=True)
+                ids.append(store_log.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.mc.deserialize_from_store()
+
+        error_updates = [
+            q["sql"]
+            for q in queries.captured_queries
+            if "UPDATE" in q["sql"] and "deserialization_error" in q["sql"]
+        ]
+        self.assertEqual(1, len(error_updates))
+        for store_log in Store.objects.filter(id__in=missing_ids):
+            self.assertTrue(store_log.dirty_bit)
+            self.assertIn("my user instance with id '{}'".format("e" * 32), store_log.deserialization_error)
+        for store_log in Store.objects.filter(id__in=null_ids):
+            self.assertTrue(store_log.dirty_bit)
+            self.assertIn("cannot be null", store_log.deserialization_error)
+
 
 class SessionControllerTestCase(SimpleTestCase):
     def setUp(self):
@@ -835,3 +1143,74 @@ class SessionControllerTestCase(SimpleTestCase):
         self.assertEqual(2, len(handler.call_args_list))
         self.assertEqual(mock.call(context=context), handler.call_args_list[0])
         self.assertEqual(mock.call(context=context), handler.call_args_list[1])
+
+    def test_invoke_middleware__measured(self):
+        context = TestSessionContext()
+        context.transfer_session = mock.Mock()
+        handler = mock.Mock()
+        self.controller.signals.measured.connect(handler)
+
+        class TestOperation(object):
+            def __call__(self, context):
+                return transfer_statuses.COMPLETED
+
+        middleware = SessionMiddlewareOperations(transfer_stages.QUEUING)
+        middleware.append(mock.Mock(return_value=False))
+        middleware.append(TestOperation())
+
+        result = self.controller._invoke_middleware(context, middleware)
+        self.assertEqual(result, transfer_statuses.COMPLETED)
+
+        handler.assert_called_once_with(context=context, stats=mock.ANY)
+        stats = handler.call_args[1]["stats"]
+        self.assertIsInstance(stats, StageStats)
+        self.assertEqual(transfer_stages.QUEUING, stats.stage)
+        self.assertEqual("TestOperation", stats.operation)
+        self.assertGreater(stats.wall_time, 0)
+        context.transfer_session.record_stage_stats.assert_called_once_with(stats)
+        context.transfer_session.save_stage_stats.assert_called_once_with()
+
+    def test_invoke_middleware__measured__pending(self):
+        context = TestSessionContext()
+        context.transfer_session = mock.Mock()
+
+        middleware = SessionMiddlewareOperations(transfer_stages.QUEUING)
+        middleware.append(mock.Mock(return_value=transfer_statuses.PENDING))
+
+        result = self.controller._invoke_middleware(context, middleware)
+        self.assertEqual(result, transfer_statuses.PENDING)
+        # the stats are only written once the stage finishes
+        context.transfer_session.record_stage_stats.assert_called_once()
+        context.transfer_session.save_stage_stats.assert_not_called()
+
+    def test_invoke_middleware__measured__pending_on_server(self):
+        context = TestSessionContext()
+        context.is_server = True
+        context.transfer_session = mock.Mock()
+
+        middleware = SessionMiddlewareOperations(transfer_stages.TRANSFERRING)
+        middleware.append(mock.Mock(return_value=transfer_statuses.PENDING))
+
+        result = self.controller._invoke_middleware(context, middleware)
+        self.assertEqual(result, transfer_statuses.PENDING)
+        # each request on the server writes the stats of its own invocation
+        context.transfer_session.record_stage_stats.assert_called_once()
+        context.transfer_session.save_stage_stats.assert_called_once_with()
+
+    def test_invoke_middleware__measured__errored(self):
+        context = TestSessionContext()
+        context.transfer_session = mock.Mock()
+        handler = mock.Mock()
+        self.controller.signals.measured.connect(handler)
+
+        middleware = self.middleware[0]
+        middleware.side_effect = RuntimeError("Failed")
+
+        result = self.controller._invoke_middleware(context, middleware)
+        self.assertEqual(result, transfer_statuses.ERRORED)
+
+        handler.assert_called_once_with(context=context, stats=mock.ANY)
+        stats = handler.call_args[1]["stats"]
+        self.assertIsNone(stats.operation)
+        context.transfer_session.record_stage_stats.assert_called_once_with(stats)
+        context.transfer_session.save_stage_stats.assert_called_once_with()
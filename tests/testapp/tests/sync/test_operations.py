@@ -8,6 +8,8 @@ import mock
 import pytest
 from django.conf import settings
 from django.db import connection
+from django.db import transaction
+from django.db.models import IntegerField
 from django.test import override_settings
 from django.test import TestCase
 from django.test import TransactionTestCase
@@ -20,7 +22,6 @@ from ..helpers import create_buffer_and_store_dummy_data
 from ..helpers import create_dummy_store_data
 from morango.constants import transfer_statuses
 from morango.constants.capabilities import FSIC_V2_FORMAT
-from morango.errors import MorangoLimitExceeded
 from morango.models.certificates import Filter
 from morango.models.core import Buffer
 from morango.models.core import DatabaseIDModel
@@ -31,7 +32,12 @@ from morango.models.core import RecordMaxCounterBuffer
 from morango.models.core import Store
 from morango.models.core import SyncSession
 from morango.models.core import TransferSession
+from morango.models.core import UUIDField
+from morango.sync.backends.base import DEQUEUE_FAST_FORWARD
+from morango.sync.backends.base import DEQUEUE_MERGE_CONFLICT
+from morango.sync.backends.base import DEQUEUE_REVERSE_FAST_FORWARD
 from morango.sync.backends.utils import load_backend
+from morango.sync.backends.utils import TemporaryTable
 from morango.sync.context import LocalSessionContext
 from morango.sync.controller import MorangoProfileController
 from morango.sync.controller import SessionController
@@ -217,12 +223,28 @@ class QueueStoreIntoBufferV1TestCase(TestCase):
         assertRecordsBuffered(self.data["group1_c2"])
         assertRecordsBuffered(self.data["group2_c1"])
 
-    def test_too_many_fsics(self):
+    def test_more_fsics_than_the_old_limit(self):
+        # queuing used to raise `MorangoLimitExceeded` from 200 * 500 fsics
         fsics = {self.data["group1_id"].id: 1, self.data["group2_id"].id: 1}
         fsics.update({uuid.uuid4().hex: i for i in range(100000)})
         self.transfer_session.client_fsic = json.dumps(fsics)
-        with self.assertRaises(MorangoLimitExceeded):
-            _queue_into_buffer_v1(self.transfer_session)
+        _queue_into_buffer_v1(self.transfer_session)
+        # ensure all store and buffer records are buffered
+        assertRecordsBuffered(self.data["group1_c1"])
+        assertRecordsBuffered(self.data["group1_c2"])
+        assertRecordsBuffered(self.data["group2_c1"])
+
+    def test_overlapping_filter_prefixes(self):
+        fsics = {self.data["group2_id"].id: 1}
+        filter_prefixes = "{}\n{}:user".format(
+            self.data["user3"].id, self.data["user3"].id
+        )
+        self.transfer_session.filter = filter_prefixes
+        self.transfer_session.client_fsic = json.dumps(fsics)
+        _queue_into_buffer_v1(self.transfer_session)
+        # ensure records matching both prefixes are only buffered once
+        assertRecordsBuffered(self.data["user3_sumlogs"])
+        assertRecordsBuffered(self.data["user3_interlogs"])
 
     def test_fsic_specific_id(self):
         fsics = {self.data["group2_id"].id: 1}
@@ -430,23 +452,39 @@ class QueueStoreIntoBufferV2TestCase(TestCase):
         assertRecordsBuffered(self.data["group1_c2"])
         assertRecordsBuffered(self.data["group2_c1"])
 
-    def test_too_many_fsic_partitions(self):
+    def test_more_fsic_partitions_than_the_old_limit(self):
+        # queuing used to raise `MorangoLimitExceeded` from 200 * 499 partitions and instances, and
+        # chunks of fsics with more values than the SQLite variable limit are inserted in batches
         fsics = {"super": {}, "sub": {"": {self.data["group1_id"].id: 1, self.data["group2_id"].id: 1}}}
-        for i in range(5000):
+        for i in range(50000):
             fsics["sub"][uuid.uuid4().hex] = {uuid.uuid4().hex: i for i in range(2)}
         self.transfer_session.client_fsic = json.dumps(fsics)
         self.transfer_session.server_fsic = json.dumps({"super": {}, "sub": {}})
-        with self.assertRaises(MorangoLimitExceeded):
-            _queue_into_buffer_v2(self.transfer_session, chunk_size=10)
+        with mock.patch(
+            "morango.sync.backends.sqlite.calculate_max_sqlite_variables",
+            return_value=999,
+        ):
+            _queue_into_buffer_v2(self.transfer_session, chunk_size=1000)
+        # ensure all store and buffer records are buffered
+        assertRecordsBuffered(self.data["group1_c1"])
+        assertRecordsBuffered(self.data["group1_c2"])
+        assertRecordsBuffered(self.data["group2_c1"])
 
-    def test_too_many_fsic_instances(self):
+    def test_more_fsic_instances_than_the_old_limit(self):
         fsics = {"super": {}, "sub": {"": {self.data["group1_id"].id: 1, self.data["group2_id"].id: 1}}}
         for i in range(2):
-            fsics["sub"][uuid.uuid4().hex] = {uuid.uuid4().hex: i for i in range(5000)}
+            fsics["sub"][uuid.uuid4().hex] = {uuid.uuid4().hex: i for i in range(50000)}
         self.transfer_session.client_fsic = json.dumps(fsics)
         self.transfer_session.server_fsic = json.dumps({"super": {}, "sub": {}})
-        with self.assertRaises(MorangoLimitExceeded):
-            _queue_into_buffer_v2(self.transfer_session, chunk_size=10)
+        with mock.patch(
+            "morango.sync.backends.sqlite.calculate_max_sqlite_variables",
+            return_value=999,
+        ):
+            _queue_into_buffer_v2(self.transfer_session, chunk_size=1000)
+        # ensure all store and buffer records are buffered
+        assertRecordsBuffered(self.data["group1_c1"])
+        assertRecordsBuffered(self.data["group1_c2"])
+        assertRecordsBuffered(self.data["group2_c1"])
 
     def test_fsic_specific_id(self):
         fsics = {"super": {}, "sub": {"": {self.data["group2_id"].id: 1}}}
@@ -997,6 +1035,125 @@ class DequeueBufferIntoStoreTestCase(TestCase):
 
     def test_dequeue_into_store(self):
         _dequeue_into_store(self.transfer_session, self.transfer_session.client_fsic, v2_format=False)
+        self.assert_dequeued_into_store()
+
+    @override_settings(MORANGO_DEQUEUE_ENGINE="merge")
+    def test_dequeue_into_store__merge(self):
+        with mock.patch(
+            "morango.sync.operations._dequeue_buffer_stepwise"
+        ) as dequeue_buffer_stepwise:
+            _dequeue_into_store(self.transfer_session, self.transfer_session.client_fsic, v2_format=False)
+        dequeue_buffer_stepwise.assert_not_called()
+        self.assert_dequeued_into_store()
+
+    @override_settings(MORANGO_DEQUEUE_ENGINE="merge")
+    def test_dequeue_into_store__merge__sqlite_without_upsert(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("Only applies to SQLite")
+        with mock.patch.object(
+            connection.Database, "sqlite_version_info", (3, 23, 0)
+        ), mock.patch(
+            "morango.sync.operations._merge_buffer_into_store"
+        ) as merge_buffer_into_store:
+            _dequeue_into_store(self.transfer_session, self.transfer_session.client_fsic, v2_format=False)
+        merge_buffer_into_store.assert_not_called()
+        self.assert_dequeued_into_store()
+
+    def _get_dequeued_state(self):
+        return (
+            list(Store.objects.order_by("id").values()),
+            sorted(
+                RecordMaxCounter.objects.values_list(
+                    "store_model_id", "instance_id", "counter"
+                )
+            ),
+            sorted(Buffer.objects.values_list("transfer_session_id", "model_uuid")),
+            sorted(
+                RecordMaxCounterBuffer.objects.values_list(
+                    "transfer_session_id", "model_uuid", "instance_id", "counter"
+                )
+            ),
+        )
+
+    def test_dequeue_engines_are_equivalent(self):
+        states = []
+        for engine in ("stepwise", "merge"):
+            with override_settings(MORANGO_DEQUEUE_ENGINE=engine):
+                # roll back each engine's changes, so both start from the same data
+                with self.assertRaises(ZeroDivisionError), transaction.atomic():
+                    _dequeue_into_store(self.transfer_session, self.transfer_session.client_fsic, v2_format=False)
+                    states.append(self._get_dequeued_state())
+                    raise ZeroDivisionError
+        self.assertEqual(states[0], states[1])
+
+    def _get_dequeue_sql(self, transfer_session):
+        sqls = []
+
+        def capture(execute, sql, params, many, context):
+            # savepoints are named uniquely by Django
+            if "SAVEPOINT" not in sql:
+                sqls.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            _dequeue_into_store(transfer_session, transfer_session.client_fsic, v2_format=False)
+        return sqls
+
+    def test_dequeue_sql_is_the_same_across_sessions(self):
+        for engine in ("stepwise", "merge"):
+            other_transfer_session = TransferSession.objects.create(
+                id=uuid.uuid4().hex,
+                sync_session=self.transfer_session.sync_session,
+                push=True,
+                last_activity_timestamp=timezone.now(),
+            )
+            create_buffer_and_store_dummy_data(other_transfer_session.id)
+            with override_settings(MORANGO_DEQUEUE_ENGINE=engine), transaction.atomic():
+                sqls = self._get_dequeue_sql(self.transfer_session)
+                other_sqls = self._get_dequeue_sql(other_transfer_session)
+                transaction.set_rollback(True)
+
+            # the IDs and counters are bound as parameters, so the database can reuse its plans
+            self.assertEqual(sqls, other_sqls)
+            for sql in set(sqls):
+                self.assertNotIn(self.transfer_session.id, sql)
+                self.assertNotIn(other_transfer_session.id, sql)
+                self.assertNotIn(self.current_id.id, sql)
+
+    def test_dequeuing_classify_buffer(self):
+        with TemporaryTable(
+            connection,
+            "dequeue_classes",
+            model_uuid=UUIDField(primary_key=True),
+            classification=IntegerField(),
+        ) as classes_table, connection.cursor() as cursor:
+            DBBackend._dequeuing_classify_buffer(
+                cursor, classes_table.sql_name, self.transfer_session.id
+            )
+            cursor.execute(
+                "SELECT model_uuid, classification FROM {}".format(
+                    classes_table.sql_name
+                )
+            )
+            classes = {
+                classes_table.get_field("model_uuid").from_db_value(
+                    model_uuid, None, connection
+                ): classification
+                for model_uuid, classification in cursor.fetchall()
+            }
+        self.assertEqual(
+            {
+                self.data["model1"]: DEQUEUE_REVERSE_FAST_FORWARD,
+                self.data["model2"]: DEQUEUE_MERGE_CONFLICT,
+                self.data["model3"]: DEQUEUE_FAST_FORWARD,
+                self.data["model4"]: DEQUEUE_FAST_FORWARD,
+                self.data["model5"]: DEQUEUE_MERGE_CONFLICT,
+                self.data["model7"]: DEQUEUE_MERGE_CONFLICT,
+            },
+            classes,
+        )
+
+    def assert_dequeued_into_store(self):
         # ensure a record with different transfer session id is not affected
         self.assertTrue(
             Buffer.objects.filter(transfer_session_id=self.data["tfs_id"]).exists()
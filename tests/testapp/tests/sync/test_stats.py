@@ -0,0 +1,129 @@
+import uuid
+
+import mock
+from django.test import TestCase
+from django.utils import timezone
+
+from morango.constants import transfer_stages
+from morango.models.core import SyncSession
+from morango.models.core import TransferSession
+from morango.sync.stats import StageStats
+from morango.sync.stats import StatsRecorder
+
+
+class StatsRecorderTestCase(TestCase):
+    def setUp(self):
+        super(StatsRecorderTestCase, self).setUp()
+        self.sync_session = SyncSession.objects.create(
+            id=uuid.uuid4().hex,
+            profile="facilitydata",
+            last_activity_timestamp=timezone.now(),
+        )
+        self.transfer_session = TransferSession.objects.create(
+            id=uuid.uuid4().hex,
+            sync_session=self.sync_session,
+            push=True,
+            last_activity_timestamp=timezone.now(),
+        )
+
+    def test_queries(self):
+        stats = StageStats(transfer_stages.QUEUING)
+        with StatsRecorder(stats):
+            list(TransferSession.objects.all())
+            TransferSession.objects.all().update(records_total=10)
+
+        self.assertEqual(2, stats.query_count)
+        self.assertEqual(1, stats.rows_affected)
+        self.assertGreater(stats.query_time, 0)
+        self.assertGreaterEqual(stats.wall_time, stats.query_time)
+
+        # queries after the recorder exits aren't counted
+        list(TransferSession.objects.all())
+        self.assertEqual(2, stats.query_count)
+
+    def test_bytes(self):
+        sync_connection = mock.Mock(bytes_sent=100, bytes_received=200)
+        stats = StageStats(transfer_stages.TRANSFERRING)
+        with StatsRecorder(stats, sync_connection=sync_connection):
+            sync_connection.bytes_sent = 150
+            sync_connection.bytes_received = 1200
+
+        self.assertEqual(50, stats.bytes_sent)
+        self.assertEqual(1000, stats.bytes_received)
+
+    def test_record_stage_stats(self):
+        for operation in ("ProducerQueueOperation", "ProducerQueueOperation", None):
+            stats = StageStats(transfer_stages.QUEUING, operation=operation)
+            stats.query_count = 3
+            stats.bytes_sent = 10
+            self.transfer_session.record_stage_stats(stats)
+
+        # the stats are only written once saved
+        self.assertEqual(
+            {}, TransferSession.objects.get(pk=self.transfer_session.pk).get_stage_stats()
+        )
+        # read and written in one savepoint
+        with self.assertNumQueries(4):
+            self.transfer_session.save_stage_stats()
+
+        self.transfer_session.refresh_from_db()
+        stage_stats = self.transfer_session.get_stage_stats()
+        self.assertEqual([transfer_stages.QUEUING], list(stage_stats))
+        self.assertEqual(3, stage_stats[transfer_stages.QUEUING]["invocations"])
+        self.assertEqual(9, stage_stats[transfer_stages.QUEUING]["query_count"])
+        self.assertEqual(30, stage_stats[transfer_stages.QUEUING]["bytes_sent"])
+        operation_stats = stage_stats[transfer_stages.QUEUING]["operations"][
+            "ProducerQueueOperation"
+        ]
+        self.assertEqual(2, operation_stats["invocations"])
+        self.assertEqual(6, operation_stats["query_count"])
+
+    def test_save_stage_stats__concurrently_saved(self):
+        stats = StageStats(transfer_stages.TRANSFERRING)
+        stats.bytes_sent = 10
+        self.transfer_session.record_stage_stats(stats)
+
+        # another request for the transfer session saves its stats in the meantime
+        other_transfer_session = TransferSession.objects.get(pk=self.transfer_session.pk)
+        other_stats = StageStats(transfer_stages.TRANSFERRING)
+        other_stats.bytes_sent = 5
+        other_transfer_session.record_stage_stats(other_stats)
+        other_transfer_session.save_stage_stats()
+
+        self.transfer_session.save_stage_stats()
+        self.transfer_session.refresh_from_db()
+        stage_stats = self.transfer_session.get_stage_stats()[transfer_stages.TRANSFERRING]
+        self.assertEqual(2, stage_stats["invocations"])
+        self.assertEqual(15, stage_stats["bytes_sent"])
+
+    def test_save__keeps_concurrently_saved_stats(self):
+        other_transfer_session = TransferSession.objects.get(pk=self.transfer_session.pk)
+        other_transfer_session.record_stage_stats(StageStats(transfer_stages.TRANSFERRING))
+        other_transfer_session.save_stage_stats()
+
+        # saving the whole transfer session doesn't write its stale stats
+        self.transfer_session.records_transferred = 10
+        self.transfer_session.save()
+        self.transfer_session.refresh_from_db()
+        self.assertEqual(10, self.transfer_session.records_transferred)
+        self.assertIn(transfer_stages.TRANSFERRING, self.transfer_session.get_stage_stats())
+
+    def test_add_stage_counts(self):
+        for _ in range(2):
+            self.transfer_session.add_stage_counts(
+                transfer_stages.SERIALIZING,
+                {"records_serialized": 5, "records_unchanged": 2},
+            )
+        # the counts are only written along with the stats
+        self.transfer_session.save()
+        self.assertEqual(
+            {}, TransferSession.objects.get(pk=self.transfer_session.pk).get_stage_stats()
+        )
+        self.transfer_session.record_stage_stats(StageStats(transfer_stages.SERIALIZING))
+        self.transfer_session.save_stage_stats()
+
+        self.transfer_session.refresh_from_db()
+        stage_stats = self.transfer_session.get_stage_stats()[transfer_stages.SERIALIZING]
+        self.assertEqual(10, stage_stats["records_serialized"])
+        self.assertEqual(4, stage_stats["records_unchanged"])
+        self.assertEqual(1, stage_stats["invocations"])
@@ -5,6 +5,7 @@ import mock
 from django.test.testcases import LiveServerTestCase
 from django.test.utils import override_settings
 from requests.exceptions import HTTPError
+from requests.exceptions import Timeout
 
 from ..helpers import BaseClientTestCase
 from ..helpers import BaseTransferClientTestCase
@@ -31,6 +32,7 @@ from morango.sync.syncsession import PullClient
 from morango.sync.syncsession import PushClient
 from morango.sync.syncsession import SyncSessionClient
 from morango.sync.syncsession import TransferClient
+from morango.sync.utils import ChunkSizeController
 
 
 def mock_patch_decorator(func):
@@ -218,6 +220,40 @@ class NetworkSyncConnectionTestCase(LiveServerTestCase):
         self.assertEqual(data[0]["id"], self.root_cert.id)
         self.assertEqual(data[1]["id"], self.subset_cert.id)
 
+    @mock.patch.object(
+        NetworkSyncConnection, "_uses_columnar_format", new=lambda self: False
+    )
+    @mock.patch.object(SessionWrapper, "request")
+    def test_push_record_chunk__adaptive_chunk_size(self, mock_request):
+        mock_request.return_value = mock.Mock(
+            content=b"", request=mock.Mock(body=b"x" * 1000)
+        )
+        self.network_connection.chunk_size = 100
+        self.network_connection.chunk_size_controller = ChunkSizeController(10, 1000)
+        self.network_connection._push_record_chunk([{"id": i} for i in range(100)])
+        self.assertGreater(self.network_connection.chunk_size, 100)
+
+    @mock.patch.object(
+        NetworkSyncConnection, "_uses_columnar_format", new=lambda self: False
+    )
+    @mock.patch.object(SessionWrapper, "request")
+    def test_push_record_chunk__adaptive_chunk_size__failed(self, mock_request):
+        mock_request.side_effect = Timeout("Network disconnected")
+        self.network_connection.chunk_size = 100
+        self.network_connection.chunk_size_controller = ChunkSizeController(10, 1000)
+        with self.assertRaises(Timeout):
+            self.network_connection._push_record_chunk([{"id": i} for i in range(100)])
+        self.assertEqual(self.network_connection.chunk_size, 50)
+
+    @mock.patch.object(
+        NetworkSyncConnection, "_uses_columnar_format", new=lambda self: False
+    )
+    @mock.patch.object(SessionWrapper, "request")
+    def test_push_record_chunk__fixed_chunk_size(self, mock_request):
+        self.network_connection.chunk_size = 100
+        self.network_connection._push_record_chunk([{"id": i} for i in range(100)])
+        self.assertEqual(self.network_connection.chunk_size, 100)
+
     @mock.patch.object(SyncSession.objects, "create")
     def test_close_sync_session(self, mock_create):
         mock_session = mock.Mock(spec=SyncSession)
@@ -1,6 +1,7 @@
 import mock
 from django.test import TestCase
 
+from morango.sync.utils import ChunkSizeController
 from morango.sync.utils import SyncSignal
 from morango.sync.utils import SyncSignalGroup
 
@@ -76,3 +77,37 @@ class SyncSignalGroupTestCase(TestCase):
             completed_handler.assert_not_called()
 
         completed_handler.assert_called_once_with(this_is_a_default=True, other="A")
+
+
+class ChunkSizeControllerTestCase(TestCase):
+    def setUp(self):
+        self.controller = ChunkSizeController(
+            10, 1000, target_latency=2.0, increase_step=50
+        )
+
+    def test_init__invalid_bounds(self):
+        with self.assertRaises(ValueError):
+            ChunkSizeController(0, 1000)
+        with self.assertRaises(ValueError):
+            ChunkSizeController(100, 10)
+
+    def test_record__increases_within_target(self):
+        self.assertEqual(150, self.controller.record(100, 100, 10000, 0.5))
+
+    def test_record__increase_limited_by_throughput(self):
+        # 100 records in 1.9 seconds would only fit ~105 records within the target latency
+        self.assertEqual(105, self.controller.record(100, 100, 10000, 1.9))
+
+    def test_record__decreases_beyond_target(self):
+        self.assertEqual(50, self.controller.record(100, 100, 10000, 3.0))
+
+    def test_record__no_records(self):
+        self.assertEqual(100, self.controller.record(100, 0, 0, 0.5))
+
+    def test_record__clamped(self):
+        self.assertEqual(1000, self.controller.record(990, 990, 99000, 0.1))
+        self.assertEqual(10, self.controller.record(15, 15, 1500, 3.0))
+
+    def test_failed(self):
+        self.assertEqual(50, self.controller.failed(100))
+        self.assertEqual(10, self.controller.failed(10))
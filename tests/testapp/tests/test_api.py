@@ -2,6 +2,7 @@ import json
 import uuid
 from base64 import encodebytes as b64encode
 
+import pytest
 from django.db import connection
 from django.test.utils import CaptureQueriesContext
 from django.test.utils import override_settings
@@ -18,6 +19,7 @@ from morango.api.serializers import CertificateSerializer
 from morango.api.serializers import InstanceIDSerializer
 from morango.constants import transfer_stages
 from morango.constants import transfer_statuses
+from morango.constants.capabilities import COMPRESSED_BUFFER_PULL
 from morango.models.certificates import Certificate
 from morango.models.certificates import Key
 from morango.models.certificates import Nonce
@@ -30,6 +32,13 @@ from morango.models.core import SyncSession
 from morango.models.core import TransferSession
 from morango.models.fields.crypto import SharedKey
 from morango.registry import syncable_models
+from morango.sync import columnar
+from morango.sync.compression import compress_iter
+from morango.sync.compression import decompress_iter
+from morango.sync.compression import GZIP
+from morango.sync.compression import MEDIA_TYPES
+from morango.sync.compression import ZSTD
+from morango.sync.compression import ZSTD_EXISTS
 from morango.sync.syncsession import compress_string
 from morango.sync.utils import validate_and_create_buffer_data
 
@@ -897,18 +906,31 @@ class BufferEndpointTestCase(CertificateTestCaseMixin, APITestCase):
 
         return buffermodel
 
-    def make_buffer_post_request(self, buffers, expected_status=201, gzip=False):
+    def make_buffer_post_request(
+        self, buffers, expected_status=201, gzip=False, encoding=None, packed=False
+    ):
         serialized_recs = BufferSerializer(buffers, many=True)
 
         # extract that data that is to be posted
         data = serialized_recs.data
         headers = {"format": "json"}
 
-        # gzip the content before sending the request
         if gzip:
+            encoding = GZIP
+
+        # pack the content in the columnar format, compressing it if requested
+        if packed:
+            data = columnar.pack([dict(el) for el in data])
+            if encoding is not None:
+                data = b"".join(compress_iter([data], encoding, 6))
+                headers["HTTP_CONTENT_ENCODING"] = encoding
+            headers["content_type"] = columnar.MEDIA_TYPE
+            headers["format"] = None
+        # compress the content before sending the request
+        elif encoding is not None:
             new_data = json.dumps([dict(el) for el in data])
-            data = compress_string(bytes(new_data.encode("utf-8")))
-            headers["content_type"] = "application/gzip"
+            data = compress_string(bytes(new_data.encode("utf-8")), encoding=encoding)
+            headers["content_type"] = MEDIA_TYPES[encoding]
             headers["format"] = None
 
         # delete the records from the DB so we don't conflict when we POST
@@ -934,6 +956,32 @@ class BufferEndpointTestCase(CertificateTestCaseMixin, APITestCase):
             [rec_1, rec_2, rec_3], expected_status=201, gzip=True
         )
 
+    @pytest.mark.skipif(not ZSTD_EXISTS, reason="zstandard is not installed")
+    def test_push_valid_zstd_buffer_chunk(self):
+        rec_1 = self.build_buffer_item(push=True, filter=self.default_push_filter)
+        rec_2 = self.build_buffer_item(
+            serialized=u"unicode", transfer_session=rec_1.transfer_session
+        )
+        rec_3 = self.build_buffer_item(transfer_session=rec_1.transfer_session)
+        self.make_buffer_post_request(
+            [rec_1, rec_2, rec_3], expected_status=201, encoding=ZSTD
+        )
+
+    @pytest.mark.skipif(not columnar.MSGPACK_EXISTS, reason="msgpack is not installed")
+    def test_push_valid_packed_buffer_chunk(self):
+        rec_1 = self.build_buffer_item(push=True, filter=self.default_push_filter)
+        rec_2 = self.build_buffer_item(
+            serialized=u"unicode", transfer_session=rec_1.transfer_session
+        )
+        rec_3 = self.build_buffer_item(transfer_session=rec_1.transfer_session)
+        self.make_buffer_post_request([rec_1, rec_2, rec_3], packed=True)
+
+    @pytest.mark.skipif(not columnar.MSGPACK_EXISTS, reason="msgpack is not installed")
+    def test_push_valid_packed_gzipped_buffer_chunk(self):
+        rec_1 = self.build_buffer_item(push=True, filter=self.default_push_filter)
+        rec_2 = self.build_buffer_item(transfer_session=rec_1.transfer_session)
+        self.make_buffer_post_request([rec_1, rec_2], packed=True, encoding=GZIP)
+
     def test_push_valid_buffer_chunk(self):
         rec_1 = self.build_buffer_item(push=True, filter=self.default_push_filter)
         rec_2 = self.build_buffer_item(transfer_session=rec_1.transfer_session)
@@ -1152,6 +1200,153 @@ class BufferEndpointTestCase(CertificateTestCaseMixin, APITestCase):
             last_transfer_session_id = self.create_records_for_pulling(count=10)
             offset += 5
 
+    def test_pull_by_page_cursor_works(self):
+
+        transfer_session_id = self.create_records_for_pulling(count=5)
+        pks = list(
+            Buffer.objects.filter(transfer_session_id=transfer_session_id)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+        self.make_buffer_get_request(
+            transfer_session_id=transfer_session_id,
+            limit=3,
+            cursor=pks[2],
+            expected_count=2,
+        )
+
+    def test_pull_by_page__constant_query_count(self):
+        transfer_session_id = self.create_records_for_pulling(count=12)
+        query_counts = []
+
+        for limit in (2, 12):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(
+                    reverse("buffers-list"),
+                    {"transfer_session_id": transfer_session_id, "limit": limit},
+                    format="json",
+                )
+            self.assertEqual(response.status_code, 200)
+            results = json.loads(response.content.decode())["results"]
+            self.assertEqual(len(results), limit)
+            for result in results:
+                self.assertEqual(len(result["rmcb_list"]), 3)
+            query_counts.append(len(ctx.captured_queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_pull_by_page_cursor_with_offset(self):
+
+        transfer_session_id = self.create_records_for_pulling(count=10)
+        pks = list(
+            Buffer.objects.filter(transfer_session_id=transfer_session_id)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+        response = self.client.get(
+            reverse("buffers-list"),
+            dict(
+                transfer_session_id=transfer_session_id,
+                limit=3,
+                cursor=pks[1],
+                offset=3,
+            ),
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode())
+        self.assertEqual(len(data["results"]), 3)
+        self.assertEqual(data["cursor"], pks[7])
+
+    def test_pull_compressed(self):
+        transfer_session_id = self.create_records_for_pulling(count=5)
+
+        response = self.client.get(
+            reverse("buffers-list"),
+            dict(transfer_session_id=transfer_session_id, limit=5),
+            HTTP_ACCEPT_ENCODING="gzip, deflate",
+            HTTP_X_MORANGO_CAPABILITIES=COMPRESSED_BUFFER_PULL,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], GZIP)
+        content = b"".join(
+            decompress_iter(response.streaming_content, response["Content-Encoding"])
+        )
+        data = json.loads(content.decode("utf-8"))
+        self.assertEqual(5, len(data["results"]))
+
+    @pytest.mark.skipif(not columnar.MSGPACK_EXISTS, reason="msgpack is not installed")
+    def test_pull_packed(self):
+        transfer_session_id = self.create_records_for_pulling(count=5)
+
+        response = self.client.get(
+            reverse("buffers-list"),
+            dict(transfer_session_id=transfer_session_id, limit=5),
+            HTTP_ACCEPT=columnar.MEDIA_TYPE,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], columnar.MEDIA_TYPE)
+        data = columnar.unpack(response.content)
+        expected = BufferSerializer(
+            Buffer.objects.filter(transfer_session_id=transfer_session_id).order_by("pk"),
+            many=True,
+        ).data
+        self.assertEqual(5, data["count"])
+        self.assertEqual(json.loads(json.dumps(expected)), data["results"])
+
+    def test_pull_compressed__not_capable(self):
+        transfer_session_id = self.create_records_for_pulling(count=5)
+
+        response = self.client.get(
+            reverse("buffers-list"),
+            dict(transfer_session_id=transfer_session_id, limit=5),
+            HTTP_ACCEPT_ENCODING="gzip, deflate",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_pull_by_page_cursor__returns_next_cursor(self):
+        total = 10
+        transfer_session_id = self.create_records_for_pulling(count=total)
+        expected_uuids = set(
+            Buffer.objects.filter(transfer_session_id=transfer_session_id).values_list(
+                "model_uuid", flat=True
+            )
+        )
+        returned_uuids = set()
+
+        # the first request is paged by offset, as a client would before it has a cursor
+        get_params = dict(transfer_session_id=transfer_session_id, limit=4, offset=0)
+        while True:
+            response = self.client.get(
+                reverse("buffers-list"), get_params, format="json"
+            )
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content.decode())
+            if not data["results"]:
+                break
+            model_uuids = {d["model_uuid"] for d in data["results"]}
+            self.assertFalse(model_uuids & returned_uuids)
+            returned_uuids.update(model_uuids)
+            get_params = dict(
+                transfer_session_id=transfer_session_id, limit=4, cursor=data["cursor"]
+            )
+
+        self.assertEqual(returned_uuids, expected_uuids)
+
+    def test_pull_by_page_cursor__invalid(self):
+
+        transfer_session_id = self.create_records_for_pulling()
+
+        self.make_buffer_get_request(
+            transfer_session_id=transfer_session_id,
+            limit=3,
+            cursor="abc",
+            expected_status=404,
+        )
+
 
 def _lazy_settings():
     return {"this_is_a_test": "lazy"}
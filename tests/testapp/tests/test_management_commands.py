@@ -1,11 +1,26 @@
 import datetime
 import uuid
+from io import StringIO
 
 from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase
 from django.test import TestCase
+from django.test import TransactionTestCase
 from django.utils import timezone
+from facility_profile.management.commands.benchmark_dequeue import DequeueBenchmark
+from facility_profile.management.commands.benchmark_dequeue import ENGINES
+from facility_profile.management.commands.benchmark_fsic_utils import generate_raw_fsic
+from facility_profile.management.commands.benchmark_queue_plan import QueuePlanBenchmark
+from facility_profile.management.commands.benchmark_sync import STAGES
+from facility_profile.management.commands.benchmark_sync import summarize
+from facility_profile.management.commands.benchmark_sync import SyncBenchmark
+from facility_profile.models import Facility
+from facility_profile.models import SummaryLog
 
 from .helpers import create_buffer_and_store_dummy_data
+from morango.models.core import Buffer
+from morango.models.core import Store
 from morango.models.core import SyncSession
 from morango.models.core import TransferSession
 
@@ -175,3 +190,92 @@ class CleanupSyncsTestCase(TestCase):
 
         call_command("cleanupsyncs", expiration=36)
         self.assertSyncSessionIsActive(sync_session)
+
+
+class BenchmarkSyncTestCase(TestCase):
+    def test_run(self):
+        benchmark = SyncBenchmark(
+            records=20, partitions=4, instances=2, depth=2, facilities=3
+        )
+        run = benchmark.run()
+
+        # 6 facilities, 4 users and 20 logs
+        for stage in STAGES:
+            self.assertEqual(30, run[stage][1])
+            self.assertGreater(run[stage][0].query_count, 0)
+        self.assertEqual(2, Facility.objects.filter(parent__isnull=False).count())
+        self.assertEqual(20, SummaryLog.objects.count())
+
+        results = summarize(benchmark, [run])
+        self.assertEqual(benchmark.parameters, results["parameters"])
+        self.assertEqual(30, results["stages"]["dequeue"]["records"])
+        self.assertEqual(
+            run["dequeue"][0].wall_time,
+            results["stages"]["dequeue"]["wall_time"]["median"],
+        )
+
+
+class BenchmarkQueuePlanTestCase(TransactionTestCase):
+    def test_run(self):
+        benchmark = QueuePlanBenchmark(
+            records=500, instances=3, partitions=4, changed=10
+        )
+        benchmark.populate(batch_size=100)
+
+        for indexed in (False, True):
+            benchmark.set_indexed(indexed)
+            stats, queued, plan = benchmark.run()
+            self.assertEqual(10, queued)
+            self.assertGreater(stats.query_count, 0)
+            self.assertTrue(plan)
+            # other databases may still prefer scanning a store this small
+            if connection.vendor == "sqlite":
+                self.assertEqual(
+                    indexed, any("idx_morango_queue_profile" in line for line in plan)
+                )
+
+    def test_run__synced_partitions(self):
+        benchmark = QueuePlanBenchmark(
+            records=500, instances=3, partitions=4, changed=20, synced_partitions=2
+        )
+        benchmark.populate(batch_size=100)
+        stats, queued, plan = benchmark.run()
+        # only the changed records of the synced partitions are queued
+        self.assertEqual(10, queued)
+        self.assertTrue(plan)
+
+
+class BenchmarkDequeueTestCase(TestCase):
+    def test_run(self):
+        benchmark = DequeueBenchmark(records=8, store_records=4)
+        benchmark.populate(batch_size=3)
+        self.assertEqual(8, Buffer.objects.count())
+        self.assertEqual(10, Store.objects.count())
+
+        for engine in ENGINES:
+            stats, written = benchmark.run(engine)
+            # new records, fast-forwards and merge conflicts write to the store
+            self.assertEqual(6, written)
+            self.assertGreater(stats.query_count, 0)
+            # each run is rolled back
+            self.assertEqual(8, Buffer.objects.count())
+            self.assertEqual(10, Store.objects.count())
+
+        stats = benchmark.run_cleanup()
+        self.assertEqual(2, stats.query_count)
+        self.assertEqual(8, Buffer.objects.count())
+
+
+class BenchmarkFSICUtilsTestCase(SimpleTestCase):
+    def test_generate_raw_fsic(self):
+        raw_fsic, sync_filter = generate_raw_fsic(learners=5, instances=2)
+        # one sub-partition per learner, and one for the whole facility
+        self.assertEqual(6, len(raw_fsic["sub"]))
+        self.assertEqual(sync_filter, list(raw_fsic["super"].keys()))
+        for partition in raw_fsic["sub"]:
+            self.assertTrue(partition.startswith(sync_filter[0]))
+
+    def test_command(self):
+        out = StringIO()
+        call_command("benchmark_fsic_utils", learners=[3, 6], repeat=1, stdout=out)
+        self.assertEqual(3, len(out.getvalue().splitlines()))
@@ -0,0 +1,102 @@
+import datetime
+import decimal
+import uuid
+
+import mock
+import pytest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import override_settings
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from morango.serialization import CODECS
+from morango.serialization import encode_serialized_data
+from morango.serialization import get_codec
+from morango.serialization import JSONCodec
+from morango.serialization import ORJSON_EXISTS
+from morango.serialization import ORJSONCodec
+from morango.serialization import UJSON_EXISTS
+
+
+class JSONCodecTestCase(SimpleTestCase):
+    def setUp(self):
+        self.data = {
+            "id": uuid.uuid4().hex,
+            "uuid": uuid.uuid4(),
+            "name": u"ünïcode 😀 </script>",
+            "created": timezone.now(),
+            "naive": datetime.datetime(2020, 1, 1, 1, 2, 3, 456789),
+            "whole_second": datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc),
+            "date": datetime.date(2020, 1, 1),
+            "time": datetime.time(1, 2, 3, 456789),
+            "duration": datetime.timedelta(days=1, seconds=5),
+            "decimal": decimal.Decimal("1.10"),
+            "float": 0.1 + 0.2,
+            "small_float": 1e-7,
+            "big_int": 2 ** 70,
+            "list": [1, None, True],
+            "nested": {"a": {"b": False}},
+        }
+
+    def assertCodec(self, name):
+        codec = get_codec(name)
+        serialized = codec.dumps(self.data)
+        # the output must stay byte-compatible with peers encoding with Django's JSON encoder
+        self.assertEqual(DjangoJSONEncoder().encode(self.data), serialized)
+        self.assertEqual(JSONCodec().loads(serialized), codec.loads(serialized))
+
+    def test_json(self):
+        self.assertCodec("json")
+
+    @pytest.mark.skipif(not ORJSON_EXISTS, reason="orjson is not installed")
+    def test_orjson(self):
+        self.assertCodec("orjson")
+        # falls back on JSON orjson rejects
+        self.assertEqual(
+            {"big": 2 ** 70}, get_codec("orjson").loads('{"big": 1180591620717411303424}')
+        )
+
+    @pytest.mark.skipif(not UJSON_EXISTS, reason="ujson is not installed")
+    def test_ujson(self):
+        self.assertCodec("ujson")
+
+    def test_invalid_json(self):
+        for codec in CODECS:
+            if codec.available:
+                with self.assertRaises(ValueError):
+                    codec.loads('{"a": ')
+
+    def test_get_codec__default(self):
+        codec = get_codec()
+        self.assertTrue(codec.available)
+        self.assertEqual(
+            [c for c in CODECS if c.available][0].name,
+            codec.name,
+        )
+
+    @override_settings(MORANGO_JSON_CODEC="json")
+    def test_get_codec__setting(self):
+        self.assertEqual("json", get_codec().name)
+
+    def test_get_codec__unsupported(self):
+        with self.assertRaises(ValueError):
+            get_codec("yaml")
+
+    def test_get_codec__not_installed(self):
+        with mock.patch.object(ORJSONCodec, "available", False):
+            with self.assertRaises(ValueError):
+                get_codec("orjson")
+            self.assertNotEqual("orjson", get_codec().name)
+
+    def test_encode_serialized_data(self):
+        existing = DjangoJSONEncoder().encode({"name": "old", "extra": 1})
+        encoded = encode_serialized_data(
+            [({"name": "new"}, existing), ({"name": "created"}, None)], "json"
+        )
+        self.assertEqual(
+            [
+                DjangoJSONEncoder().encode({"name": "new", "extra": 1}),
+                DjangoJSONEncoder().encode({"name": "created"}),
+            ],
+            encoded,
+        )
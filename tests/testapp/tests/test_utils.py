@@ -7,6 +7,10 @@ import pytest
 
 from morango.constants.capabilities import ALLOW_CERTIFICATE_PUSHING
 from morango.constants.capabilities import ASYNC_OPERATIONS
+from morango.constants.capabilities import BUFFER_KEYSET_PAGINATION
+from morango.constants.capabilities import BUFFER_PIPELINING
+from morango.constants.capabilities import COLUMNAR_BUFFER_FORMAT
+from morango.constants.capabilities import COMPRESSED_BUFFER_PULL
 from morango.constants.capabilities import FSIC_V2_FORMAT
 from morango.constants import transfer_stages
 from morango.utils import SETTINGS
@@ -68,6 +72,26 @@ class CapabilitiesTestCase(SimpleTestCase):
         with self.settings(MORANGO_DISABLE_FSIC_V2_FORMAT=True):
             self.assertNotIn(FSIC_V2_FORMAT, get_capabilities())
 
+    def test_get_capabilities__buffer_keyset_pagination(self):
+        self.assertIn(BUFFER_KEYSET_PAGINATION, get_capabilities())
+
+    def test_get_capabilities__buffer_pipelining(self):
+        self.assertIn(BUFFER_PIPELINING, get_capabilities())
+
+    def test_get_capabilities__compressed_buffer_pull(self):
+        self.assertIn(COMPRESSED_BUFFER_PULL, get_capabilities())
+
+    def test_get_capabilities__columnar_buffer_format(self):
+        try:
+            import msgpack  # noqa
+        except ImportError:
+            self.assertNotIn(COLUMNAR_BUFFER_FORMAT, get_capabilities())
+        else:
+            self.assertIn(COLUMNAR_BUFFER_FORMAT, get_capabilities())
+
+        with mock.patch.dict("sys.modules", {"msgpack": None}):
+            self.assertNotIn(COLUMNAR_BUFFER_FORMAT, get_capabilities())
+
     @mock.patch("morango.utils.CAPABILITIES", ("TEST", "SERIALIZE"))
     def test_serialize(self):
         req = Request()
@@ -1,7 +1,9 @@
 import hashlib
 import uuid
+from unittest import skipUnless
 
 import mock
+from django.db import connection
 from django.test import TestCase
 from facility_profile.models import Facility
 from facility_profile.models import InteractionLog
@@ -226,6 +228,78 @@ class InstanceIDModelTestCase(TestCase):
             self.assertNotEqual(old_instance.id, uncached_instance.id)
             self.assertEqual(uncached_instance.id, recached_instance.id)
 
+    def test_instance_id_caching__queries(self):
+        InstanceIDModel.get_or_create_current_instance(clear_cache=True)
+        # the cached instance is refreshed, and its counter is incremented, with one query each
+        with self.assertNumQueries(2):
+            InstanceIDModel.get_or_create_current_instance()
+            InstanceIDModel.get_current_instance_and_increment_counter()
+
+    @mock.patch(
+        "ifcfg.interfaces",
+        return_value={"eth0": {"device": "eth0", "ether": "a0:aa:aa:aa:aa"}},
+    )
+    def test_instance_id_caching__system_id_changed(self, *args):
+        with EnvironmentVarGuard() as env:
+            env["MORANGO_SYSTEM_ID"] = "oldmagicsysid"
+            old_instance, _ = InstanceIDModel.get_or_create_current_instance(clear_cache=True)
+
+            # another process notices the new system ID, and replaces the current instance
+            env["MORANGO_SYSTEM_ID"] = "newmagicsysid"
+            InstanceIDModel.objects.filter(id=old_instance.id).update(current=False)
+
+            instance, created = InstanceIDModel.get_or_create_current_instance()
+            self.assertTrue(created)
+            self.assertNotEqual(old_instance.id, instance.id)
+            self.assertEqual(get_0_5_system_id(), instance.system_id)
+
+    def test_increment_counter(self):
+        instance, _ = InstanceIDModel.get_or_create_current_instance(clear_cache=True)
+        counter = instance.counter
+        with self.assertNumQueries(1):
+            incremented = InstanceIDModel.get_current_instance_and_increment_counter()
+        self.assertEqual(counter + 1, incremented.counter)
+        self.assertEqual(counter + 1, InstanceIDModel.objects.get(id=instance.id).counter)
+        # the cached instance is kept up to date
+        self.assertEqual(
+            counter + 1, InstanceIDModel.get_or_create_current_instance()[0].counter
+        )
+
+    @skipUnless(connection.vendor == "sqlite", "Only SQLite lacks RETURNING in older versions")
+    def test_increment_counter__without_returning(self):
+        instance, _ = InstanceIDModel.get_or_create_current_instance(clear_cache=True)
+        counter = instance.counter
+        with mock.patch.object(connection.Database, "sqlite_version_info", (3, 31, 1)):
+            incremented = InstanceIDModel.get_current_instance_and_increment_counter()
+        self.assertEqual(counter + 1, incremented.counter)
+        self.assertEqual(counter + 1, InstanceIDModel.objects.get(id=instance.id).counter)
+
+    def test_increment_counter__cached_instance_deleted(self):
+        instance, _ = InstanceIDModel.get_or_create_current_instance(clear_cache=True)
+        InstanceIDModel.objects.all().delete()
+        incremented = InstanceIDModel.get_current_instance_and_increment_counter()
+        self.assertEqual(instance.id, incremented.id)
+        self.assertEqual(1, incremented.counter)
+        self.assertEqual(1, InstanceIDModel.objects.get(id=instance.id).counter)
+
+    @mock.patch(
+        "ifcfg.interfaces",
+        return_value={"eth0": {"device": "eth0", "ether": "a0:aa:aa:aa:aa"}},
+    )
+    def test_increment_counter__cached_instance_not_current(self, *args):
+        with EnvironmentVarGuard() as env:
+            env["MORANGO_SYSTEM_ID"] = "oldmagicsysid"
+            old_instance, _ = InstanceIDModel.get_or_create_current_instance(clear_cache=True)
+            counter = old_instance.counter
+
+            env["MORANGO_SYSTEM_ID"] = "newmagicsysid"
+            InstanceIDModel.objects.filter(id=old_instance.id).update(current=False)
+
+            incremented = InstanceIDModel.get_current_instance_and_increment_counter()
+        self.assertNotEqual(old_instance.id, incremented.id)
+        self.assertEqual(1, incremented.counter)
+        self.assertEqual(counter, InstanceIDModel.objects.get(id=old_instance.id).counter)
+
 
 class DatabaseIDModelTestCase(TestCase):
     def setUp(self):